@@ -0,0 +1,188 @@
+"""
+Table driven decision making for monsters.
+
+Behaviour is declared as data: Rules checked in order like an if/elif chain, or Utility curves scored against
+each other. Either way it is compiled ahead of time into a flat table over the discretized state of the fight,
+so deciding what to do costs the same few lookups however elaborate the behaviour is.
+
+The state a decision is made on is made up of FEATURES:
+    health          - The monster's own health.
+    stamina         - The monster's own stamina.
+    opponent_health - The health of whoever it's fighting.
+"""
+from collections import namedtuple
+from math import ceil
+
+# Action for taking a rest instead of attacking. Any other action is an attack index, or a tuple of attack
+# indexes to pick one from at random.
+REST = 'rest'
+
+FEATURES = ('health', 'stamina', 'opponent_health')
+
+# A rule matches when every one of its conditions does. Conditions are given as {feature: (above, at_most)},
+# meaning above < value <= at_most, where either bound may be None. Bounds must be whole numbers.
+Rule = namedtuple('Rule', ['conditions', 'action'])
+
+# A utility curve scores an action as curve(state), where state is {feature: value}. The best scoring action
+# wins. Curves are sampled at the middle of each bucket, so they need a resolution to be compiled at.
+Utility = namedtuple('Utility', ['action', 'curve'])
+
+
+class Policy(object):
+    """
+    A compiled decision table.
+    """
+    __slots__ = ('name', 'table', 'health_index', 'stamina_index', 'opponent_index', '_health_top', '_stamina_top',
+                 '_opponent_top')
+
+    def __init__(self, name, indexes, table):
+        """
+        :param str name: Name of the policy, for debugging.
+        :param tuple indexes: Per feature, a tuple mapping the rounded up value to its offset in the table.
+        :param list table: The action for every combination of buckets.
+        """
+        self.name = name
+        self.table = table
+
+        # One lookup per feature, unpacked so deciding doesn't have to loop over them.
+        self.health_index, self.stamina_index, self.opponent_index = [index or (0,) for index in indexes]
+        self._health_top = len(self.health_index) - 1
+        self._stamina_top = len(self.stamina_index) - 1
+        self._opponent_top = len(self.opponent_index) - 1
+
+    def lookup(self, health, stamina, opponent_health):
+        """
+        :param float health: The deciding character's health.
+        :param float stamina: The deciding character's stamina.
+        :param float opponent_health: The opponent's health.
+        :return: The table entry for the state, REST, an attack index or a tuple of attack indexes.
+        """
+        # Rounding up keeps 'value <= threshold' exact for whole number thresholds.
+        health = ceil(health) if health > 0 else 0
+        stamina = ceil(stamina) if stamina > 0 else 0
+        opponent_health = ceil(opponent_health) if opponent_health > 0 else 0
+
+        return self.table[self.health_index[health if health < self._health_top else self._health_top] +
+                          self.stamina_index[stamina if stamina < self._stamina_top else self._stamina_top] +
+                          self.opponent_index[opponent_health if opponent_health < self._opponent_top
+                                              else self._opponent_top]]
+
+    def decide(self, health, stamina, opponent_health, rng):
+        """
+        :param float health: The deciding character's health.
+        :param float stamina: The deciding character's stamina.
+        :param float opponent_health: The opponent's health.
+        :param RandomStream rng: Stream used when the action is a random pick.
+        :return: REST or the index of the attack to perform.
+        """
+        action = self.lookup(health, stamina, opponent_health)
+        if type(action) is tuple:
+            return rng.choice(action)
+        return action
+
+
+def _edges(thresholds, resolution=None, limit=None):
+    # Bucket boundaries: Every threshold, plus a regular grid when sampling utility curves.
+    edges = set(thresholds)
+    if resolution:
+        edges.update(range(0, limit + 1, resolution))
+    return sorted(edges)
+
+
+def _compile(name, evaluate, thresholds, resolution=None, limit=None):
+    """
+    Build the bucket index of each feature and fill the table by evaluating one representative state per cell.
+    """
+    indexes = []
+    representatives = []
+    for feature in FEATURES:
+        edges = _edges(thresholds.get(feature, ()), resolution, limit)
+        if not edges:
+            # The feature never affects the decision.
+            indexes.append(())
+            representatives.append([0])
+            continue
+
+        # Bucket i holds the values in (edges[i - 1], edges[i]], the last one everything above the final edge.
+        index = []
+        for rounded in range(edges[-1] + 2):
+            index.append(sum(1 for edge in edges if rounded > edge))
+        indexes.append(tuple(index))
+
+        bounds = [edges[0] - 1] + edges + [edges[-1] + max(resolution or 1, 1)]
+        representatives.append([(bounds[i] + bounds[i + 1]) / 2 if resolution else bounds[i + 1]
+                                for i in range(len(edges) + 1)])
+
+    # Scale each feature's buckets by its stride through the flat table, so the offsets can simply be summed.
+    stride = 1
+    for position, feature_representatives in enumerate(representatives):
+        indexes[position] = tuple(bucket * stride for bucket in indexes[position])
+        stride *= len(feature_representatives)
+
+    table = [None] * stride
+    for cell in range(stride):
+        state = {}
+        remainder = cell
+        for feature, feature_representatives in zip(FEATURES, representatives):
+            remainder, bucket = divmod(remainder, len(feature_representatives))
+            state[feature] = feature_representatives[bucket]
+        table[cell] = evaluate(state)
+
+    return Policy(name, indexes, table)
+
+
+def _matches(rule, state):
+    for feature, (above, at_most) in rule.conditions.items():
+        value = state[feature]
+        if (above is not None and value <= above) or (at_most is not None and value > at_most):
+            return False
+    return True
+
+
+def compile_rules(name, rules, default):
+    """
+    :param str name: Name of the policy.
+    :param list rules: Rules to check in order, the first one to match decides the action.
+    :param default: The action when no rule matches.
+    :return: The compiled policy.
+    :rtype: Policy
+    """
+    thresholds = {}
+    for rule in rules:
+        for feature, bounds in rule.conditions.items():
+            if feature not in FEATURES:
+                raise ValueError(f'Unknown feature "{feature}", expected one of {FEATURES}')
+            thresholds.setdefault(feature, set()).update(bound for bound in bounds if bound is not None)
+
+    def evaluate(state):
+        for rule in rules:
+            if _matches(rule, state):
+                return rule.action
+        return default
+
+    return _compile(name, evaluate, thresholds)
+
+
+def compile_utilities(name, utilities, resolution=5, limit=300):
+    """
+    :param str name: Name of the policy.
+    :param list utilities: The actions to choose between and how to score them.
+    :param int|optional resolution: Width of each bucket the curves are sampled at.
+    :param int|optional limit: Values above this are treated as this, for every feature.
+    :return: The compiled policy.
+    :rtype: Policy
+    """
+    thresholds = {feature: () for feature in FEATURES}
+
+    def evaluate(state):
+        return max(utilities, key=lambda utility: utility.curve(state)).action
+
+    return _compile(name, evaluate, thresholds, resolution, limit)
+
+
+# The original wolf behaviour: Rest when worn out, hit back hard when hurt, otherwise a light or medium attack.
+WOLF_RULES = [Rule({'stamina': (None, 10)}, REST),
+              Rule({'health': (None, 10)}, REST),
+              Rule({'health': (None, 30)}, 3)]
+
+WOLF_POLICY = compile_rules('wolf', WOLF_RULES, default=(1, 2))
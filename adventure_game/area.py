@@ -0,0 +1,100 @@
+"""
+Area attacks, that hit every target in reach at once: cleave, breath and explosion.
+
+An area attack is an 'attack' catalog entry with 'area' set, and optionally the most 'targets' it can reach. It's
+resolved as a single volley rather than through Character.__deal_damage one target at a time:
+    - Each equipped item draws the damage and critical rolls for every target in one batch from the attacker's
+      stream, with RandomStream.randoms.
+    - The damage of every item is summed per target before any of it is taken off, and the dead are killed in bulk.
+    - One events.Volley sums it all up, narrated as a single line, in place of a Damage and Kill event per hit.
+So clearing out a mob of thousands costs a few list comprehensions, instead of thousands of events and lines of
+narration.
+
+The rolls are the same as a single target attack's, except that on-hit effects are rolled for the survivors once
+every item has hit, rather than after each hit.
+"""
+from collections import namedtuple
+
+import effects as status_effects
+import events
+
+# What a volley did: the targets it hit, the total damage rolled against each, how many hits were critical, the
+# targets it killed and the damage taken off them all.
+Outcome = namedtuple('Outcome', ['targets', 'damage', 'criticals', 'killed', 'dealt'])
+
+
+def reach(attack, candidates):
+    """
+    :param MappingProxyType attack: An area attack definition.
+    :param list candidates: The characters that could be hit, closest first.
+    :return: The living candidates the attack reaches.
+    :rtype: list
+    """
+    targets = [candidate for candidate in candidates if candidate.alive]
+    most = attack.get('targets')
+    return targets[:most] if most else targets
+
+
+def volley(attacker, targets, attack, multiplier=1):
+    """
+    Resolve an area attack against every target at once, after the attacker paid for it.
+
+    :param class attacker: The character performing the attack.
+    :param list targets: The living characters in reach, see reach.
+    :param MappingProxyType attack: The area attack definition.
+    :param float|optional multiplier: The multiplier for the damage, the attack's own after any last stand.
+    :return: What the volley did.
+    :rtype: Outcome
+    """
+    count = len(targets)
+    rng = attacker.rng
+    luck = attacker.luck
+    critical_multiplier = status_effects.CRIT_MULTIPLIER
+
+    totals = [0.0] * count
+    criticals = 0
+    ranges = attacker.inventory.damage_ranges(attacker.strength)
+    for _, lower_damage_limit, upper_damage_limit in ranges:
+        span = upper_damage_limit - lower_damage_limit + 1
+        damage_rolls = rng.randoms(count)
+        critical_rolls = rng.randoms(count)
+
+        # int(a + roll * span) is RandomStream.randint(a, b), a critical roll under the luck is a critical hit.
+        hits = [int(lower_damage_limit + roll * span) * multiplier for roll in damage_rolls]
+        critical_hits = [roll * 100 < luck for roll in critical_rolls]
+        totals = [total + (hit * critical_multiplier if critical else hit)
+                  for total, hit, critical in zip(totals, hits, critical_hits)]
+        criticals += sum(critical_hits)
+
+    engine = attacker.effects
+    guards = engine.damage_multipliers(targets) if engine is not None else None
+    if guards:
+        totals = [total * guard for total, guard in zip(totals, guards)]
+
+    killed = []
+    survivors = []
+    dealt = 0.0
+    for target, damage in zip(targets, totals):
+        if damage >= target.health:
+            dealt += target.health
+            target.health = 0
+            target.alive = False
+            killed.append(target)
+        else:
+            dealt += damage
+            target.health -= damage
+            survivors.append(target)
+
+    if engine is not None and survivors:
+        for item, _, _ in ranges:
+            on_hit = item.get('on_hit')
+            if on_hit:
+                chance = on_hit['chance']
+                for target, roll in zip(survivors, rng.randoms(len(survivors))):
+                    if roll < chance:
+                        engine.apply(target, on_hit['effect'], source=attacker)
+
+    if events.bus.sinks:
+        events.bus.emit(events.Volley, attacker.name, attack['type'], count, count * len(ranges), criticals, dealt,
+                        len(killed))
+    return Outcome(targets, totals, criticals, killed, dealt)
@@ -0,0 +1,361 @@
+"""
+Battles between two sides of any size, from a skirmish up to raids with thousands of units a side.
+
+Nothing in a battle turn looks at every unit:
+    Initiative - A heap of when each unit acts next. The unit at the top takes its turn and goes back in at the
+                 time of its following turn.
+    Side       - Keeps its living units in a heap ordered the way the other side picks targets, lowest health or
+                 highest threat. Entries are never updated in place, a changed unit is pushed again and the
+                 stale entry skipped when it reaches the top.
+Side totals for the HUD (console.draw_battle_hud) are kept up to date as units change, so the cost of a turn grows
+with the logarithm of the battle's size rather than the size itself.
+
+Status effects tick once every ROUND_LENGTH of initiative time, for every unit at once. Only the units an effect
+dealt damage to are updated in their Side.
+
+Like main.combat_steps, battle_steps is a generator that yields a console.Prompt whenever the player's unit has
+to decide what to do, which includes area attacks on the front of the other side. Every other unit is played by its
+monster AI.
+"""
+import heapq
+from itertools import count
+
+import ai
+import console
+import effects
+import main
+import rng as rngs
+
+# How the units of a side pick who to attack.
+LOWEST_HEALTH = 'lowest_health'
+HIGHEST_THREAT = 'highest_threat'
+
+# Time between two turns of a unit with a luck of 1. Luckier units act more often.
+INITIATIVE_DELAY = 100.0
+
+# How often status effects tick, and the HUD is redrawn when there is no player unit to redraw it for, in initiative
+# time.
+ROUND_LENGTH = INITIATIVE_DELAY / 10
+
+
+class Side(object):
+    """
+    One side of a battle, with its living units indexed by how the other side picks targets.
+    """
+
+    def __init__(self, name, units, targeting=LOWEST_HEALTH):
+        """
+        :param str name: Name of the side, shown on the HUD.
+        :param list units: The characters fighting on this side.
+        :param str|optional targeting: LOWEST_HEALTH or HIGHEST_THREAT, how this side's units pick who to attack.
+        """
+        self.name = name
+        self.units = list(units)
+        self.targeting = targeting
+
+        # Damage each unit dealt so far, its threat.
+        self.threat = [0.0] * len(self.units)
+
+        # Totals kept up to date by update, for the HUD.
+        self.alive_count = 0
+        self.total_health = 0.0
+        self.base_health = sum(unit.base_health for unit in self.units)
+
+        # Set by index once the other side's targeting is known.
+        self.ranked_by = None
+        self._health = [0.0] * len(self.units)
+        self._alive = [False] * len(self.units)
+        self._versions = [0] * len(self.units)
+        self._heap = []
+
+    def _key(self, index):
+        if self.ranked_by == HIGHEST_THREAT:
+            return -self.threat[index]
+        return self.units[index].health
+
+    def index(self, ranked_by):
+        """
+        Build the index of living units.
+
+        :param str ranked_by: LOWEST_HEALTH or HIGHEST_THREAT, the targeting of the other side.
+        """
+        self.ranked_by = ranked_by
+        self._alive = [unit.alive for unit in self.units]
+        self._health = [unit.health if unit.alive else 0.0 for unit in self.units]
+        self.alive_count = sum(self._alive)
+        self.total_health = sum(self._health)
+        self._rebuild()
+
+    def _rebuild(self):
+        # Drops every stale entry, done once the heap is mostly stale so it costs O(1) per update on average.
+        self._heap = [(self._key(index), self._versions[index], index)
+                      for index, alive in enumerate(self._alive) if alive]
+        heapq.heapify(self._heap)
+
+    def update(self, index):
+        """
+        Record a change to a unit's health, threat or death. Called after every action involving it.
+
+        :param int index: Position of the unit in units.
+        """
+        unit = self.units[index]
+        health = unit.health if unit.alive else 0.0
+        self.total_health += health - self._health[index]
+        self._health[index] = health
+        self._versions[index] += 1
+
+        if not unit.alive:
+            if self._alive[index]:
+                self._alive[index] = False
+                self.alive_count -= 1
+            return
+
+        heapq.heappush(self._heap, (self._key(index), self._versions[index], index))
+        if len(self._heap) > 2 * self.alive_count + 64:
+            self._rebuild()
+
+    def _valid(self, entry):
+        _, version, index = entry
+        return self._alive[index] and self._versions[index] == version
+
+    def target(self):
+        """
+        :return: Position of the unit the other side should attack next, None if every unit is dead.
+        :rtype: int
+        """
+        heap = self._heap
+        while heap and not self._valid(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def top(self, number):
+        """
+        :param int number: The most units to return.
+        :return: The positions of the first few units in target order, without taking them out of the index.
+        :rtype: list
+        """
+        taken = []
+        heap = self._heap
+        while heap and len(taken) < number:
+            entry = heapq.heappop(heap)
+            if self._valid(entry):
+                taken.append(entry)
+
+        for entry in taken:
+            heapq.heappush(heap, entry)
+        return [index for _, _, index in taken]
+
+
+class Initiative(object):
+    """
+    Turn order, a heap of (time of next turn, tie breaker, side, unit).
+    """
+
+    def __init__(self):
+        self.time = 0.0
+        self._queue = []
+        self._order = count()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, side, index, delay):
+        """
+        Schedule a unit's next turn.
+
+        :param int side: Position of the unit's side in the battle.
+        :param int index: Position of the unit in its side.
+        :param float delay: Time from now until the turn.
+        """
+        heapq.heappush(self._queue, (self.time + delay, next(self._order), side, index))
+
+    def next(self):
+        """
+        Move time on to the next turn.
+
+        :return: (side, index) of the unit whose turn it is.
+        :rtype: tuple
+        """
+        self.time, _, side, index = heapq.heappop(self._queue)
+        return side, index
+
+
+def delay(unit):
+    """
+    :return: The time between two turns of the unit.
+    :rtype: float
+    """
+    return INITIATIVE_DELAY / max(unit.luck, 1)
+
+
+def ai_turn(unit, target):
+    """
+    Play a turn of a unit without a player, using its monster AI or the default one for characters.
+    """
+    if hasattr(unit, 'choose_combat_action'):
+        unit.choose_combat_action(target)
+        return
+
+    action = ai.WOLF_POLICY.decide(unit.health, unit.stamina, target.health, unit.rng)
+    if action == ai.REST:
+        unit.rest()
+    else:
+        unit.perform_attack(target, action)
+
+
+def area_attack_steps(player, enemies):
+    """
+    Ask the player which area attack to perform and perform it, on as many enemies as it reaches in the order their
+    side would be targeted in.
+
+    :return: The positions in enemies of the units in reach and what the attack did, None if the player backed out of
+             the menu.
+    :rtype: tuple
+    """
+    attack_action = yield console.Prompt(header='Choose an Area Attack',
+                                         actions_dict=player.area_actions,
+                                         attack=True,
+                                         back=True)
+    if attack_action == 0:
+        return None
+
+    positions = enemies.top(player.area_actions[attack_action].get('targets') or enemies.alive_count)
+    outcome = player.perform_area_attack([enemies.units[position] for position in positions], attack_action)
+    return positions, outcome
+
+
+def player_turn_steps(player, target, enemies):
+    """
+    Ask the player what to do until they attack, block, rest, use an item or use an area attack.
+
+    :return: What area_attack_steps returned if the player used an area attack, otherwise None.
+    :rtype: tuple
+    """
+    while True:
+        combat_action = yield console.Prompt('Choose an Action', player.battle_actions)
+
+        # ATTACK
+        if combat_action == 1:
+            if (yield from main.combat_attack_steps(player, target)):
+                return
+
+        # BLOCK
+        elif combat_action == 2:
+            player.block()
+            return
+
+        # REST
+        elif combat_action == 3:
+            player.rest()
+            return
+
+        # INVENTORY
+        elif combat_action == 4:
+            if (yield from main.combat_inventory_steps(player)):
+                return
+
+        # AREA ATTACK
+        elif combat_action == 5:
+            area_hit = yield from area_attack_steps(player, enemies)
+            if area_hit:
+                return area_hit
+
+
+def battle_steps(sides, player=None, max_turns=None, hud_rows=3):
+    """
+    Fight until one side is wiped out.
+
+    :param list sides: The two Sides fighting.
+    :param class|optional player: A unit on one of the sides controlled through prompts, every unit is played by
+                                  the AI if not given.
+    :param int|optional max_turns: Stop after this many turns even if both sides still stand.
+    :param int|optional hud_rows: The most units of each side to list on the HUD.
+    :return: The number of turns played.
+    :rtype: int
+    """
+    first, second = sides
+    first.index(second.targeting)
+    second.index(first.targeting)
+
+    initiative = Initiative()
+    order_rng = rngs.spawn()
+    for side_index, side in enumerate(sides):
+        for index, unit in enumerate(side.units):
+            if unit.alive:
+                # Start everyone somewhere in their first turn, so equally quick units don't all go in the same order.
+                # Drawn from a stream of the battle's own, rather than setting up the stream of every unit at once.
+                initiative.add(side_index, index, delay(unit) * order_rng.random())
+
+    # Where each unit is, for updating the sides of the units status effects dealt damage to.
+    positions = {unit: (side_index, index)
+                 for side_index, side in enumerate(sides) for index, unit in enumerate(side.units)}
+    engine = effects.Engine()
+    engine.attach(*positions)
+
+    try:
+        turn = 0
+        next_hud = 0.0
+        while first.alive_count and second.alive_count and (max_turns is None or turn < max_turns):
+            side_index, index = initiative.next()
+            while initiative.time >= (engine.time + 1) * ROUND_LENGTH:
+                for affected in engine.tick():
+                    position = positions.get(affected)
+                    if position:
+                        sides[position[0]].update(position[1])
+            if not (first.alive_count and second.alive_count):
+                break
+
+            side, enemies = sides[side_index], sides[1 - side_index]
+            unit = side.units[index]
+            if not unit.alive:
+                continue
+
+            target_index = enemies.target()
+            target = enemies.units[target_index]
+            health = target.health
+
+            area_hit = None
+            if unit is player:
+                console.draw_battle_hud(sides, hud_rows)
+                area_hit = yield from player_turn_steps(player, target, enemies)
+            else:
+                # Without a player to show it to every turn, the HUD is only redrawn once a round.
+                if not (player and player.alive) and initiative.time >= next_hud:
+                    console.draw_battle_hud(sides, hud_rows)
+                    next_hud = initiative.time + ROUND_LENGTH
+                ai_turn(unit, target)
+
+            if area_hit:
+                hit_positions, outcome = area_hit
+                side.threat[index] += outcome.dealt if outcome else 0.0
+                for position in hit_positions:
+                    enemies.update(position)
+            else:
+                side.threat[index] += health - (target.health if target.alive else 0.0)
+                enemies.update(target_index)
+            side.update(index)
+
+            if unit.alive:
+                initiative.add(side_index, index, delay(unit))
+            turn += 1
+    finally:
+        engine.detach()
+
+    console.draw_battle_hud(sides, hud_rows)
+    console.write('-' * 20)
+    for side in sides:
+        console.write(f'{side.name} : {side.alive_count}/{len(side.units)}')
+    console.flush()
+    return turn
+
+
+def battle(sides, player=None, provider=None, max_turns=None):
+    """
+    :param list sides: The two Sides fighting.
+    :param class|optional player: A unit on one of the sides controlled by the player.
+    :param class|optional provider: Where the player's decisions come from, console.input_provider by default.
+    :param int|optional max_turns: Stop after this many turns even if both sides still stand.
+    :return: The number of turns played.
+    :rtype: int
+    """
+    return main.run(battle_steps(sides, player, max_turns), provider)
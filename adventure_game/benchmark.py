@@ -0,0 +1,1025 @@
+"""
+Benchmarks for the performance sensitive parts of the game.
+
+The suite is made up of cases registered with @case, each doing a fixed amount of work from fixed seeds so every
+run does exactly the same thing. Each case is run a few times to warm up, then timed over several repetitions and
+the median kept. Results can be written out as JSON and compared against a stored baseline, failing the run when a
+case got slower than the threshold allows.
+
+Run with: python benchmark.py [case ...] [--output results.json] [--baseline baseline.json] [--threshold 0.1]
+The side by side reports comparing implementations are run with: python benchmark.py --reports
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+import battle
+import catalog
+import character
+import console
+import effects
+import events
+import inputs
+import main
+import renderer as renderers
+import replay
+import rng as rngs
+import savegame
+import simulation
+import solver
+import tournament
+import world
+
+
+class LegacyCharacter(object):
+    """
+    The original dict based character layout. Kept here only as a point of comparison for
+    the slotted Character class.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.alive = True
+        self.health = 200
+        self.strength = 50.0
+        self.stamina = 100
+        self.luck = 10
+        self.inventory = {'weapons': {0: {'item_name': 'bare_fists',
+                                          'damage_bonus': 10,
+                                          'durability': 0}}
+                          }
+        self.equipped = [self.inventory['weapons'][0]]
+        self.combat_actions = {1: {'type': 'Attack'},
+                               2: {'type': 'Block'},
+                               3: {'type': 'Rest'},
+                               4: {'type': 'Inventory'}}
+        self.attack_actions = {1: {'type': 'light_attack', 'stamina_cost': 10, 'damage_multiplier': 1},
+                               2: {'type': 'medium_attack', 'stamina_cost': 20, 'damage_multiplier': 1.5},
+                               3: {'type': 'heavy_attack', 'stamina_cost': 30, 'damage_multiplier': 2}}
+
+
+class LegacyMonster(LegacyCharacter):
+    def __init__(self, name):
+        super().__init__(name)
+        self.info = 'A hurt Wolf bites back, hard.'
+        self.health = 120.0
+        self.strength = 40.0
+        self.stamina = 30
+        self.luck = 10
+        self.inventory = {'weapons': {0: {'item_name': 'claws',
+                                          'damage_bonus': 20,
+                                          'durability': 0}}
+                          }
+        self.equipped = [self.inventory['weapons'][0]]
+
+
+def measure_memory(cls, count):
+    """
+    :param class cls: The class to construct.
+    :param int count: Number of instances to create.
+    :return: Bytes allocated while keeping every instance alive.
+    :rtype: int
+    """
+    tracemalloc.start()
+    instances = [cls('Wolf') for _ in range(count)]
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del instances
+    return allocated
+
+
+def bench_character_storage(count=100000):
+    """
+    Compare construction time and memory of the current Monster against the original layout.
+
+    :param int|optional count: Number of monsters to create per class.
+    """
+    print(f'Constructing {count:,} monsters')
+    print('\t{:16s} {:>10s} {:>14s}'.format('class', 'ms', 'bytes/entity'))
+
+    for cls in [LegacyMonster, character.Monster]:
+        # Timing is taken without tracemalloc as it slows allocation down considerably.
+        start = time.perf_counter()
+        instances = [cls('Wolf') for _ in range(count)]
+        elapsed = time.perf_counter() - start
+        del instances
+
+        allocated = measure_memory(cls, count)
+        print('\t{:16s} {:10.1f} {:14.0f}'.format(cls.__name__, elapsed * 1000, allocated / count))
+
+
+def bench_catalog(items=10000, used=10):
+    """
+    Time opening a large catalog and looking up a few of its items, against parsing every entry up front.
+
+    :param int|optional items: Number of items in the generated catalog.
+    :param int|optional used: Number of those items looked up.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'catalog.tsv')
+        with open(path, 'w') as data_file:
+            for index in range(items):
+                definition = {'damage_bonus': index % 50, 'durability': 0, 'weight': index % 7,
+                              'description': f'Generated item number {index}'}
+                data_file.write(f'{catalog.ITEM}\titem_{index}\t{json.dumps(definition)}\n')
+
+        start = time.perf_counter()
+        with open(path) as data_file:
+            eager = {line.split('\t', 2)[1]: json.loads(line.split('\t', 2)[2]) for line in data_file}
+        eager_time = time.perf_counter() - start
+        del eager
+
+        start = time.perf_counter()
+        lazy = catalog.Catalog(path)
+        for index in range(0, items, items // used):
+            lazy.get(catalog.ITEM, f'item_{index}')
+        lazy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(100000):
+            lazy.get(catalog.ITEM, 'item_0')
+        cached_time = time.perf_counter() - start
+
+    print(f'Catalog of {items:,} items')
+    print(f'\tparse everything    {eager_time * 1000:10.1f} ms')
+    print(f'\tindex + {lazy.parsed_count:,} lookups {lazy_time * 1000:10.1f} ms')
+    print(f'\tcached lookup       {cached_time / 100000 * 1e9:10.0f} ns')
+
+
+def play_headless(fights, seed=0):
+    """
+    Play fights between characters straight through their methods, the hero attacking at random and resting when
+    exhausted.
+
+    :param int fights: Number of fights to play.
+    :param int|optional seed: Seed the characters are spawned from.
+    """
+    rngs.seed(seed)
+    for _ in range(fights):
+        hero = character.Character('Hero')
+        monster = character.Monster('Wolf')
+        while hero.alive and monster.alive:
+            if hero.stamina > 0:
+                hero.perform_attack(monster, hero.rng.randint(1, 3))
+            else:
+                hero.rest()
+            if monster.alive:
+                monster.choose_combat_action(hero)
+
+
+def bench_events(fights=10000, repeat=5):
+    """
+    Time logging combat events to each sink, against playing the fights that produce them with nothing listening.
+    Each round plays the fights with nothing listening and then with each sink in turn, so every sink is compared
+    against fighting under the same conditions. The median of the rounds is taken.
+
+    :param int|optional fights: Number of fights to play per run.
+    :param int|optional repeat: Number of rounds.
+    """
+    def timed(sink=None):
+        start = time.perf_counter()
+        if sink is None:
+            play_headless(fights)
+        else:
+            with events.subscribed(sink), console.use_renderer(renderers.NullRenderer()):
+                play_headless(fights)
+        return time.perf_counter() - start
+
+    sinks = [('ring buffer', lambda: events.RingBufferSink()),
+             ('binary', lambda: events.BinarySink(io.BytesIO())),
+             ('json lines', lambda: events.JsonLinesSink(io.StringIO())),
+             ('narration', lambda: events.console_sink)]
+
+    events.bus.unsubscribe(events.console_sink)
+    try:
+        counter = events.RingBufferSink(size=None)
+        with events.subscribed(counter):
+            play_headless(fights)
+        count = len(counter.records)
+        del counter
+
+        baselines = []
+        overheads = {name: [] for name, _ in sinks}
+        for _ in range(repeat):
+            baselines.append(timed())
+            for name, make_sink in sinks:
+                overheads[name].append(timed(make_sink()) - baselines[-1])
+    finally:
+        events.bus.subscribe(events.console_sink)
+
+    baseline = statistics.median(baselines)
+    print(f'Logging {count:,} events from {fights:,} fights, per million events')
+    print('\t{:16s} {:>10s} {:>12s}'.format('sink', 'seconds', 'of fighting'))
+    print('\t{:16s} {:10.2f} {:>12s}'.format('none', baseline / count * 1e6, '-'))
+    for name, _ in sinks:
+        overhead = statistics.median(overheads[name])
+        print('\t{:16s} {:10.2f} {:11.0%}'.format(name, overhead / count * 1e6, overhead / baseline))
+
+
+def bench_autosave(fights=2000):
+    """
+    Time playing fights through main.combat with and without autosaving every turn.
+
+    :param int|optional fights: Number of fights to play each way.
+    """
+    def attack(header, actions_dict):
+        return 1
+
+    def play(autosave):
+        rngs.seed(0)
+        turns = written = 0
+        start = time.perf_counter()
+        with console.use_renderer(renderers.NullRenderer()):
+            for _ in range(fights):
+                autosaver = savegame.Autosaver(io.BytesIO()) if autosave else None
+                turns += main.combat(character.Character('Hero'), character.Monster('Wolf'),
+                                     inputs.PolicyInput(attack), autosaver=autosaver)
+                written += autosaver.bytes_written if autosave else 0
+        return time.perf_counter() - start, turns, written
+
+    plain, turns, _ = play(False)
+    saved, _, written = play(True)
+    print(f'Autosaving {fights:,} fights, {turns:,} turns')
+    print(f'\twithout autosave    {plain / turns * 1e6:10.1f} us/turn')
+    print(f'\twith autosave       {saved / turns * 1e6:10.1f} us/turn')
+    print(f'\twritten             {written / turns:10.1f} bytes/turn')
+
+
+def bench_solver(monsters=('Wolf', 'Dire Wolf'), fights=200000, states=20, state_fights=10000, seed=0):
+    """
+    Compare solving a fight against estimating it by sampling, for a few of the tournament's monsters. Sampling plays
+    the solver's own policy, so both estimate the same win probabilities.
+
+    The solver's real error is measured at the starting state against a large sample, and over its table at random
+    states within both sides' starting health and stamina. Sampling is then timed at the table's error, per state,
+    which gives the number of states from which solving is the quicker of the two.
+
+    :param tuple|optional monsters: Names of the tournament monster variants to fight.
+    :param int|optional fights: Number of fights in the reference sample of the starting state.
+    :param int|optional states: Number of states of the table to check.
+    :param int|optional state_fights: Number of fights sampled from each of them.
+    :param int|optional seed: Seed the states are picked and sampled with.
+    """
+    builds = {build.name: build for build in tournament.MONSTER_VARIANTS}
+    print(f'Solving against sampling, {fights:,} fights from the start and {state_fights:,} from {states} other states')
+
+    for name in monsters:
+        hero = character.Character('Sheep')
+        monster = tournament.create(builds[name])
+
+        start = time.perf_counter()
+        fight_solver = solver.Solver(hero, monster)
+        solved = fight_solver.solve().win_probability
+        solve_time = time.perf_counter() - start
+        policy = fight_solver.policy_for_simulation()
+
+        def sample(state, count, sample_seed):
+            # Sample from copies of both sides put in the state.
+            state_hero, state_monster = character.Character('Sheep'), tournament.create(builds[name])
+            state_hero.health, state_hero.stamina, state_monster.health, state_monster.stamina = state
+            started = time.perf_counter()
+            report = simulation.simulate(state_hero, state_monster, fights=count, seed=sample_seed, hero_policy=policy)
+            return report.win_rate(), time.perf_counter() - started
+
+        sampled, _ = sample((hero.health, hero.stamina, monster.health, monster.stamina), fights, seed)
+        start_error = abs(solved - sampled)
+        start_noise = (sampled * (1 - sampled) / fights) ** 0.5
+
+        # Squared errors less the variance of the sample they were measured against, which leaves the solver's.
+        rng = rngs.RandomStream(seed)
+        squared_errors, variances, sample_time = [], [], 0.0
+        for index in range(states):
+            state = (rng.randint(1, hero.health), rng.randint(0, hero.stamina),
+                     rng.randint(1, monster.health), rng.randint(0, monster.stamina))
+            state_sampled, seconds = sample(state, state_fights, seed + 1 + index)
+            variance = state_sampled * (1 - state_sampled)
+            squared_errors.append((fight_solver.solve(*state).win_probability - state_sampled) ** 2 -
+                                  variance / state_fights)
+            variances.append(variance)
+            sample_time += seconds
+
+        # An error inside the samples' noise can only be bounded, and sampling to it takes at least as long.
+        noise = (statistics.mean(variances) / state_fights) ** 0.5
+        error = max(statistics.mean(squared_errors), 0.0) ** 0.5
+        resolved = error >= noise
+        error = max(error, noise, 1e-6)
+        state_time = statistics.mean(variances) / error ** 2 * sample_time / (states * state_fights)
+        at_most, at_least = ('', '') if resolved else ('<', '>')
+
+        print(f'\t{name}')
+        for resolution, ceiling, state_count, win_probability in fight_solver.refinements:
+            print(f'\t\tresolution {resolution:<6g} ceiling {ceiling:<4g} {state_count:>8,d} states '
+                  f'{win_probability:8.4f}')
+        print(f'\t\tsolved              {solved:10.4f}  in {solve_time:.1f} s, '
+              f'{"converged" if fight_solver.converged else "not converged"}')
+        print(f'\t\tsampled             {sampled:10.4f} +- {start_noise:.4f}, off by {start_error:.4f}')
+        print(f'\t\ttable error         {at_most:1s}{error:9.4f}  rms over {states} states')
+        print(f'\t\tsampling per state  {at_least:1s}{state_time:9.2f} s  at the same error')
+        print(f'\t\tsolving wins from   {at_most:1s}{solve_time / state_time:9,.0f} states  '
+              f'the table holds {fight_solver.state_count:,d}')
+
+
+def play_battle(units, turns, seed=0):
+    """
+    :param int units: Number of units on each side, characters against monsters.
+    :param int turns: The most turns to play, 0 to only set the battle up.
+    :param int|optional seed: Seed the units are spawned from.
+    :return: Seconds taken and the number of turns played.
+    :rtype: tuple
+    """
+    rngs.seed(seed)
+    sides = [battle.Side('Heroes', [character.Character(f'Hero {index}') for index in range(units)]),
+             battle.Side('Wolves', [character.Monster(f'Wolf {index}') for index in range(units)],
+                         battle.HIGHEST_THREAT)]
+    with console.use_renderer(renderers.NullRenderer()):
+        start = time.perf_counter()
+        played = battle.battle(sides, max_turns=turns)
+    return time.perf_counter() - start, played
+
+
+def bench_battle_scaling(sizes=(10, 100, 1000, 10000), turns=100000):
+    """
+    Time battle turns as the sides grow, without narration. Setting a battle up is timed on its own and taken off,
+    it touches every unit once.
+
+    :param tuple|optional sizes: Numbers of units on each side to time.
+    :param int|optional turns: The most turns to play at each size.
+    """
+    events.bus.unsubscribe(events.console_sink)
+    try:
+        print(f'Battles of up to {turns:,} turns')
+        print('\t{:>8s} {:>8s} {:>10s} {:>10s}'.format('units', 'turns', 'setup ms', 'us/turn'))
+        for units in sizes:
+            setup, _ = play_battle(units, 0)
+            elapsed, played = play_battle(units, turns)
+            print('\t{:8,d} {:8,d} {:10.1f} {:10.1f}'.format(units, played, setup * 1000,
+                                                             (elapsed - setup) / played * 1e6))
+    finally:
+        events.bus.subscribe(events.console_sink)
+
+
+def tick_effects(targets, turns, applied, seed=0):
+    """
+    Keep effects going on a crowd of characters: Every turn, applied of them get a random effect and every effect
+    due ticks or runs out.
+
+    :return: The engine, with whatever is still active at the end, and the seconds spent ticking.
+    :rtype: tuple
+    """
+    effect_rng = rngs.RandomStream(seed)
+    effect_ids = ('poison', 'bleed', 'rage', 'focus', 'guard')
+    engine = effects.Engine()
+    engine.attach(*targets)
+    ticking = 0.0
+    for _ in range(turns):
+        for _ in range(applied):
+            engine.apply(effect_rng.choice(targets), effect_rng.choice(effect_ids))
+        start = time.perf_counter()
+        engine.tick()
+        ticking += time.perf_counter() - start
+    return engine, ticking
+
+
+def scan_effects(targets, turns, applied, seed=0):
+    """
+    tick_effects done the naive way, looking through the effects of every character every turn to see what's due.
+
+    :return: The seconds spent ticking.
+    :rtype: float
+    """
+    effect_rng = rngs.RandomStream(seed)
+    effect_ids = ('poison', 'bleed', 'rage', 'focus', 'guard')
+
+    # {effect id: [definition, stacks, turns left]} of every character.
+    statuses = {target: {} for target in targets}
+    ticking = 0.0
+    for _ in range(turns):
+        for _ in range(applied):
+            target, effect_id = effect_rng.choice(targets), effect_rng.choice(effect_ids)
+            definition = catalog.effect(effect_id)
+            current = statuses[target].get(effect_id)
+            stacks = min(current[1] + 1, definition.get('stacks', 1)) if current else 1
+            statuses[target][effect_id] = [definition, stacks, definition['duration']]
+
+        start = time.perf_counter()
+        for target, status in statuses.items():
+            for effect_id, current in list(status.items()):
+                definition, stacks, turns_left = current
+                elapsed = definition['duration'] - turns_left
+                if definition['kind'] == effects.DAMAGE and elapsed % definition['period'] == 0:
+                    target.health -= (definition.get('amount') or definition['fraction'] * target.base_health) * stacks
+                current[2] -= 1
+                if not current[2]:
+                    del status[effect_id]
+        ticking += time.perf_counter() - start
+    return ticking
+
+
+def bench_effects(characters=(1000, 10000, 100000), turns=200):
+    """
+    Time ticking status effects on a timing wheel against looking through the effects of every character every turn,
+    as the number of characters grows. A twentieth of the characters are hit with a new effect each turn, applying
+    them isn't timed.
+
+    :param tuple|optional characters: Numbers of characters to spread effects over.
+    :param int|optional turns: Number of turns to tick.
+    """
+    events.bus.unsubscribe(events.console_sink)
+    try:
+        print(f'Ticking status effects for {turns:,} turns')
+        print('\t{:>10s} {:>10s} {:>10s} {:>10s}'.format('characters', 'active', 'wheel us', 'scan us'))
+        for count in characters:
+            targets = [character.Monster('Wolf', rngs.RandomStream(index)) for index in range(count)]
+            for target in targets:
+                target.health = float('inf')
+            applied = max(count // 20, 1)
+
+            engine, wheel = tick_effects(targets, turns, applied)
+            active = sum(len(effect_ids) for effect_ids in engine.active.values())
+            engine.detach()
+
+            scan = scan_effects(targets, turns, applied)
+            print('\t{:10,d} {:10,d} {:10.1f} {:10.1f}'.format(count, active, wheel / turns * 1e6, scan / turns * 1e6))
+    finally:
+        events.bus.subscribe(events.console_sink)
+
+
+def weak_mob(count, health=8):
+    """
+    :return: A mob of monsters that go down to any decent hit.
+    :rtype: list
+    """
+    rng = rngs.default
+    mob = [character.Monster('Wolf', rng.spawn()) for _ in range(count)]
+    for monster in mob:
+        monster.health = health
+    return mob
+
+
+def bench_area(sizes=(100, 1000, 10000)):
+    """
+    Time clearing out a mob with one explosion against attacking its monsters one at a time, both narrated the way a
+    fight is, counting the lines written.
+
+    :param tuple|optional sizes: Numbers of monsters in the mob.
+    """
+    explosion = next(index for index, action in character.Character.area_actions.items()
+                     if action['type'] == 'explosion')
+    print('Clearing a mob of weak monsters')
+    print('\t{:>8s} {:>8s} {:>12s} {:>12s} {:>10s}'.format('monsters', 'killed', 'one by one ms', 'volley ms',
+                                                             'lines'))
+    with console.use_renderer(renderers.RecordingRenderer()) as recording:
+        for size in sizes:
+            rngs.seed(0)
+            hero = character.Character('Hero')
+            mob = weak_mob(size)
+            start = time.perf_counter()
+            for monster in mob:
+                hero.stamina = hero.base_stamina
+                hero.perform_attack(monster, 1)
+            one_by_one = time.perf_counter() - start
+            lines = len(recording.lines)
+
+            rngs.seed(0)
+            hero = character.Character('Hero')
+            mob = weak_mob(size)
+            start = time.perf_counter()
+            outcome = hero.perform_area_attack(mob, explosion)
+            volley = time.perf_counter() - start
+            print('\t{:8,d} {:8,d} {:12.2f} {:12.2f} {:>10s}'.format(
+                size, len(outcome.killed), one_by_one * 1000, volley * 1000,
+                f'{lines:,} / {len(recording.lines) - lines:,}'))
+            recording.lines.clear()
+
+
+def record_long_fight(health=1200, keyframe_interval=replay.KEYFRAME_INTERVAL, seed=0):
+    """
+    Record a drawn out fight headless, both sides given health to last around a hundred turns. The hero attacks
+    while it has the stamina for it and rests when it doesn't.
+
+    :param float|optional health: Health of both the hero and the wolf.
+    :param int|optional keyframe_interval: Turns between the recording's keyframes.
+    :param int|optional seed: Seed the characters are spawned from.
+    :rtype: replay.Recording
+    """
+    rngs.seed(seed)
+    hero = character.Character('Hero')
+    wolf = character.Monster('Wolf')
+    hero.health = wolf.health = health
+
+    def choose(header, actions_dict):
+        return 1 if header != 'Choose an Action' or hero.stamina >= 10 else 3
+
+    events.bus.unsubscribe(events.console_sink)
+    try:
+        with console.use_renderer(renderers.NullRenderer()):
+            return replay.record(hero, wolf, inputs.PolicyInput(choose), keyframe_interval)
+    finally:
+        events.bus.subscribe(events.console_sink)
+
+
+def bench_replay(repeat=20):
+    """
+    Time seeking to turns late in a recorded fight from the last keyframe before them, against playing the recording
+    from its start to get there.
+
+    :param int|optional repeat: The fastest of this many seeks is taken for each turn.
+    """
+    def fastest(function, *args, **kwargs):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function(*args, **kwargs)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    recording = record_long_fight()
+    print(f'Seeking in a recording of {recording.turns:,} turns, {len(recording.keyframes):,} keyframes, '
+          f'{len(recording.dumps()):,} bytes')
+    print('\t{:>8s} {:>14s} {:>14s}'.format('turn', 'from start ms', 'keyframe ms'))
+    for turn in (recording.turns // 4, recording.turns // 2, recording.turns - 1):
+        from_start = fastest(replay.play, recording, recording.keyframes[0], until=turn)
+        from_keyframe = fastest(replay.seek, recording, turn)
+        print('\t{:8,d} {:14.2f} {:14.2f}'.format(turn, from_start * 1000, from_keyframe * 1000))
+
+
+def walk_world(game_world, steps, seed=0):
+    """
+    Take a random walk through a world, checking for an encounter at every step.
+
+    :return: The number of steps that ran into a monster.
+    :rtype: int
+    """
+    walk_rng = rngs.RandomStream(seed)
+    x, y = world.find_start(game_world, game_world.size[0] // 2, game_world.size[1] // 2)
+    moves = list(catalog.actions('movement').values())
+    encounters = 0
+    for _ in range(steps):
+        move = walk_rng.choice(moves)
+        if game_world.walkable(x + move['dx'], y + move['dy']):
+            x, y = x + move['dx'], y + move['dy']
+        if game_world.monsters_near(x, y, world.ENCOUNTER_RADIUS):
+            encounters += 1
+    return encounters
+
+
+def bench_world(sizes=(64, 1024), steps=100000, populations=(1000, 10000, 100000), queries=10000):
+    """
+    Time walking worlds of different sizes, and finding nearby monsters in the spatial index against scanning
+    every monster as populations grow.
+
+    :param tuple|optional sizes: Widths of the worlds to walk, in chunks.
+    :param int|optional steps: Number of steps to walk in each.
+    :param tuple|optional populations: Numbers of monsters to query.
+    :param int|optional queries: Number of queries per population.
+    """
+    print(f'Walking {steps:,} steps')
+    print('\t{:>12s} {:>10s} {:>10s} {:>12s} {:>10s}'.format('world', 'file MB', 'us/step', 'chunks made', 'cached'))
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            with world.World(os.path.join(directory, f'{size}.map'), size, size, cache_size=64) as game_world:
+                start = time.perf_counter()
+                walk_world(game_world, steps)
+                elapsed = time.perf_counter() - start
+                print('\t{:>12s} {:10,.0f} {:10.2f} {:12,d} {:9.1%}'.format(
+                    f'{size}x{size}', os.path.getsize(game_world.path) / 2 ** 20, elapsed / steps * 1e6,
+                    game_world.generated, game_world.hits / (game_world.hits + game_world.misses)))
+
+    print(f'Finding monsters within {world.ENCOUNTER_RADIUS} tiles, {queries:,} queries')
+    print('\t{:>10s} {:>12s} {:>12s}'.format('monsters', 'spatial us', 'scan us'))
+    query_rng = rngs.RandomStream(0)
+    for population in populations:
+        # The density of a fully populated world, spread over as much of it as the population needs.
+        side = int((population / (world.MAX_SPAWNS / 2)) ** 0.5 * world.CHUNK_SIZE)
+        index = world.SpatialHash()
+        for key in range(population):
+            index.insert(key, query_rng.randrange(side), query_rng.randrange(side))
+        points = [(query_rng.randrange(side), query_rng.randrange(side)) for _ in range(queries)]
+        radius = world.ENCOUNTER_RADIUS
+
+        start = time.perf_counter()
+        for x, y in points:
+            index.near(x, y, radius)
+        spatial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for x, y in points[:queries // 100]:
+            [key for key, (key_x, key_y) in index.positions.items()
+             if (key_x - x) ** 2 + (key_y - y) ** 2 <= radius ** 2]
+        scan = (time.perf_counter() - start) * 100
+        print('\t{:10,d} {:12.2f} {:12.2f}'.format(population, spatial / queries * 1e6, scan / queries * 1e6))
+
+
+# A registered benchmark. Timed cases return how many operations they did and are reported per second, the others
+# return their measurement as is.
+Case = namedtuple('Case', ['name', 'function', 'unit', 'higher_is_better', 'timed'])
+
+CASES = {}
+
+
+def case(name, unit='ops/sec', higher_is_better=True, timed=True):
+    """
+    Register a function as a case of the benchmark suite.
+
+    :param str name: Name the case is reported and selected under.
+    :param str|optional unit: Unit of the reported value.
+    :param bool|optional higher_is_better: False for measurements where less is better, eg: memory.
+    :param bool|optional timed: If False the function returns its own measurement rather than an operation count.
+    """
+    def register(function):
+        CASES[name] = Case(name, function, unit, higher_is_better, timed)
+        return function
+    return register
+
+
+@contextmanager
+def seeded(seed):
+    """
+    Seed the root stream and the narrator for the duration of the with block, putting their states back after.
+
+    :param int seed: The seed to use.
+    """
+    streams = [rngs.default, console.narrator.rng]
+    states = [stream.getstate() for stream in streams]
+    for stream in streams:
+        stream.setstate((seed, None, 0, 0, 0))
+    try:
+        yield
+    finally:
+        for stream, state in zip(streams, states):
+            stream.setstate(state)
+
+
+def _random_attack(header, actions_dict):
+    return 1 if len(actions_dict) == 4 else rngs.default.randint(1, len(actions_dict))
+
+
+def _area_attack(header, actions_dict):
+    # Area attacks from the battle menu, resting every so often to get the stamina for them back.
+    if header == 'Choose an Action':
+        return 5 if rngs.default.random() < 0.8 else 3
+    return rngs.default.randint(1, len(actions_dict))
+
+
+@case('fights', unit='fights/sec')
+def case_fights(fights=200):
+    """
+    Whole fights through main.combat, narrated to a NullRenderer, the player always attacking.
+    """
+    provider = inputs.PolicyInput(_random_attack)
+    with console.use_renderer(renderers.NullRenderer()):
+        for _ in range(fights):
+            main.combat(character.Character('Hero'), character.Monster('Wolf'), provider)
+    return fights
+
+
+@case('perform_attack', unit='attacks/sec')
+def case_perform_attack(attacks=20000):
+    """
+    Character.perform_attack, including the narration of every hit.
+    """
+    hero = character.Character('Hero')
+    monster = character.Monster('Wolf')
+    with console.use_renderer(renderers.NullRenderer()):
+        for index in range(attacks):
+            hero.stamina = hero.base_stamina
+            monster.health = monster.base_health
+            hero.perform_attack(monster, index % 3 + 1)
+    return attacks
+
+
+@case('deal_damage', unit='hits/sec')
+def case_deal_damage(hits=20000):
+    """
+    The damage roll of an attack on its own, including the narration of every hit.
+    """
+    hero = character.Character('Hero')
+    monster = character.Monster('Wolf')
+    deal_damage = hero._Character__deal_damage
+    with console.use_renderer(renderers.NullRenderer()):
+        for index in range(hits):
+            monster.health = monster.base_health
+            deal_damage(monster, index % 3 + 1)
+    return hits
+
+
+@case('monster_decisions', unit='decisions/sec')
+def case_monster_decisions(decisions=20000):
+    """
+    Monster.choose_combat_action from random health and stamina, acting on each decision.
+    """
+    hero = character.Character('Hero')
+    monster = character.Monster('Wolf')
+    roll = rngs.default.random
+    with console.use_renderer(renderers.NullRenderer()):
+        for _ in range(decisions):
+            hero.health = hero.base_health
+            monster.health = 1 + roll() * monster.base_health
+            monster.stamina = roll() * monster.base_stamina
+            monster.choose_combat_action(hero)
+    return decisions
+
+
+@case('attack_update', unit='messages/sec')
+def case_attack_update(messages=20000):
+    """
+    console.attack_update, picking and filling in the sentence for a hit.
+    """
+    hero = character.Character('Hero')
+    monster = character.Monster('Wolf')
+    item = hero.equipped[0]
+    with console.use_renderer(renderers.NullRenderer()):
+        for index in range(messages):
+            console.attack_update(hero, monster, item, index % 120, 'Heavy Attack')
+    return messages
+
+
+@case('damage_verb', unit='verbs/sec')
+def case_damage_verb(verbs=50000):
+    """
+    console.get_damage_verb over every damage bracket.
+    """
+    monster = character.Monster('Wolf')
+    for index in range(verbs):
+        console.get_damage_verb(monster, index % 150)
+    return verbs
+
+
+@case('correct_vowels', unit='sentences/sec')
+def case_correct_vowels(sentences=50000):
+    """
+    console.correct_vowels on sentences with and without articles to correct.
+    """
+    samples = ['Hero deals a Annihilating 25 Damage to a Wolf!',
+               'Wolf performs a Light Attack, charging Hero with Claws and deals a Sharp 43 Damage!',
+               'The wise Wolf pauses to rejuvenate 53 health and 36 stamina']
+    for index in range(sentences):
+        console.correct_vowels(samples[index % 3])
+    return sentences
+
+
+@case('hud', unit='frames/sec')
+def case_hud(frames=10000):
+    """
+    console.draw_hud through a BufferedRenderer, with the health of both sides changing every frame.
+    """
+    hero = character.Character('Hero')
+    monster = character.Monster('Wolf')
+    stream = io.StringIO()
+    with console.use_renderer(renderers.BufferedRenderer(stream)):
+        for index in range(frames):
+            hero.health = hero.base_health - index % hero.base_health
+            monster.stamina = index % monster.base_stamina
+            console.draw_hud([hero, monster])
+            console.flush()
+            if index % 1000 == 999:
+                stream.seek(0)
+                stream.truncate()
+    return frames
+
+
+@case('battle', unit='turns/sec')
+def case_battle(units=1000, turns=5000):
+    """
+    Turns of a battle of 1000 characters against 1000 monsters, narrated to a NullRenderer.
+    """
+    rng = rngs.default
+    sides = [battle.Side('Heroes', [character.Character('Hero', rng.spawn()) for _ in range(units)]),
+             battle.Side('Wolves', [character.Monster('Wolf', rng.spawn()) for _ in range(units)],
+                         battle.HIGHEST_THREAT)]
+    with console.use_renderer(renderers.NullRenderer()):
+        return battle.battle(sides, max_turns=turns)
+
+
+@case('battle_area_effects', unit='turns/sec')
+def case_battle_area_effects(units=50, turns=500):
+    """
+    Turns of a battle of a player who can't fall poisoning a pack of 50 monsters with area attacks, narrated to a
+    NullRenderer. The effects ticking between volleys have to find the units they hit on their sides.
+    """
+    rng = rngs.default
+    player = character.Character('Hero', rng.spawn())
+    player.health = 1e9
+    player.equipped = [catalog.item('venom_fangs')]
+    sides = [battle.Side('Heroes', [player]),
+             battle.Side('Wolves', [character.Monster('Wolf', rng.spawn()) for _ in range(units)])]
+    provider = inputs.PolicyInput(_area_attack)
+    with console.use_renderer(renderers.NullRenderer()):
+        return battle.battle(sides, player, provider, max_turns=turns)
+
+
+@case('world_walk', unit='steps/sec')
+def case_world_walk(steps=20000):
+    """
+    A random walk through a fresh world, generating chunks and checking for encounters at every step.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with world.World(os.path.join(directory, 'bench.map'), 256, 256, cache_size=64) as game_world:
+            walk_world(game_world, steps)
+    return steps
+
+
+@case('effects', unit='turns/sec')
+def case_effects(count=2000, turns=500):
+    """
+    Turns of status effects ticking on 2000 characters, a hundred of them hit with a new effect every turn.
+    """
+    targets = [character.Monster('Wolf', rngs.default.spawn()) for _ in range(count)]
+    for target in targets:
+        target.health = float('inf')
+    events.bus.unsubscribe(events.console_sink)
+    try:
+        tick_effects(targets, turns, count // 20)[0].detach()
+    finally:
+        events.bus.subscribe(events.console_sink)
+    return turns
+
+
+@case('area_attack', unit='targets/sec')
+def case_area_attack(count=5000, volleys=20):
+    """
+    Explosions through a mob of 5000 monsters, narrated to a NullRenderer.
+    """
+    explosion = next(index for index, action in character.Character.area_actions.items()
+                     if action['type'] == 'explosion')
+    hero = character.Character('Hero', rngs.default.spawn())
+    mob = weak_mob(count, health=float('inf'))
+    with console.use_renderer(renderers.NullRenderer()):
+        for _ in range(volleys):
+            hero.stamina = hero.base_stamina
+            hero.perform_area_attack(mob, explosion)
+    return count * volleys
+
+
+@case('replay_seek', unit='seeks/sec')
+def case_replay_seek(seeks=50):
+    """
+    Recording a fight of around a hundred turns, then seeking to turns all through it.
+    """
+    recording = record_long_fight()
+    for index in range(seeks):
+        replay.seek(recording, index * recording.turns // seeks)
+    return seeks
+
+
+@case('character_memory', unit='bytes/character', higher_is_better=False, timed=False)
+def case_character_memory(count=10000):
+    """
+    Memory held by each Character, measured with tracemalloc.
+    """
+    return measure_memory(character.Character, count) / count
+
+
+@case('monster_memory', unit='bytes/monster', higher_is_better=False, timed=False)
+def case_monster_memory(count=10000):
+    """
+    Memory held by each Monster, measured with tracemalloc.
+    """
+    return measure_memory(character.Monster, count) / count
+
+
+def run_case(bench_case, seed=0, warmup=1, repetitions=5):
+    """
+    :param Case bench_case: The case to run.
+    :param int|optional seed: Seed every run starts from.
+    :param int|optional warmup: Number of runs to throw away first.
+    :param int|optional repetitions: Number of runs to keep.
+    :return: {'unit', 'higher_is_better', 'value', 'best', 'runs'}, value being the median of the runs.
+    :rtype: dict
+    """
+    runs = []
+    for run in range(warmup + repetitions):
+        gc.collect()
+        with seeded(seed):
+            start = time.perf_counter()
+            result = bench_case.function()
+            elapsed = time.perf_counter() - start
+
+        if run >= warmup:
+            runs.append(result / elapsed if bench_case.timed else result)
+
+    return {'unit': bench_case.unit,
+            'higher_is_better': bench_case.higher_is_better,
+            'value': statistics.median(runs),
+            'best': max(runs) if bench_case.higher_is_better else min(runs),
+            'runs': runs}
+
+
+def run_suite(names=None, seed=0, warmup=1, repetitions=5, log=print):
+    """
+    :param list|optional names: Names of the cases to run, every case if not given.
+    :param int|optional seed: Seed every run starts from.
+    :param int|optional warmup: Number of runs of each case to throw away first.
+    :param int|optional repetitions: Number of runs of each case to keep.
+    :param function|optional log: Called with a line for each case as it finishes, None for silence.
+    :return: The results of the run, as written out to JSON.
+    :rtype: dict
+    """
+    unknown = set(names or ()) - set(CASES)
+    if unknown:
+        raise KeyError(f'Unknown benchmark cases: {", ".join(sorted(unknown))}')
+
+    results = {'python': platform.python_version(),
+               'seed': seed,
+               'warmup': warmup,
+               'repetitions': repetitions,
+               'cases': {}}
+
+    for name in names or CASES:
+        result = results['cases'][name] = run_case(CASES[name], seed, warmup, repetitions)
+        if log:
+            spread = (max(result['runs']) - min(result['runs'])) / result['value'] if result['value'] else 0.0
+            log('{:20s} {:14,.1f} {:18s} +-{:.1%}'.format(name, result['value'], result['unit'], spread / 2))
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compare each case of a run against the same case in a baseline.
+
+    :param dict results: Results of run_suite.
+    :param dict baseline: Results of an earlier run_suite, eg: loaded from a stored JSON file.
+    :param float|optional threshold: How much worse than the baseline a case may get before it counts as a
+                                     regression, 0.1 being 10%.
+    :return: [(name, baseline value, value, change)] for every case in both, change being positive when the
+             case got better, and the names of the cases that regressed.
+    :rtype: tuple
+    """
+    changes = []
+    regressions = []
+    for name, result in results['cases'].items():
+        if name not in baseline['cases']:
+            continue
+
+        before = baseline['cases'][name]['value']
+        change = (result['value'] - before) / before if before else 0.0
+        if not result['higher_is_better']:
+            change = -change
+
+        changes.append((name, before, result['value'], change))
+        if change < -threshold:
+            regressions.append(name)
+
+    return changes, regressions
+
+
+def run_reports():
+    """
+    Print the side by side comparisons of each optimisation against what it replaced.
+    """
+    bench_character_storage()
+    bench_catalog()
+    bench_events()
+    bench_autosave()
+    bench_solver()
+    bench_battle_scaling()
+    bench_world()
+    bench_effects()
+    bench_area()
+    bench_replay()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cases', nargs='*', help=f'Cases to run, any of: {", ".join(CASES)}. All by default.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--warmup', type=int, default=1, help='Runs of each case to throw away first.')
+    parser.add_argument('--repetitions', type=int, default=5, help='Runs of each case to take the median of.')
+    parser.add_argument('--output', help='Write the results to this JSON file, eg: to store as a baseline.')
+    parser.add_argument('--baseline', help='Compare against the results stored in this JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Fail if any case is worse than the baseline by more than this, 0.1 being 10%%.')
+    parser.add_argument('--reports', action='store_true', help='Run the implementation comparisons instead.')
+    arguments = parser.parse_args()
+
+    if arguments.reports:
+        run_reports()
+        sys.exit()
+
+    suite_results = run_suite(arguments.cases, arguments.seed, arguments.warmup, arguments.repetitions)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(suite_results, output_file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            case_changes, regressed = compare(suite_results, json.load(baseline_file), arguments.threshold)
+
+        print(f'\nAgainst {arguments.baseline}, failing below -{arguments.threshold:.0%}')
+        for case_name, baseline_value, value, case_change in case_changes:
+            print('{:20s} {:14,.1f} -> {:14,.1f} {:+8.1%}{}'.format(
+                case_name, baseline_value, value, case_change, '  REGRESSION' if case_name in regressed else ''))
+
+        if regressed:
+            sys.exit(1)
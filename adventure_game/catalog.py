@@ -0,0 +1,145 @@
+"""
+Shared game content: items, attacks, action menus, monsters and status effects.
+
+Definitions live in a data file (catalog.tsv), one per line as: kind <tab> id <tab> definition as JSON.
+Opening a catalog only records where each line starts, the JSON of an entry is parsed the first time it's asked
+for. Every definition is handed out as a single read-only mapping shared by everything that uses it, so a
+thousand wolves all point at the same claws rather than each carrying a copy.
+"""
+import json
+import os
+from types import MappingProxyType
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.tsv')
+
+# Kinds of definition, and the key the id of each is stored under in its definition.
+ITEM = 'item'
+ATTACK = 'attack'
+ACTIONS = 'actions'
+MONSTER = 'monster'
+EFFECT = 'effect'
+
+ID_KEYS = {ITEM: 'item_name', ATTACK: 'type', ACTIONS: 'id', MONSTER: 'id', EFFECT: 'id'}
+
+
+class Catalog(object):
+    """
+    Lazily loaded, read-only view of a catalog data file.
+    """
+
+    def __init__(self, path=DATA_PATH):
+        """
+        :param str|optional path: The data file to read definitions from.
+        """
+        self.path = path
+        self._offsets = None
+        self._definitions = {}
+
+    def _build_index(self):
+        # Only the kind and id at the start of each line are looked at, the JSON is left for later.
+        offsets = {}
+        offset = 0
+        with open(self.path, 'rb') as data_file:
+            for line in data_file:
+                if line.strip() and not line.startswith(b'#'):
+                    kind, entry_id, _ = line.split(b'\t', 2)
+                    offsets[(kind.decode('utf-8'), entry_id.decode('utf-8'))] = offset
+                offset += len(line)
+        self._offsets = offsets
+
+    def _parse(self, kind, entry_id):
+        if self._offsets is None:
+            self._build_index()
+
+        try:
+            offset = self._offsets[(kind, entry_id)]
+        except KeyError:
+            raise KeyError(f'No {kind} "{entry_id}" in {self.path}') from None
+
+        with open(self.path, 'rb') as data_file:
+            data_file.seek(offset)
+            definition = json.loads(data_file.readline().split(b'\t', 2)[2])
+
+        if kind == ACTIONS:
+            # Menus are keyed by the number the player types, attacks in them are given by id.
+            definition = {int(index): self.get(ATTACK, action) if isinstance(action, str) else MappingProxyType(action)
+                          for index, action in definition.items()}
+        else:
+            definition = {ID_KEYS[kind]: entry_id, **definition}
+
+        return MappingProxyType(definition)
+
+    def get(self, kind, entry_id):
+        """
+        :param str kind: ITEM, ATTACK, ACTIONS, MONSTER or EFFECT.
+        :param str entry_id: Id of the definition.
+        :return: The shared definition, parsed on first use.
+        :rtype: MappingProxyType
+        """
+        key = (kind, entry_id)
+        definition = self._definitions.get(key)
+        if definition is None:
+            definition = self._definitions[key] = self._parse(kind, entry_id)
+        return definition
+
+    def ids(self, kind):
+        """
+        :param str kind: ITEM, ATTACK, ACTIONS, MONSTER or EFFECT.
+        :return: The id of every definition of that kind, without parsing any of them.
+        :rtype: list
+        """
+        if self._offsets is None:
+            self._build_index()
+        return [entry_id for entry_kind, entry_id in self._offsets if entry_kind == kind]
+
+    @property
+    def parsed_count(self):
+        """
+        :return: The number of definitions parsed so far.
+        :rtype: int
+        """
+        return len(self._definitions)
+
+
+# The catalog the game's own content is looked up in.
+default = Catalog()
+
+
+def item(item_id):
+    """
+    :return: The item definition from the default catalog, eg: item('claws')['damage_bonus']
+    :rtype: MappingProxyType
+    """
+    return default.get(ITEM, item_id)
+
+
+def attack(attack_id):
+    """
+    :return: The attack definition from the default catalog.
+    :rtype: MappingProxyType
+    """
+    return default.get(ATTACK, attack_id)
+
+
+def actions(actions_id):
+    """
+    :return: {index: action definition} for an action menu in the default catalog.
+    :rtype: MappingProxyType
+    """
+    return default.get(ACTIONS, actions_id)
+
+
+def monster(monster_id):
+    """
+    :return: The monster definition from the default catalog.
+    :rtype: MappingProxyType
+    """
+    return default.get(MONSTER, monster_id)
+
+
+def effect(effect_id):
+    """
+    :return: The status effect definition from the default catalog.
+    :rtype: MappingProxyType
+    """
+    return default.get(EFFECT, effect_id)
@@ -1,57 +1,85 @@
 """
 All character classes defined here
 """
-import random
-import console
+import ai
+import area
+import catalog
+import effects as status_effects
+import events
+import inventory as inventories
+import rng as rngs
 
 
 class Character(object):
     """
     Base Class for all characters to inherit from
-    TODO:
-        self.luck - Chance for a critical hit
     """
 
-    def __init__(self, name):
+    # Instances only carry their own state, everything shared lives on the class.
+    __slots__ = ('name', 'alive', 'health', 'strength', 'stamina', 'luck', 'inventory', 'rng', 'effects')
+
+    # Starting attributes, subclasses override these instead of reassigning them in __init__.
+    base_health = 200
+    base_strength = 50.0
+    base_stamina = 100
+    base_luck = 10
+
+    # Catalog id of the weapon every new character of this class starts with equipped.
+    default_weapon = 'bare_fists'
+
+    # (catalog id, count) of the other items every new character of this class starts with.
+    starting_items = (('health_potion', 2),)
+
+    # Basic combat actions, shared read-only definitions from the catalog.
+    combat_actions = catalog.actions('combat')
+
+    # Basic attack actions that are picked up and used by the console and actions methods.
+    attack_actions = catalog.actions('basic_attacks')
+
+    # Attacks that hit every target in reach at once, see perform_area_attack.
+    area_actions = catalog.actions('area_attacks')
+
+    # The combat actions in a battle, which adds area attacks to the basic ones.
+    battle_actions = catalog.actions('battle')
+
+    def __init__(self, name, rng=None):
+        """
+        :param str name: Name of the character.
+        :param RandomStream|optional rng: The stream this character rolls with, spawned from rng.default if not given.
+        """
         self.name = name
+        self.rng = rng or rngs.spawn()
 
         # basic attributes
         self.alive = True
-        self.health = 200
-        self.strength = 50.0
-        self.stamina = 100
-        self.luck = 10
-
-        # Inventory and equipped items.
-        self.inventory = {'weapons': {0: {'item_name': 'bare_fists',
-                                          'damage_bonus': 10,
-                                          'durability': 0}}
-                          }
-
-        self.equipped = [self.inventory['weapons'][0]]
-
-        # Basic combat actions
-        self.combat_actions = {1: {'type': 'Attack'},
-                               2: {'type': 'Block'},
-                               3: {'type': 'Rest'},
-                               4: {'type': 'Inventory'}}
-
-        # Basic attack actions that are picked up and used by the console and actions methods.
-        self.attack_actions = {1: {'type': 'light_attack',
-                                   'stamina_cost': 10,
-                                   'damage_multiplier': 1
-                                   },
-                               2: {'type': 'medium_attack',
-                                   'stamina_cost': 20,
-                                   'damage_multiplier': 1.5
-                                   },
-                               3: {'type': 'heavy_attack',
-                                   'stamina_cost': 30,
-                                   'damage_multiplier': 2
-                                   }}
-
-    @staticmethod
-    def random_value(min_value=0, max_value=1, multiplier=1):
+        self.health = self.base_health
+        self.strength = self.base_strength
+        self.stamina = self.base_stamina
+        self.luck = self.base_luck
+
+        # The effects.Engine of the fight the character is in, None outside of one.
+        self.effects = None
+
+        # Items are the catalog's shared definitions, the default weapon goes in the first slot and is equipped.
+        self.inventory = inventories.Inventory()
+        self.inventory.add(catalog.item(self.default_weapon))
+        self.inventory.equip(0)
+        for item_id, count in self.starting_items:
+            self.inventory.add(catalog.item(item_id), count)
+
+    @property
+    def equipped(self):
+        """
+        :return: The definitions of the items the character has equipped.
+        :rtype: list
+        """
+        return self.inventory.equipped
+
+    @equipped.setter
+    def equipped(self, items):
+        self.inventory.set_equipped(items)
+
+    def random_value(self, min_value=0, max_value=1, multiplier=1):
         """
         :param int|optional min_value: Minimum value to generate.
         :param int|optional max_value: Maximum value to generate.
@@ -59,13 +87,14 @@ class Character(object):
         :return: Calculate a random value given the start and end points with a multiplier applied.
         :rtype: float
         """
-        return random.randint(min_value, max_value) * multiplier
+        return self.rng.randint(min_value, max_value) * multiplier
 
     def __deal_damage(self, target_character, attack_index, multiplier=1):
         """
         Primary method for attacking and dealing damage. An attack will be performed for each item currently
         equipped in the player's inventory. The damage is calculated by using the character's strength + the
-        weapon damage bonus to form the upper limit of damage possible.
+        weapon damage bonus to form the upper limit of damage possible. Every hit has a luck in 100 chance of being
+        critical, and is lessened by any guard the target has up.
 
         :param class target_character: The character to attack.
         :param int attack_index: Index number of the attack from self.attack_actions
@@ -74,23 +103,53 @@ class Character(object):
         # Get the attack type so that it can be used later.
         attack_type = self.attack_actions[attack_index]['type']
 
-        # Perform an attack for each item that is currently equipped.
-        for item in self.equipped:
+        # Perform an attack for each item that is currently equipped. The damage range of each is worked out by the
+        # inventory whenever the equipment or strength changes, rather than on every attack.
+        for item, lower_damage_limit, upper_damage_limit in self.inventory.damage_ranges(self.strength):
             # Calculate the damage + apply it.
-            upper_damage_limit = item['damage_bonus'] + self.strength
-            lower_damage_limit = self.strength * 0.1
-
             damage = self.random_value(lower_damage_limit, upper_damage_limit, multiplier)
+            critical = self.rng.random() * 100 < self.luck
+            if critical:
+                damage *= status_effects.CRIT_MULTIPLIER
+            if target_character.effects is not None:
+                damage = target_character.effects.damage_taken(target_character, damage)
 
             if target_character.health > 0:
-                # Update the user on what happened + remove the health
-                console.attack_update(self, target_character, item, damage, attack_type)
+                if critical and events.bus.sinks:
+                    events.bus.emit(events.Critical, self.name, target_character.name, item['item_name'], damage)
+
+                # Let anyone listening know what happened + remove the health
+                if events.bus.sinks:
+                    events.bus.emit(events.Damage, self.name, target_character.name, item['item_name'], attack_type,
+                                    damage, target_character.health,
+                                    max(target_character.health - damage, 0))
 
                 # If health drops below 0, the character will die.
                 if damage >= target_character.health:
                     target_character.kill(killer=self)
                 else:
                     target_character.health -= damage
+                    if self.effects is not None:
+                        self.effects.on_hit(self, target_character, item)
+
+    def __attack_cost(self, attack):
+        """
+        :param MappingProxyType attack: The attack about to be performed.
+        :return: The damage multiplier the character can manage and the stamina it will have left after.
+        :rtype: tuple
+        """
+        stamina_cost = attack['stamina_cost']
+        damage_multiplier = attack['damage_multiplier']
+
+        if self.stamina >= stamina_cost:
+            return damage_multiplier, self.stamina - stamina_cost
+
+        # Last stand, will zero stamina and be less effective.
+        elif stamina_cost > self.stamina > 0:
+            return damage_multiplier / 2, 0
+
+        # Not enough stamina to attack at all.
+        return 0, self.stamina
 
     def perform_attack(self, target_character, attack_index):
         """
@@ -103,36 +162,60 @@ class Character(object):
         :param int attack_index: Index number of the attack from self.attack_actions
         """
         stamina_cost = self.attack_actions[attack_index]['stamina_cost']
-        damage_multiplier = self.attack_actions[attack_index]['damage_multiplier']
+        multiplier, stamina = self.__attack_cost(self.attack_actions[attack_index])
 
-        if self.stamina >= stamina_cost:
-            self.__deal_damage(target_character,
-                               attack_index=attack_index,
-                               multiplier=damage_multiplier)
-            self.stamina -= stamina_cost
+        if events.bus.sinks:
+            events.bus.emit(events.Attack, self.name, target_character.name,
+                            self.attack_actions[attack_index]['type'], multiplier, stamina_cost, stamina)
 
-        # Last stand, will zero stamina and be less effective.
-        elif stamina_cost > self.stamina > 0:
+        if multiplier:
             self.__deal_damage(target_character,
                                attack_index=attack_index,
-                               multiplier=damage_multiplier / 2)
-            self.stamina = 0
-        else:
-            print(f'{self.name} does not have enough stamina to attack!')
+                               multiplier=multiplier)
+            self.stamina = stamina
+
+    def perform_area_attack(self, targets, attack_index):
+        """
+        Attack every target in reach at once, paying stamina the same way perform_attack does. See area.py.
+
+        :param list targets: The characters that could be hit, closest first.
+        :param int attack_index: Index number of the attack from self.area_actions
+        :return: What the volley did, None if the character was too exhausted to attack.
+        :rtype: area.Outcome
+        """
+        attack = self.area_actions[attack_index]
+        multiplier, stamina = self.__attack_cost(attack)
+
+        if events.bus.sinks:
+            events.bus.emit(events.Attack, self.name, None, attack['type'], multiplier, attack['stamina_cost'], stamina)
+
+        if multiplier:
+            outcome = area.volley(self, area.reach(attack, targets), attack, multiplier)
+            self.stamina = stamina
+            return outcome
 
     def regenerate(self, amount, attribute, target_character=None, multiplier=1):
         """
-        Primary method for healing. By default, healing will be applied to self.
+        Primary method for healing. By default, healing will be applied to self. Health regenerated during a fight
+        is scaled by the character's effects, eg: halved while poisoned.
 
         :param float amount: The amount to regenerate by.
         :param str attribute: The attribute to regenerate, eg: health
         :param class|optional target_character: The character to regenerate the attribute on, default is self.
         :param multiplier: The multiplier for the final result for regeneration. 1 by Default.
+        :return: The amount the attribute was regenerated by.
+        :rtype: float
         """
         target_character = self if not target_character else target_character
+        if attribute == 'health' and target_character.effects is not None:
+            amount = target_character.effects.healing(target_character, amount)
         new_value = getattr(target_character, attribute) + amount * multiplier
         setattr(target_character, attribute, new_value)
 
+        if events.bus.sinks:
+            events.bus.emit(events.Regenerate, target_character.name, attribute, amount * multiplier, new_value)
+        return amount * multiplier
+
     def rest(self):
         """
         Take a knee and rest during a fight to regain some health and stamina.
@@ -146,65 +229,98 @@ class Character(object):
             # Chance to regenerate 10 - 25 % of the attribute by default.
             upper_limit = round((getattr(self, attribute) * 0.10) + self.strength)
 
-            amount = random.randint(10, upper_limit)
-            rest_results[attribute] = amount
-
-            self.regenerate(amount=amount,
-                            attribute=attribute,
-                            target_character=self,
-                            multiplier=1)
+            amount = self.rng.randint(10, upper_limit)
+            rest_results[attribute] = self.regenerate(amount=amount,
+                                                      attribute=attribute,
+                                                      target_character=self,
+                                                      multiplier=1)
 
         # Updating the player on what happened.
-        console.rest_message(self, rest_results)
+        if events.bus.sinks:
+            events.bus.emit(events.Rest, self.name, rest_results['health'], rest_results['stamina'], self.health,
+                            self.stamina)
+
+    def block(self):
+        """
+        Raise a guard against the attacks coming before the character's next turn. Only works during a fight.
+        """
+        if self.effects is not None:
+            self.effects.apply(self, 'guard', source=self)
+
+    def use_item(self, slot):
+        """
+        Use the item in an inventory slot: Equip a weapon, or drink a consumable for what it restores and the
+        effect it applies.
+
+        :param int slot: The inventory slot of the item.
+        :return: False if there was nothing to do, eg: the weapon was already equipped.
+        :rtype: bool
+        """
+        item = self.inventory.slots[slot].item
+        kind = item.get('kind', inventories.WEAPON)
+
+        if kind == inventories.WEAPON:
+            if slot in self.inventory.equipped_slots:
+                return False
+            self.inventory.equip(slot)
+        else:
+            self.inventory.consume(slot)
+
+        if events.bus.sinks:
+            events.bus.emit(events.UseItem, self.name, item['item_name'], kind)
+
+        for attribute, amount in item.get('restores', {}).items():
+            self.regenerate(amount=amount, attribute=attribute)
+        if 'applies' in item and self.effects is not None:
+            self.effects.apply(self, item['applies'], source=self)
+        return True
 
     def kill(self, killer=None):
         """
-        Kill the current entity and pass the events to the console to inform the player.
+        Kill the current entity and emit the event, which the console uses to inform the player.
 
         :param class|optional killer: If a killer is specified it will appear in the death message.
         """
         self.health = 0
         self.alive = False
-        console.death_message(self, killer)
+        if events.bus.sinks:
+            events.bus.emit(events.Kill, self.name, killer.name if killer else None)
 
 
 class Monster(Character):
-    def __init__(self, name):
-        # TODO: Combat subroutines for AI to decide what to do.
-        super().__init__(name)
-        self.info = 'A hurt Wolf bites back, hard.'
+    __slots__ = ('info',)
 
-        # basic attributes
-        self.health = 120.0
-        self.strength = 40.0
-        self.stamina = 30
-        self.luck = 10
+    # Compiled decision table used by choose_combat_action, see ai.py for declaring new behaviour.
+    policy = ai.WOLF_POLICY
+
+    # The catalog entry the monster's basic attributes and weapon come from.
+    definition = catalog.monster('wolf')
 
-        # Inventory and equipped items.
-        self.inventory = {'weapons': {0: {'item_name': 'claws',
-                                          'damage_bonus': 20,
-                                          'durability': 0}}
-                          }
+    base_health = definition['health']
+    base_strength = definition['strength']
+    base_stamina = definition['stamina']
+    base_luck = definition['luck']
 
-        self.equipped = [self.inventory['weapons'][0]]
+    default_weapon = definition['weapon']
+    starting_items = ()
+
+    def __init__(self, name, rng=None):
+        super().__init__(name, rng)
+        self.info = self.definition['info']
 
     def choose_combat_action(self, player):
         """
-        Choose an action to perform given the circumstances. This is the base decision-making AI for
-        basic monsters.
+        Choose an action to perform given the circumstances, by looking it up in the monster's policy.
+        The default policy is the base decision-making AI for basic monsters.
 
         :param class player: The player class, this is what will be attacked.
         """
 
-        if self.stamina <= 10 or self.health <= 10:
-            # If health or stamina are low, take a rest.
-            self.rest()
+        action = self.policy.decide(self.health, self.stamina, player.health, self.rng)
 
-        elif self.health <= 30:
-            # If health is low, Hit back hard.
-            self.perform_attack(player, 3)
+        if action == ai.REST:
+            # Take a rest.
+            self.rest()
 
         else:
-            # Attack the player with a random attack, excluding heavy.
-            attack_index = random.randint(1, len(self.attack_actions) - 1)
-            self.perform_attack(player, attack_index)
+            self.perform_attack(player, action)
@@ -1,30 +1,109 @@
 """
 Methods for writing out to the console or getting user input.
 """
-import re
-import random
+from collections import namedtuple
+from contextlib import contextmanager
+
+import inputs
+import narration
+import renderer as renderers
+
+# Where all output is sent. Swap it out with set_renderer, eg: for a NullRenderer when running headless.
+renderer = renderers.BufferedRenderer()
+
+# Where the player's decisions come from when choose_action isn't given a provider.
+input_provider = inputs.StdinInput()
+
+# Turns game events into sentences, or structured tokens when narration.Narrator(structured=True) is used.
+narrator = narration.Narrator()
+
+# The arguments for a choose_action call, yielded by the combat loops in main when they need a decision.
+Prompt = namedtuple('Prompt', ['header', 'actions_dict', 'attack', 'back'], defaults=(False, False))
+
+
+def set_renderer(new_renderer):
+    """
+    :param class new_renderer: The renderer all console output should go to from now on.
+    :return: The renderer that was previously in use.
+    """
+    global renderer
+    previous, renderer = renderer, new_renderer
+    return previous
+
+
+@contextmanager
+def use_renderer(new_renderer):
+    """
+    Send all console output to the given renderer for the duration of the with block, eg: while one of many
+    sessions takes its turn.
+
+    :param class new_renderer: The renderer to use inside the with block.
+    """
+    previous = set_renderer(new_renderer)
+    try:
+        yield new_renderer
+    finally:
+        set_renderer(previous)
+
+
+def write(text):
+    """
+    :param str text: Line of text to show the player.
+    """
+    renderer.write(text)
+
+
+def flush():
+    """
+    Send everything written so far to the player.
+    """
+    renderer.flush()
 
 
 def draw_hud(characters):
     """
-    Helper function to print out the HUD during fights. This should display the two
+    Helper function to draw the HUD during fights. This should display the two
     characters involved in the fight and all relevant attributes.
 
     :param list characters: List of character objects to display. Must only be 2 in length.
     """
-    # Start
-    print(f'# {"-" * 50} #')
-
-    # Name
-    print('\t{:29s} {}'.format(*[char.name for char in characters]))
+    border = [f'# {"-" * 50} #']
+    rows = [border, [char.name for char in characters]]
 
-    # Iterating over all the float attributes and printing them out.
+    # Iterating over all the float attributes with a bar relative to the character's starting value.
     for attribute in ['health', 'stamina']:
-        attribute_strings = ['{} : {:5.2f}'.format(attribute.upper(), getattr(char, attribute)) for char in characters]
-        print('\t{:28s}  {}'.format(*attribute_strings))
+        rows.append(['{:7s} {:6.2f} {}'.format(attribute.upper(),
+                                               getattr(char, attribute),
+                                               renderers.bar(getattr(char, attribute),
+                                                             getattr(char, f'base_{attribute}')))
+                     for char in characters])
+
+    rows.append(border)
+    renderer.draw_hud(rows)
+
+
+def draw_battle_hud(sides, rows=3):
+    """
+    Draw the HUD of a battle, with each side as a column. Sides are summarised as their living units, total health
+    and the first few units in the order the other side targets them, however many units they have.
 
-    # End
-    print(f'# {"-" * 50} #')
+    :param list sides: The battle.Side objects to display.
+    :param int|optional rows: The most units of each side to list.
+    """
+    columns = []
+    for side in sides:
+        column = [f'{side.name} {side.alive_count}/{len(side.units)}',
+                  '{:7s} {:6.0f} {}'.format('HEALTH', side.total_health,
+                                           renderers.bar(side.total_health, side.base_health))]
+        for index in side.top(rows):
+            unit = side.units[index]
+            column.append('{:7s} {:6.2f} {}'.format(unit.name[:7], unit.health,
+                                                    renderers.bar(unit.health, unit.base_health)))
+        column.extend([''] * (rows + 2 - len(column)))
+        columns.append(column)
+
+    border = [f'# {"-" * 50} #']
+    renderer.draw_hud([border] + [list(row) for row in zip(*columns)] + [border])
 
 
 def format_attack_actions(index, attack_type, stamina_cost):
@@ -38,19 +117,14 @@ def format_attack_actions(index, attack_type, stamina_cost):
     return '{}. {:30s} [{}]\n'.format(index, attack_type, stamina_cost)
 
 
-def choose_action(header, actions_dict, attack=False, back=False):
+def present_actions(header, actions_dict, attack=False, back=False):
     """
-    Format the options for a player's input, present them to the player and return the result of the decision.
+    Format the options for a player's input and present them to the player.
 
     :param str header: Header for the action to take.
-    :param dict actions_dict: dictionary of actions to perform. Given as such:
-                              > {1: {'type': 'light_attack', 'stamina': 10, 'damage_multiplier': 1 }}
-                              NOTE: Index should begin at 1. If a value of 0 is returned the player has not been
-                              able to make a choice.
+    :param dict actions_dict: dictionary of actions to perform.
     :param bool attack: If True format this action as an attack.
     :param bool back: If True will add an extra item to the end for going back in the menus.
-    :return: The resulting decision index from the actions_dict.
-    :rtype: int
     """
     options_string = f'> {header}:\n'
 
@@ -67,25 +141,87 @@ def choose_action(header, actions_dict, attack=False, back=False):
         options_string += f'{len(actions_dict.items())+1}. Back\n'
 
     # Present the player with the options, excluding the last new line.
-    print(options_string[:-1])
+    renderer.write(options_string[:-1])
+
+
+def parse_choice(result, actions_dict, back=False):
+    """
+    :param str|int result: The raw answer given by the player.
+    :param dict actions_dict: dictionary of actions that could be chosen.
+    :param bool back: If True the option after the last action means going back in the menus.
+    :return: The index from the actions_dict, 0 for back or None if the answer isn't valid.
+    :rtype: int
+    """
+    if isinstance(result, str):
+        if not result.isdigit():
+            return None
+        result = int(result)
+
+    if result in actions_dict:
+        return result
+
+    elif back and result == len(actions_dict) + 1:
+        return 0
 
-    # Obtain the answer from the player
-    num_actions = len(actions_dict.keys()) if not back else len(actions_dict.keys()) + 1
+
+def invalid_choice(provider, result, actions_dict, back):
+    """
+    Tell a player their answer was wrong. Providers that aren't a person can't correct themselves, so for
+    those this raises instead.
+    """
+    num_actions = len(actions_dict) if not back else len(actions_dict) + 1
+    if not getattr(provider, 'echo', True):
+        raise ValueError(f'{result!r} is not a choice between 1 and {num_actions}')
+    renderer.write(f'Please choose a number between 1 and {num_actions}')
+
+
+def choose_action(header, actions_dict, attack=False, back=False, provider=None):
+    """
+    Present the options for a player's input and return the result of the decision.
+
+    :param str header: Header for the action to take.
+    :param dict actions_dict: dictionary of actions to perform. Given as such:
+                              > {1: {'type': 'light_attack', 'stamina': 10, 'damage_multiplier': 1 }}
+                              NOTE: Index should begin at 1. If a value of 0 is returned the player has not been
+                              able to make a choice.
+    :param bool attack: If True format this action as an attack.
+    :param bool back: If True will add an extra item to the end for going back in the menus.
+    :param class|optional provider: Where the answer comes from, console.input_provider by default.
+    :return: The resulting decision index from the actions_dict.
+    :rtype: int
+    """
+    provider = provider or input_provider
+    if getattr(provider, 'echo', True):
+        present_actions(header, actions_dict, attack, back)
 
     while True:
-        result = input()
+        renderer.flush()
+        result = provider.read(header, actions_dict)
 
-        if result.isdigit() and int(result) in actions_dict.keys():
-            # If the result is a digit and in the actions' dict.
-            return int(result)
+        choice = parse_choice(result, actions_dict, back)
+        if choice is not None:
+            return choice
 
-        elif back and result.isdigit() and result == str(num_actions):
-            # If the result is the back option
-            return 0
+        invalid_choice(provider, result, actions_dict, back)
 
-        else:
-            # The user has input the wrong answer.
-            print(f'Please choose a number between 1 and {num_actions}')
+
+async def choose_action_async(header, actions_dict, attack=False, back=False, provider=None):
+    """
+    Same as choose_action, but waits for the answer without blocking, for providers such as inputs.AsyncInput.
+    """
+    provider = provider or input_provider
+    if getattr(provider, 'echo', True):
+        present_actions(header, actions_dict, attack, back)
+
+    while True:
+        renderer.flush()
+        result = await provider.read_async(header, actions_dict)
+
+        choice = parse_choice(result, actions_dict, back)
+        if choice is not None:
+            return choice
+
+        invalid_choice(provider, result, actions_dict, back)
 
 
 def format_name(name):
@@ -96,7 +232,7 @@ def format_name(name):
     :return: Capitalised and separated name.
     :rtype: str
     """
-    return ' '.join([x.capitalize() for x in name.split('_')])
+    return narration.format_name(name)
 
 
 def correct_vowels(sentence):
@@ -108,8 +244,7 @@ def correct_vowels(sentence):
     :returns: The grammatically correct sentence:
     :rtype: str
     """
-    regular_expression = r'( [aA] )([aAeEiIoOuU])'
-    return re.sub(regular_expression, r' an \2', sentence)
+    return narration.correct_vowels(sentence)
 
 
 def get_random_index(iterable):
@@ -117,7 +252,7 @@ def get_random_index(iterable):
     :return: From all available indexes in iterable, choose one at random and return it.
     :rtype: int
     """
-    return random.randint(0, len(iterable) - 1)
+    return narrator.rng.randrange(len(iterable))
 
 
 def get_damage_verb(victim, damage):
@@ -128,28 +263,7 @@ def get_damage_verb(victim, damage):
     :param class victim: The class that received the attack.
     :param float damage: The amount of damage dealt.
     """
-    # Verbs to be used to describe damage amounts in order of severity.
-    damage_verbs_dict = {0: ['measly', 'frail', 'feeble', 'weakly', 'shaky', 'decrepit', 'faint', 'poor'],
-                         1: ['brawny', 'sturdy', 'hefty', 'sharp', 'strong'],
-                         2: ['mighty', 'tremendous', 'heavy', 'enormous', 'hefty', 'powerful'],
-                         3: ['crippling', 'crushing', 'mammoth', 'massive'],
-                         4: ['bone crushing', 'obliterating', 'annihilating', 'blackout', 'ravaging', 'paralyzing']}
-
-    # Calculate the damage % from current health and damage dealt
-    damage_percent = round((damage / victim.health * 100))
-
-    # for each index of the damage dict, multiply it by 20
-    damage_index = [x * 20 for x in damage_verbs_dict.keys()]
-
-    # Using the indexes find the closest one to the damage percent
-    closest_index = min(damage_index, key=lambda x: abs(x - damage_percent))
-
-    # Using the best damage percent index get the damage verb list.
-    damage_verbs_list = damage_verbs_dict[damage_index.index(closest_index)]
-
-    # Grab a random verb from the list.
-    random_damage_verb = (damage_verbs_list[random.randint(0, len(damage_verbs_list) - 1)])
-    return random_damage_verb.capitalize()
+    return narrator.damage_verb(victim.health, damage)
 
 
 def attack_update(attacker, victim, item, damage, attack_type):
@@ -163,25 +277,7 @@ def attack_update(attacker, victim, item, damage, attack_type):
     :param float damage: The amount of damage dealt.
     :param str attack_type: The type of attack used.
     """
-
-    verb = get_damage_verb(victim, damage)
-    item_name = format_name(item["item_name"])
-    attack = format_name(attack_type)
-
-    # Some more random sentence structures to add further spice.
-    sentence_dict = {0: f'{attacker.name} performs a {attack}, charging {victim.name} with '
-                        f'{item_name} and deals a {verb} {damage} Damage!',
-                     1: f'{attacker.name} {attack}\'s {victim.name} using {item_name}, for a {verb} {damage} Damage!',
-                     2: f'{attacker.name} {attack}\'s {victim.name} with {item_name}, '
-                        f'inflicting a {verb} {damage} Damage!',
-                     3: f'{attacker.name} assaults {victim.name} with their {attack} wielding {item_name}, '
-                        f'administering a {verb} {damage} Damage in the process!',
-                     4: f'{victim.name} receives a {verb} {damage} Damage from {attacker.name}\'s {attack}'
-                        f'wielding their {item_name}, lowering {victim.name}\'s health to {victim.health-damage}!'}
-
-    # Updating the player on what happened.
-    random_index = random.randint(0, len(sentence_dict) - 1)
-    print(correct_vowels(sentence_dict[random_index]))
+    renderer.write(narrator.attack(attacker.name, victim.name, victim.health, item['item_name'], damage, attack_type))
 
 
 def death_message(deceased_character, killer=None):
@@ -191,21 +287,7 @@ def death_message(deceased_character, killer=None):
     :param class deceased_character: Class of the deceased_character
     :param class|optional killer: If there was a killer.
     """
-    deceased_name = deceased_character.name
-    killer_name = killer.name if killer else ''
-
-    # 0 - No killer, 1 - NPC killer, 2 - NonNPC killer
-    death_msg_dict = {0: [f'{deceased_name} has died'],
-                      1: [f'{deceased_name} has been slain by {killer_name}',
-                          f'{deceased_name} has fallen in battle to {killer_name}',
-                          f'Bloodied and broken, {deceased_name} falls to the ground at the hands of {killer_name}',
-                          f'{deceased_name} draws their last breath as {killer_name} emerges victorious.',
-                          f'{killer_name} has bested {deceased_name} in battle.'],
-                      2: []}
-
-    index = 1 if killer else 0
-    random_index = random.randint(0, len(death_msg_dict[index]) - 1)
-    print(death_msg_dict[index][random_index])
+    renderer.write(narrator.death(deceased_character.name, killer.name if killer else None))
 
 
 def rest_message(character, info):
@@ -217,28 +299,4 @@ def rest_message(character, info):
                     {'attribute name': amount regenerated}
 
     """
-    rest_msg_list = [f'{character.name} takes a knee to regenerate',
-                     f'{character.name} steps back from battle for a moment to regenerate',
-                     f'Knowing that time is precious, {character.name} takes a moment to rest, replenishing',
-                     f'The wise {character.name} pauses to rejuvenating',
-                     f'Short of breath, {character.name} pulls back to refresh',
-                     f'Noticing that they have only {character.stamina} Stamina and {character.health} Health, '
-                     f'{character.name} steps back momentarily restoring']
-
-    # Choosing a random base sentence
-    message = rest_msg_list[random.randint(0, len(rest_msg_list) - 1)]
-
-    # Adding the updates to it.
-    for i, (attribute, value) in enumerate(info.items()):
-
-        # Deciding how to join the sentence together.
-        if i == 0:
-            joiner = ''
-        elif i == len(info) - 1:
-            joiner = ' and'
-        else:
-            joiner = ','
-
-        message += f'{joiner} {value} {attribute}'
-
-    print(message)
+    renderer.write(narrator.rest(character.name, character.health, character.stamina, info))
@@ -0,0 +1,368 @@
+"""
+Status effects: damage over time, guarding and stat buffs, plus critical hits.
+
+Effects are declared in the catalog as 'effect' entries, with a 'kind' of:
+    damage  - Deals 'amount', or 'fraction' of the target's base health, every 'period' turns. Poison, bleed.
+    guard   - Scales the damage the target takes by 'damage_taken'. What blocking does.
+    stat    - Adds 'amount' to the target's 'stat' while it lasts, eg: strength.
+Every effect lasts 'duration' turns. An effect that's applied again while still active is refreshed, and gains
+a stack if it has a 'stacks' limit, damage being dealt per stack. 'healing' scales the health the target
+regenerates while it's active, eg: 0.5 for poison.
+
+Each fight has its own Engine, attached to every character in it. Everything an effect will do is put on a
+TimingWheel for the turn it's due, so a turn only touches the effects that tick or expire in it, however many
+are active. An effect refreshed or removed early leaves its old entries on the wheel, they are recognised as
+stale by their token when they come up and skipped.
+
+Critical hits need no engine: every hit has a luck in 100 chance of dealing CRIT_MULTIPLIER times the damage.
+"""
+from collections import namedtuple
+from operator import itemgetter
+
+import catalog
+import events
+
+CRIT_MULTIPLIER = 1.5
+
+# Kinds of effect.
+DAMAGE = 'damage'
+GUARD = 'guard'
+STAT = 'stat'
+
+# What a wheel entry does when it comes up.
+TICK = 0
+EXPIRE = 1
+
+WHEEL_SIZE = 64
+
+
+def critical_chance(luck):
+    """
+    :param float luck: The attacker's luck.
+    :return: The chance of any one hit being critical, 0 - 1.
+    :rtype: float
+    """
+    return min(max(luck / 100, 0.0), 1.0)
+
+
+class TimingWheel(object):
+    """
+    A ring of buckets, one per turn, holding what's due in that turn. Entries further ahead than the size of the
+    wheel wait in their bucket until the wheel has come round enough times.
+    """
+    __slots__ = ('buckets', 'time')
+
+    def __init__(self, size=WHEEL_SIZE):
+        """
+        :param int|optional size: Number of buckets, longer than most effects last works best.
+        """
+        self.buckets = [[] for _ in range(size)]
+        self.time = 0
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def schedule(self, delay, entry):
+        """
+        :param int delay: Turns from now the entry is due, at least 1.
+        :param entry: Anything, handed back by advance when it's due.
+        """
+        due = self.time + max(int(delay), 1)
+        self.buckets[due % len(self.buckets)].append((due, entry))
+
+    def advance(self):
+        """
+        Move on to the next turn.
+
+        :return: The entries due in it, in the order they were scheduled.
+        :rtype: list
+        """
+        self.time += 1
+        bucket = self.buckets[self.time % len(self.buckets)]
+        if not bucket:
+            return []
+
+        time = self.time
+        due = [entry for when, entry in bucket if when == time]
+        if len(due) == len(bucket):
+            bucket.clear()
+        else:
+            bucket[:] = [(when, entry) for when, entry in bucket if when != time]
+        return due
+
+
+def _has_multipliers(definition):
+    return 'damage_taken' in definition or 'healing' in definition
+
+
+# An effect on a character: its catalog definition, stacks, the turn it runs out, whoever applied it and the token
+# its wheel entries carry.
+Active = namedtuple('Active', ['definition', 'stacks', 'expires', 'source', 'token'])
+
+
+class Engine(object):
+    """
+    The status effects of one fight.
+    """
+
+    def __init__(self, wheel_size=WHEEL_SIZE):
+        """
+        :param int|optional wheel_size: Number of turns the timing wheel holds.
+        """
+        self.wheel = TimingWheel(wheel_size)
+
+        # {character: {effect id: Active}}
+        self.active = {}
+
+        # Combined multipliers of the characters that have any, looked up on every hit and heal.
+        self._damage_taken = {}
+        self._healing = {}
+
+        self._tokens = 0
+        self.characters = []
+
+    @property
+    def time(self):
+        return self.wheel.time
+
+    def attach(self, *characters):
+        """
+        Make characters part of this fight, so effects can be applied to them.
+        """
+        for game_character in characters:
+            game_character.effects = self
+            self.characters.append(game_character)
+
+    def detach(self):
+        """
+        End the fight: Remove every effect, putting buffed stats back, and detach every character.
+        """
+        for game_character in list(self.active):
+            self.clear(game_character)
+        for game_character in self.characters:
+            if game_character.effects is self:
+                game_character.effects = None
+        self.characters = []
+
+    # Applying and removing
+
+    def apply(self, target, effect_id, source=None):
+        """
+        Apply an effect, or refresh it if the target already has it.
+
+        :param class target: The character to apply the effect to.
+        :param str effect_id: Catalog id of the effect, eg: 'poison'.
+        :param class|optional source: The character responsible, credited with kills.
+        """
+        if not target.alive:
+            return
+
+        definition = catalog.effect(effect_id)
+        effects = self.active.setdefault(target, {})
+        current = effects.get(effect_id)
+
+        self._tokens += 1
+        token = self._tokens
+        expires = self.wheel.time + definition['duration']
+        stacks = min(current.stacks + 1, definition.get('stacks', 1)) if current else 1
+        effects[effect_id] = Active(definition, stacks, expires, source, token)
+
+        if definition['kind'] == STAT and not current:
+            setattr(target, definition['stat'], getattr(target, definition['stat']) + definition['amount'])
+
+        self.wheel.schedule(definition['duration'], (EXPIRE, target, effect_id, token))
+        if definition['kind'] == DAMAGE:
+            self.wheel.schedule(definition.get('period', 1), (TICK, target, effect_id, token))
+        if not current and _has_multipliers(definition):
+            self._update_multipliers(target)
+
+        if events.bus.sinks:
+            events.bus.emit(events.EffectApplied, target.name, effect_id, source.name if source else None, stacks,
+                            definition['duration'])
+
+    def remove(self, target, effect_id, expired=False):
+        """
+        :param class target: A character with the effect.
+        :param str effect_id: Catalog id of the effect.
+        :param bool|optional expired: True if it ran out, rather than being removed early. Only an effect that ran out
+                                      is announced, not one cleared from a dead character or at the end of a fight.
+        """
+        effects = self.active.get(target, {})
+        current = effects.pop(effect_id, None)
+        if current is None:
+            return
+        if not effects:
+            del self.active[target]
+
+        definition = current.definition
+        if definition['kind'] == STAT:
+            setattr(target, definition['stat'], getattr(target, definition['stat']) - definition['amount'])
+        if _has_multipliers(definition):
+            self._update_multipliers(target)
+
+        if expired and events.bus.sinks and target.alive:
+            events.bus.emit(events.EffectExpired, target.name, effect_id)
+
+    def clear(self, target):
+        """
+        Remove every effect from a character, eg: once it's dead.
+        """
+        for effect_id in list(self.active.get(target, ())):
+            self.remove(target, effect_id)
+
+    def _update_multipliers(self, target):
+        damage_taken = healing = 1
+        for active in self.active.get(target, {}).values():
+            damage_taken *= active.definition.get('damage_taken', 1)
+            healing *= active.definition.get('healing', 1)
+
+        for multipliers, value in ((self._damage_taken, damage_taken), (self._healing, healing)):
+            if value == 1:
+                multipliers.pop(target, None)
+            else:
+                multipliers[target] = value
+
+    # Queries
+
+    def has(self, target, effect_id):
+        """
+        :return: True if the character is under the effect.
+        :rtype: bool
+        """
+        return effect_id in self.active.get(target, ())
+
+    def damage_taken(self, target, damage):
+        """
+        :return: The damage after the target's guard, if any.
+        :rtype: float
+        """
+        multiplier = self._damage_taken.get(target)
+        return damage if multiplier is None else damage * multiplier
+
+    def damage_multipliers(self, targets):
+        """
+        :param list targets: Characters about to be hit at once, eg: by an area attack.
+        :return: The multiplier of each target's guard, 1 for those without one. None if none of them have one.
+        :rtype: list
+        """
+        multipliers = self._damage_taken
+        if not multipliers:
+            return None
+        return [multipliers.get(target, 1) for target in targets]
+
+    def healing(self, target, amount):
+        """
+        :return: The health regenerated after any effect on the target's healing.
+        :rtype: float
+        """
+        multiplier = self._healing.get(target)
+        return amount if multiplier is None else amount * multiplier
+
+    def on_hit(self, attacker, target, item):
+        """
+        Roll for the effect the attacker's item applies on a hit, if it has one.
+
+        :param class attacker: The character that landed the hit.
+        :param class target: The character that was hit.
+        :param MappingProxyType item: The item the hit was landed with.
+        """
+        on_hit = item.get('on_hit')
+        if on_hit and target.alive and attacker.rng.random() < on_hit['chance']:
+            self.apply(target, on_hit['effect'], source=attacker)
+
+    # Saving
+
+    def state(self, characters):
+        """
+        :param list characters: Every character in the fight, in a fixed order.
+        :return: Everything needed to carry on the fight's effects later, with characters referred to by their
+                 position in characters: (time, active effects as (target, effect id, stacks, expires, source or
+                 None), what's due on the wheel as (due, TICK or EXPIRE, target, effect id) in the order it's due).
+        :rtype: tuple
+        """
+        positions = {game_character: index for index, game_character in enumerate(characters)}
+        active = tuple((positions[target], effect_id, current.stacks, current.expires, positions.get(current.source))
+                       for target, target_effects in self.active.items()
+                       for effect_id, current in target_effects.items())
+
+        # Stale entries are left out. Entries keep the order they were scheduled in, it's the order they're done in.
+        due = []
+        for bucket in self.wheel.buckets:
+            for when, (action, target, effect_id, token) in bucket:
+                current = self.active.get(target, {}).get(effect_id)
+                if current is not None and current.token == token:
+                    due.append((when, action, positions[target], effect_id))
+        due.sort(key=itemgetter(0))
+        return self.wheel.time, active, tuple(due)
+
+    def restore(self, state, characters):
+        """
+        Replace the engine's effects with ones from state. The characters' stats are left as they are, they already
+        include any buffs in the state.
+
+        :param tuple state: A state previously returned by state.
+        :param list characters: The characters the state refers to, in the same order.
+        """
+        time, active, due = state
+        self.wheel = TimingWheel(len(self.wheel.buckets))
+        self.wheel.time = time
+        self.active = {}
+        self._damage_taken = {}
+        self._healing = {}
+
+        tokens = {}
+        for target, effect_id, stacks, expires, source in active:
+            self._tokens += 1
+            tokens[(target, effect_id)] = self._tokens
+            self.active.setdefault(characters[target], {})[effect_id] = Active(
+                catalog.effect(effect_id), stacks, expires, characters[source] if source is not None else None,
+                self._tokens)
+        for target in {characters[target] for target, _, _, _, _ in active}:
+            self._update_multipliers(target)
+
+        for when, action, target, effect_id in due:
+            self.wheel.schedule(when - time, (action, characters[target], effect_id, tokens[(target, effect_id)]))
+
+    # Turns
+
+    def tick(self):
+        """
+        Move on a turn: Deal the damage of every effect due to tick and remove the ones that ran out.
+
+        :return: The characters that took damage.
+        :rtype: list
+        """
+        damaged = []
+        active = self.active
+
+        # Ticks due in the same turn an effect runs out still happen.
+        for action, target, effect_id, token in sorted(self.wheel.advance(), key=itemgetter(0)):
+            effects = active.get(target)
+            current = effects.get(effect_id) if effects else None
+            if current is None or current.token != token:
+                continue
+
+            if action == EXPIRE:
+                self.remove(target, effect_id, expired=True)
+            elif target.alive:
+                self._deal(target, effect_id, current)
+                damaged.append(target)
+                period = current.definition.get('period', 1)
+                if current.expires >= self.wheel.time + period:
+                    self.wheel.schedule(period, (TICK, target, effect_id, token))
+        return damaged
+
+    def _deal(self, target, effect_id, current):
+        definition = current.definition
+        damage = definition.get('amount') or definition.get('fraction', 0) * target.base_health
+        damage *= current.stacks
+
+        health = max(target.health - damage, 0)
+        if events.bus.sinks:
+            events.bus.emit(events.EffectTick, target.name, effect_id, damage, health)
+
+        if damage >= target.health:
+            target.kill(killer=current.source)
+            self.clear(target)
+        else:
+            target.health -= damage
@@ -0,0 +1,407 @@
+"""
+Structured combat events.
+
+Characters emit a typed event for everything that happens to them in a fight onto an EventBus, which hands it
+to each of its sinks in turn. Events refer to characters, items and attacks by name so they can be logged as is.
+
+An event is emitted as its type and fields, eg: bus.emit(Kill, 'Wolf', 'Player'), and sinks are handed the two as
+they are. Building the namedtuple costs more than most sinks spend on an event, so only the ones that need it do.
+
+Sinks:
+    ConsoleSink    - Narrates events to the player through the console, subscribed to the default bus.
+    JsonLinesSink  - One JSON object per event, formatted and written out in batches.
+    BinarySink     - Fixed size struct records packed a batch at a time, names written once and referred to by
+                     number after that.
+    RingBufferSink - Keeps the most recent events in memory.
+
+Even gathering the fields costs something, so characters only emit when the bus has at least one sink.
+"""
+import json
+import struct
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from itertools import chain
+from operator import itemgetter
+
+import console
+
+# A hit landed by one of the attacker's equipped items. Health is the target's before and after the damage.
+Damage = namedtuple('Damage', ['attacker', 'target', 'item', 'attack_type', 'damage', 'previous_health', 'health'])
+
+# A character attacked, paying the stamina cost and leaving it with stamina. A multiplier of 0 means it was too
+# exhausted to attack at all, 0.5 of the attack's own multiplier that it made a last stand.
+Attack = namedtuple('Attack', ['attacker', 'target', 'attack_type', 'multiplier', 'stamina_cost', 'stamina'])
+
+# One of a character's attributes was regenerated by amount, leaving it at value.
+Regenerate = namedtuple('Regenerate', ['target', 'attribute', 'amount', 'value'])
+
+# A character rested, regaining health_gain and stamina_gain.
+Rest = namedtuple('Rest', ['character', 'health_gain', 'stamina_gain', 'health', 'stamina'])
+
+# A character died, killer is None if nobody killed it.
+Kill = namedtuple('Kill', ['target', 'killer'])
+
+# A character used an item from their inventory, equipping it if kind is a weapon or using it up if not.
+UseItem = namedtuple('UseItem', ['character', 'item', 'kind'])
+
+# A hit that was critical, dealing effects.CRIT_MULTIPLIER times the damage. Emitted just before its Damage.
+Critical = namedtuple('Critical', ['attacker', 'target', 'item', 'damage'])
+
+# A status effect was applied to a character, or refreshed, by source if anybody. It now has stacks of the effect,
+# lasting another duration turns.
+EffectApplied = namedtuple('EffectApplied', ['target', 'effect', 'source', 'stacks', 'duration'])
+
+# A status effect dealt damage to a character, leaving it with health.
+EffectTick = namedtuple('EffectTick', ['target', 'effect', 'damage', 'health'])
+
+# A status effect wore off a character.
+EffectExpired = namedtuple('EffectExpired', ['target', 'effect'])
+
+# An area attack hit targets characters with hits hits in all, criticals of them critical, dealing damage and
+# killing kills of them. Stands in for the Damage and Kill events of every hit.
+Volley = namedtuple('Volley', ['attacker', 'attack_type', 'targets', 'hits', 'criticals', 'damage', 'kills'])
+
+EVENT_TYPES = (Damage, Attack, Regenerate, Rest, Kill, UseItem, Critical, EffectApplied, EffectTick, EffectExpired,
+               Volley)
+
+
+class EventBus(object):
+    """
+    Hands every emitted event to each subscribed sink, in the order they subscribed. Sinks should be subscribed
+    and unsubscribed through the bus rather than by changing sinks, so it knows when there's only one.
+    """
+
+    def __init__(self, sinks=()):
+        """
+        :param list|optional sinks: The sinks to start with.
+        """
+        # Checked by emitters before they gather an event's fields, empty when nothing is listening.
+        self.sinks = list(sinks)
+        self.route()
+
+    def route(self):
+        """
+        Work out where emitted events go. Done on every subscribe and unsubscribe, and needed again if a sink's
+        handle method is replaced, eg: by profiling.
+        """
+        # Nearly always there's a single sink, which is then handed events directly: the instance's emit is its
+        # handle method, saving a call for every event.
+        if len(self.sinks) == 1:
+            self.emit = self.sinks[0].handle
+        else:
+            self.__dict__.pop('emit', None)
+
+    def subscribe(self, sink):
+        """
+        :param class sink: Object with handle(event_type, *fields) and flush() methods.
+        :return: The sink.
+        """
+        self.sinks.append(sink)
+        self.route()
+        return sink
+
+    def unsubscribe(self, sink):
+        """
+        :param class sink: A previously subscribed sink, it's flushed on the way out.
+        """
+        self.sinks.remove(sink)
+        self.route()
+        sink.flush()
+
+    def emit(self, event_type, *fields):
+        """
+        :param type event_type: One of the EVENT_TYPES.
+        :param fields: The fields of the event, in order.
+        """
+        for sink in self.sinks:
+            sink.handle(event_type, *fields)
+
+    def flush(self):
+        """
+        Flush every sink, eg: at the end of a fight.
+        """
+        for sink in self.sinks:
+            sink.flush()
+
+
+class ConsoleSink(object):
+    """
+    Narrates events to the player, the way the game always has.
+    """
+
+    def handle(self, event_type, *fields):
+        event = event_type(*fields)
+
+        if event_type is Damage:
+            console.write(console.narrator.attack(event.attacker, event.target, event.previous_health, event.item,
+                                                  event.damage, event.attack_type))
+        elif event_type is Kill:
+            console.write(console.narrator.death(event.target, event.killer))
+        elif event_type is Rest:
+            console.write(console.narrator.rest(event.character, event.health, event.stamina,
+                                                {'health': event.health_gain, 'stamina': event.stamina_gain}))
+        elif event_type is Attack and not event.multiplier:
+            console.write(f'{event.attacker} does not have enough stamina to attack!')
+        elif event_type is UseItem:
+            console.write(console.narrator.use_item(event.character, event.item, event.kind))
+        elif event_type is Critical:
+            console.write(console.narrator.critical(event.attacker, event.target))
+        elif event_type is EffectApplied:
+            console.write(console.narrator.effect(event.target, event.effect, event.stacks))
+        elif event_type is EffectTick:
+            console.write(console.narrator.effect_tick(event.target, event.effect, event.damage))
+        elif event_type is EffectExpired:
+            console.write(console.narrator.effect_expired(event.target, event.effect))
+        elif event_type is Volley:
+            console.write(console.narrator.volley(event.attacker, event.attack_type, event.targets, event.damage,
+                                                  event.kills))
+
+    def flush(self):
+        pass
+
+
+def _json_value(value):
+    if value is None:
+        return 'null'
+    if type(value) is str:
+        return json.dumps(value)
+    return repr(value)
+
+
+# Which of the leading fields of each event are names.
+NAME_COUNTS = {Damage: 4, Attack: 3, Regenerate: 2, Rest: 1, Kill: 2, UseItem: 3, Critical: 3, EffectApplied: 3,
+               EffectTick: 2, EffectExpired: 2, Volley: 2}
+
+
+class JsonLinesSink(object):
+    """
+    Writes each event as a line of JSON, eg: {"event": "Kill", "target": "Wolf", "killer": "Player"}
+    Events are collected, then formatted and written to the stream batch_size at a time.
+    """
+
+    def __init__(self, stream, batch_size=4096):
+        """
+        :param file stream: Text stream to write to.
+        :param int|optional batch_size: Number of events to collect before writing them out.
+        """
+        self.stream = stream
+        self.batch_size = batch_size
+        self._pending = []
+
+        # Names that need no escaping, which covers nearly every one the game uses. A batch made up of only those
+        # is formatted in a single step, with the names dropped straight into quotes.
+        self._plain_names = set()
+
+        self._formats = {}
+        for event_type in EVENT_TYPES:
+            names = NAME_COUNTS[event_type]
+            fields = [f'"{field}": ' + ('"%s"' if index < names else '%r')
+                      for index, field in enumerate(event_type._fields)]
+            self._formats[event_type] = '{"event": "%s", %s}\n' % (event_type.__name__, ', '.join(fields))
+
+        self._slow_formats = {event_type: '{"event": "%s", %s}\n' % (event_type.__name__, ', '.join(
+            f'"{field}": %s' for field in event_type._fields)) for event_type in EVENT_TYPES}
+
+    def handle(self, event_type, *fields):
+        self._pending.append((event_type, fields))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def _all_plain(self, values):
+        # Names are the only strings in an event and every name is a string or None, so only those need a look.
+        plain = True
+        for value in set(values).difference(self._plain_names):
+            if type(value) is str and json.dumps(value) == f'"{value}"':
+                self._plain_names.add(value)
+            elif type(value) is str or value is None:
+                plain = False
+        return plain
+
+    def flush(self):
+        pending = self._pending
+        if not pending:
+            return
+
+        values = tuple(chain.from_iterable(map(itemgetter(1), pending)))
+        if self._all_plain(values):
+            text = ''.join(map(self._formats.__getitem__, map(itemgetter(0), pending))) % values
+        else:
+            text = ''.join([self._line(event_type, fields) for event_type, fields in pending])
+        pending.clear()
+        self.stream.write(text)
+
+    def _line(self, event_type, fields):
+        if self._plain_names.issuperset(fields[:NAME_COUNTS[event_type]]):
+            return self._formats[event_type] % fields
+        return self._slow_formats[event_type] % tuple(map(_json_value, fields))
+
+
+# Binary records start with a one byte code. Names are sent as STRING records and referred to by their number.
+# Events are written in BATCH records: the number of events (I), the code of each one in order (B), then the events
+# of each type together in the order of EVENT_TYPES, as their BINARY_FORMATS. Floats are stored single precision.
+STRING = 0
+BATCH = 0xFF
+NO_NAME = 0xFFFF
+STRING_HEADER = struct.Struct('<BHH')
+BATCH_HEADER = struct.Struct('<BI')
+BINARY_FORMATS = {Damage: struct.Struct('<HHHHfff'),
+                  Attack: struct.Struct('<HHHfff'),
+                  Regenerate: struct.Struct('<HHff'),
+                  Rest: struct.Struct('<Hffff'),
+                  Kill: struct.Struct('<HH'),
+                  UseItem: struct.Struct('<HHH'),
+                  Critical: struct.Struct('<HHHf'),
+                  EffectApplied: struct.Struct('<HHHHH'),
+                  EffectTick: struct.Struct('<HHff'),
+                  EffectExpired: struct.Struct('<HH'),
+                  Volley: struct.Struct('<HHIIIfI')}
+BINARY_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES, 1)}
+
+
+class BinarySink(object):
+    """
+    Writes events as compact struct records, read back with read_binary. Events are only collected as they're
+    handled, and packed a whole batch of each type at a time when they're written out.
+    """
+
+    def __init__(self, stream, batch_size=8192):
+        """
+        :param file stream: Binary stream to write to.
+        :param int|optional batch_size: Number of events to collect before writing them out.
+        """
+        self.stream = stream
+        self.batch_size = batch_size
+        self._names = {None: NO_NAME}
+
+        # The fields of the events collected so far by type, and the order of their types.
+        self._pending = {event_type: [] for event_type in EVENT_TYPES}
+        self._order = []
+
+    def handle(self, event_type, *fields):
+        self._pending[event_type].append(fields)
+        self._order.append(event_type)
+        if len(self._order) >= self.batch_size:
+            self.flush()
+
+    def _number_names(self, column, buffer):
+        # Names are numbered in the order they first appear, so the same events always make the same file.
+        names = self._names
+        for name in dict.fromkeys(column):
+            if name not in names:
+                number = names[name] = len(names) - 1
+                encoded = name.encode('utf-8')
+                buffer += STRING_HEADER.pack(STRING, number, len(encoded))
+                buffer += encoded
+        return map(names.__getitem__, column)
+
+    def flush(self):
+        if not self._order:
+            return
+
+        buffer = bytearray()
+        records = []
+        for event_type, pending in self._pending.items():
+            if not pending:
+                continue
+            columns = list(zip(*pending))
+            for index in range(NAME_COUNTS[event_type]):
+                columns[index] = self._number_names(columns[index], buffer)
+
+            records.append(b''.join(map(BINARY_FORMATS[event_type].pack, *columns)))
+            pending.clear()
+
+        buffer += BATCH_HEADER.pack(BATCH, len(self._order))
+        buffer += bytes(map(BINARY_CODES.__getitem__, self._order))
+        buffer += b''.join(records)
+        self._order.clear()
+        self.stream.write(buffer)
+
+
+def _read_events(event_type, data, names):
+    name_count = NAME_COUNTS[event_type]
+    for values in BINARY_FORMATS[event_type].iter_unpack(data):
+        yield event_type(*[names[number] for number in values[:name_count]], *values[name_count:])
+
+
+def read_binary(stream):
+    """
+    :param file stream: Binary stream written by a BinarySink.
+    :return: Generator of the events in the stream.
+    """
+    data = stream.read()
+    names = {NO_NAME: None}
+
+    offset = 0
+    while offset < len(data):
+        code = data[offset]
+        if code == STRING:
+            _, number, length = STRING_HEADER.unpack_from(data, offset)
+            offset += STRING_HEADER.size
+            names[number] = data[offset:offset + length].decode('utf-8')
+            offset += length
+            continue
+        if code != BATCH:
+            raise ValueError(f'Unknown record code {code} at {offset}')
+
+        _, count = BATCH_HEADER.unpack_from(data, offset)
+        offset += BATCH_HEADER.size
+        codes = data[offset:offset + count]
+        offset += count
+
+        batches = {}
+        for event_type in EVENT_TYPES:
+            code = BINARY_CODES[event_type]
+            size = BINARY_FORMATS[event_type].size * codes.count(code)
+            if size:
+                batches[code] = _read_events(event_type, data[offset:offset + size], names)
+                offset += size
+        for code in codes:
+            yield next(batches[code])
+
+
+class RingBufferSink(object):
+    """
+    Keeps the last size events in memory, eg: for showing what led up to a crash.
+    """
+
+    def __init__(self, size=10000):
+        """
+        :param int|optional size: The most events to keep.
+        """
+        # The type and fields of each event, only made into events when they're asked for.
+        self.records = deque(maxlen=size)
+
+    def handle(self, event_type, *fields):
+        self.records.append((event_type, fields))
+
+    @property
+    def events(self):
+        """
+        :return: The events kept, oldest first.
+        :rtype: list
+        """
+        return [event_type(*fields) for event_type, fields in self.records]
+
+    def flush(self):
+        pass
+
+
+# The bus characters emit to. The player is told what happens through console_sink, unsubscribe it to run headless.
+console_sink = ConsoleSink()
+bus = EventBus([console_sink])
+
+
+@contextmanager
+def subscribed(sink, event_bus=None):
+    """
+    Subscribe a sink for the duration of the with block, flushing it at the end.
+
+    :param class sink: The sink to subscribe.
+    :param EventBus|optional event_bus: The bus to subscribe to, the default bus if not given.
+    """
+    event_bus = event_bus or bus
+    event_bus.subscribe(sink)
+    try:
+        yield sink
+    finally:
+        event_bus.unsubscribe(sink)
@@ -0,0 +1,97 @@
+"""
+Input providers, where console.choose_action gets the player's decisions from.
+
+A provider only has to implement read(), returning the raw answer to a prompt as a string or an int.
+Providers that aren't a person at a terminal set echo to False so the menus aren't formatted for nobody to read,
+a provider without echo is taken to be a person.
+"""
+import asyncio
+
+
+class InputExhausted(Exception):
+    """
+    Raised when a provider has no more input to give.
+    """
+
+
+class StdinInput(object):
+    """
+    A person typing at the terminal, the original behaviour.
+    """
+    echo = True
+
+    def read(self, header, actions_dict):
+        """
+        :param str header: Header for the action to take.
+        :param dict actions_dict: The actions that can be chosen from.
+        :return: The raw answer to the prompt.
+        :rtype: str
+        """
+        return input()
+
+
+class ScriptedInput(object):
+    """
+    Plays back a fixed sequence of answers, eg: for tests or replays.
+    """
+    echo = False
+
+    def __init__(self, choices):
+        """
+        :param iterable choices: The answers to give, in order.
+        """
+        self._choices = iter(choices)
+
+    def read(self, header, actions_dict):
+        try:
+            return next(self._choices)
+        except StopIteration:
+            raise InputExhausted(f'No scripted answer left for "{header}"')
+
+
+class PolicyInput(object):
+    """
+    Asks a function for every decision, letting bots and agents play the game.
+    """
+    echo = False
+
+    def __init__(self, policy):
+        """
+        :param function policy: Called as policy(header, actions_dict) and returns the chosen index.
+        """
+        self.policy = policy
+
+    def read(self, header, actions_dict):
+        return self.policy(header, actions_dict)
+
+
+class AsyncInput(object):
+    """
+    Receives answers from a coroutine, eg: a network connection. Answers are pushed in with put() and
+    awaited by console.choose_action_async.
+    """
+    echo = True
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+
+    def put(self, answer):
+        """
+        :param str|int answer: The next answer to hand to the game.
+        """
+        self._queue.put_nowait(answer)
+
+    def read(self, header, actions_dict):
+        # Reading synchronously only works if an answer is already waiting.
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            raise InputExhausted(f'No answer waiting for "{header}"')
+
+    async def read_async(self, header, actions_dict):
+        """
+        :param str header: Header for the action to take.
+        :param dict actions_dict: The actions that can be chosen from.
+        :return: The raw answer to the prompt, once it arrives.
+        """
+        return await self._queue.get()
@@ -0,0 +1,361 @@
+"""
+Character inventories.
+
+An Inventory is a fixed number of slots, each holding a stack of one item. Items are the catalog's shared
+definitions, typed by their 'kind': weapons can be equipped, consumables used up. Items with a 'stack' size
+share a slot up to that many, everything else takes a slot of its own.
+
+Queries such as "every consumable" or "the weapon with the highest damage_bonus" are answered from indexes by
+item id, kind and stat, which are kept up to date as items come and go rather than found by looking through
+every slot. What the character has equipped is summed up once whenever it changes: the total of every stat, and
+the damage range of every equipped weapon used by Character.__deal_damage.
+"""
+from bisect import insort
+from collections import namedtuple
+
+import catalog
+import narration
+
+# Kinds of item.
+WEAPON = 'weapon'
+CONSUMABLE = 'consumable'
+
+# Stats of an item that are summed up over the equipped items and indexed for best() queries.
+STATS = ('damage_bonus', 'durability')
+
+DEFAULT_CAPACITY = 16
+DEFAULT_MAX_EQUIPPED = 2
+
+# A slot of the inventory, count being how many of the item are stacked in it.
+Stack = namedtuple('Stack', ['item', 'count'])
+
+
+class Inventory(object):
+    """
+    Slots of stacked items, with the equipped ones summed up.
+    """
+    __slots__ = ('capacity', 'max_equipped', 'slots', 'equipped_slots', '_by_id', '_by_kind', '_by_stat', '_bonuses',
+                 '_ranges', '_state')
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_equipped=DEFAULT_MAX_EQUIPPED):
+        """
+        :param int|optional capacity: The most slots the inventory has.
+        :param int|optional max_equipped: The most items that can be equipped at once.
+        """
+        self.capacity = capacity
+        self.max_equipped = max_equipped
+
+        # Stack in each slot, None where a slot has been emptied. Slots are never moved, so they can be referred to
+        # by number.
+        self.slots = []
+        self.equipped_slots = ()
+
+        # Slot numbers by item id and by kind, and (value, slot) by stat, sorted. Built on the first query.
+        self._by_id = None
+        self._by_kind = None
+        self._by_stat = None
+
+        # Summaries of the equipped items, dropped whenever they change.
+        self._bonuses = None
+        self._ranges = None
+        self._state = None
+
+    def __len__(self):
+        return len(self.slots) - self.slots.count(None)
+
+    def __iter__(self):
+        """
+        :return: (slot, Stack) of every filled slot.
+        """
+        return ((slot, stack) for slot, stack in enumerate(self.slots) if stack is not None)
+
+    # Indexes
+
+    def _index(self):
+        self._by_id, self._by_kind, self._by_stat = {}, {}, {}
+        for slot, stack in self:
+            self._index_slot(slot, stack.item)
+
+    def _index_slot(self, slot, item):
+        self._by_id.setdefault(item['item_name'], []).append(slot)
+        self._by_kind.setdefault(item.get('kind', WEAPON), set()).add(slot)
+        for stat in STATS:
+            if stat in item:
+                insort(self._by_stat.setdefault(stat, []), (item[stat], slot))
+
+    def _unindex_slot(self, slot, item):
+        self._by_id[item['item_name']].remove(slot)
+        self._by_kind[item.get('kind', WEAPON)].discard(slot)
+        for stat in STATS:
+            if stat in item:
+                self._by_stat[stat].remove((item[stat], slot))
+
+    def _changed(self, equipment=False):
+        self._state = None
+        if equipment:
+            self._bonuses = None
+            self._ranges = None
+
+    # Adding and removing items
+
+    def add(self, item, count=1):
+        """
+        Add items, topping up existing stacks of the item before filling empty slots.
+
+        :param MappingProxyType|str item: Catalog definition or id of the item.
+        :param int|optional count: How many to add.
+        :return: How many didn't fit.
+        :rtype: int
+        """
+        if isinstance(item, str):
+            item = catalog.item(item)
+        stack_size = item.get('stack', 1)
+
+        for slot in self._slots_of(item['item_name']) if stack_size > 1 else ():
+            stack = self.slots[slot]
+            added = min(count, stack_size - stack.count)
+            if added > 0:
+                self.slots[slot] = Stack(item, stack.count + added)
+                count -= added
+
+        while count and len(self) < self.capacity:
+            added = min(count, stack_size)
+            stack = Stack(item, added)
+            if None in self.slots:
+                slot = self.slots.index(None)
+                self.slots[slot] = stack
+            else:
+                slot = len(self.slots)
+                self.slots.append(stack)
+            if self._by_id is not None:
+                self._index_slot(slot, item)
+            count -= added
+
+        self._changed()
+        return count
+
+    def remove(self, item_id, count=1):
+        """
+        Remove items, from the last stack of them first. Equipped items that run out are unequipped.
+
+        :param str item_id: Id of the item.
+        :param int|optional count: How many to remove.
+        """
+        slots = list(self._slots_of(item_id))
+        if sum(self.slots[slot].count for slot in slots) < count:
+            raise KeyError(f'Not enough {item_id} in the inventory to remove {count}')
+
+        for slot in reversed(slots):
+            stack = self.slots[slot]
+            removed = min(count, stack.count)
+            count -= removed
+            if removed < stack.count:
+                self.slots[slot] = Stack(stack.item, stack.count - removed)
+            else:
+                self.take(slot)
+            if not count:
+                break
+        self._changed()
+
+    def consume(self, slot):
+        """
+        Use up one of the items in a slot.
+
+        :param int slot: A filled slot.
+        :return: The item used up.
+        :rtype: MappingProxyType
+        """
+        stack = self.slots[slot]
+        if stack is None:
+            raise KeyError(f'Slot {slot} is empty')
+
+        if stack.count > 1:
+            self.slots[slot] = Stack(stack.item, stack.count - 1)
+            self._changed()
+        else:
+            self.take(slot)
+        return stack.item
+
+    def take(self, slot):
+        """
+        Empty a slot, unequipping what was in it.
+
+        :param int slot: The slot to empty.
+        :return: The stack that was in the slot.
+        :rtype: Stack
+        """
+        stack = self.slots[slot]
+        if stack is None:
+            raise KeyError(f'Slot {slot} is empty')
+
+        if slot in self.equipped_slots:
+            self.unequip(slot)
+        if self._by_id is not None:
+            self._unindex_slot(slot, stack.item)
+
+        self.slots[slot] = None
+        while self.slots and self.slots[-1] is None:
+            self.slots.pop()
+        self._changed()
+        return stack
+
+    # Queries
+
+    def _slots_of(self, item_id):
+        # Inventories that were never queried aren't worth indexing, they are only a handful of slots.
+        if self._by_id is None:
+            return [slot for slot, stack in self if stack.item['item_name'] == item_id]
+        return self._by_id.get(item_id, ())
+
+    def find(self, item_id):
+        """
+        :return: The slots holding the item, in order.
+        :rtype: list
+        """
+        if self._by_id is None:
+            self._index()
+        return sorted(self._by_id.get(item_id, ()))
+
+    def count(self, item_id):
+        """
+        :return: How many of the item there are, over every stack of it.
+        :rtype: int
+        """
+        return sum(self.slots[slot].count for slot in self._slots_of(item_id))
+
+    def of_kind(self, kind):
+        """
+        :param str kind: Kind of item, eg: CONSUMABLE.
+        :return: The slots holding items of that kind, in order.
+        :rtype: list
+        """
+        if self._by_kind is None:
+            self._index()
+        return sorted(self._by_kind.get(kind, ()))
+
+    def best(self, stat, kind=None):
+        """
+        :param str stat: One of STATS, eg: 'damage_bonus'.
+        :param str|optional kind: Only consider items of this kind.
+        :return: The slot of the item with the highest value of the stat, None if no item has it.
+        :rtype: int
+        """
+        if self._by_stat is None:
+            self._index()
+        for _, slot in reversed(self._by_stat.get(stat, ())):
+            if kind is None or self.slots[slot].item.get('kind', WEAPON) == kind:
+                return slot
+        return None
+
+    # Equipment
+
+    @property
+    def equipped(self):
+        """
+        :return: The definitions of the equipped items.
+        :rtype: list
+        """
+        return [self.slots[slot].item for slot in self.equipped_slots]
+
+    def equip(self, slot):
+        """
+        Equip the item in a slot. When already at max_equipped, the item equipped longest ago is unequipped first.
+
+        :param int slot: Slot of a weapon.
+        """
+        stack = self.slots[slot] if slot < len(self.slots) else None
+        if stack is None or stack.item.get('kind', WEAPON) != WEAPON:
+            raise ValueError(f'Slot {slot} does not hold anything that can be equipped')
+        if slot in self.equipped_slots:
+            return
+
+        self.equipped_slots = (self.equipped_slots + (slot,))[-self.max_equipped:]
+        self._changed(equipment=True)
+
+    def unequip(self, slot):
+        """
+        :param int slot: An equipped slot.
+        """
+        self.equipped_slots = tuple(equipped for equipped in self.equipped_slots if equipped != slot)
+        self._changed(equipment=True)
+
+    def set_equipped(self, items):
+        """
+        Equip exactly the given items, adding any the inventory doesn't have yet.
+
+        :param list items: Catalog definitions or ids of the items.
+        """
+        self.equipped_slots = ()
+        for item in items:
+            item = catalog.item(item) if isinstance(item, str) else item
+            slots = [slot for slot in self._slots_of(item['item_name']) if slot not in self.equipped_slots]
+            if not slots:
+                if self.add(item):
+                    raise ValueError(f'No room in the inventory for {item["item_name"]}')
+                slots = [slot for slot in self._slots_of(item['item_name']) if slot not in self.equipped_slots]
+            self.equipped_slots += (slots[0],)
+        self._changed(equipment=True)
+
+    def bonus(self, stat):
+        """
+        :param str stat: One of STATS.
+        :return: The total of the stat over every equipped item.
+        :rtype: float
+        """
+        if self._bonuses is None:
+            equipped = self.equipped
+            self._bonuses = {stat: sum(item.get(stat, 0) for item in equipped) for stat in STATS}
+        return self._bonuses[stat]
+
+    def damage_ranges(self, strength):
+        """
+        :param float strength: Strength of the character attacking.
+        :return: (item, lowest damage, highest damage) of every equipped item, before the attack's multiplier. Both
+                 are whole numbers, truncated the way RandomStream.randint does.
+        :rtype: tuple
+        """
+        ranges = self._ranges
+        if ranges is None or ranges[0] != strength:
+            ranges = self._ranges = (strength, tuple((item, int(strength * 0.1), int(item['damage_bonus'] + strength))
+                                                     for item in self.equipped))
+        return ranges[1]
+
+    # Saving
+
+    def state(self):
+        """
+        :return: A comparable summary of the inventory, (slots as (item, count) or None, equipped slots).
+        :rtype: tuple
+        """
+        if self._state is None:
+            self._state = (tuple(self.slots), self.equipped_slots)
+        return self._state
+
+    def restore(self, slots, equipped_slots):
+        """
+        Replace the contents of the inventory, eg: with what was read from a save file.
+
+        :param list slots: (item, count) or None for every slot.
+        :param tuple equipped_slots: The slots that are equipped.
+        """
+        self.slots = [Stack(*slot) if slot is not None else None for slot in slots]
+        self.equipped_slots = tuple(equipped_slots)
+        self._by_id = self._by_kind = self._by_stat = None
+        self._changed(equipment=True)
+
+    # Menus
+
+    def menu(self):
+        """
+        :return: {index: {'type': description, 'slot': slot}} of every item, for console.choose_action.
+        :rtype: dict
+        """
+        actions = {}
+        for slot, stack in self:
+            description = narration.format_name(stack.item['item_name'])
+            if stack.count > 1:
+                description += f' x{stack.count}'
+            if slot in self.equipped_slots:
+                description += ' (equipped)'
+            actions[len(actions) + 1] = {'type': description, 'slot': slot}
+        return actions
@@ -0,0 +1,105 @@
+"""
+Loopback load generator for server.py.
+
+Opens many concurrent sessions that always answer with a light attack, and reports how many fights the
+server completed per second of its CPU time along with the latency of each turn.
+
+Run with: python loadgen.py [--sessions 1000] [--concurrency 500]
+Without --port an in-process server is started, so its CPU time can be measured separately from the clients'.
+"""
+import argparse
+import asyncio
+import time
+
+import console
+import server
+
+# Attack, then light attack, for every turn of the fight.
+ANSWERS = (b'1\n', b'1\n')
+
+
+async def play_session(host, port, latencies):
+    """
+    Play one fight to completion, recording the time between every answer and the next prompt.
+
+    :param str host: Address of the server.
+    :param int port: Port of the server.
+    :param list latencies: Seconds each turn took are appended to this.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    prompt = server.PROMPT.encode('utf-8') + b'\n'
+
+    answer = 0
+    sent = None
+    async for line in reader:
+        if line == prompt:
+            if sent is not None:
+                latencies.append(time.perf_counter() - sent)
+            writer.write(ANSWERS[answer % len(ANSWERS)])
+            answer += 1
+            sent = time.perf_counter()
+
+    writer.close()
+
+
+def percentile(values, percent):
+    """
+    :param list values: Sorted values.
+    :param float percent: The percentile to find, 0 - 100.
+    """
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+async def run(sessions, concurrency, host=None, port=None, save_dir=None):
+    """
+    :param int sessions: Total number of fights to play.
+    :param int concurrency: How many fights are connected at once.
+    :param str|optional host: Address of the server.
+    :param int|optional port: Port of an already running server, one is started in-process if not given.
+    :param str|optional save_dir: Where the in-process server autosaves sessions to, no autosaving if not given.
+    """
+    game_server = None
+    if port is None:
+        game_server = server.GameServer('127.0.0.1', 0, save_dir)
+        await game_server.start()
+        host, port = game_server.host, game_server.port
+
+    latencies = []
+    limit = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with limit:
+            await play_session(host, port, latencies)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*[limited() for _ in range(sessions)])
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    if game_server:
+        await game_server.close()
+
+    latencies.sort()
+    console.write(f'Sessions           : {sessions} ({concurrency} concurrent)')
+    console.write(f'Turns              : {len(latencies)}')
+    console.write(f'Sessions/sec       : {sessions / wall:,.0f}')
+    # With an in-process server the CPU time includes the clients, so this is a lower bound per core.
+    console.write(f'Sessions/cpu-sec   : {sessions / cpu:,.0f}')
+    console.write('Turn latency (ms)  : p50 {:.2f} / p90 {:.2f} / p99 {:.2f}'.format(
+        *[percentile(latencies, p) * 1000 for p in (50, 90, 99)]))
+    console.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--save-dir', help='Have the in-process server autosave every session to this directory.')
+    arguments = parser.parse_args()
+
+    asyncio.run(run(arguments.sessions, arguments.concurrency, arguments.host, arguments.port, arguments.save_dir))
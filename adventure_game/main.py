@@ -1,19 +1,57 @@
 """
 Main gameplay methods for the game.
+
+The combat loops are written as generators that yield a console.Prompt whenever the player has to make a
+decision, and expect the chosen index to be sent back. This lets the same rules be driven by a person at the
+terminal, a bot or a coroutine. combat() and combat_attack() drive them with console.choose_action.
 """
 import time
 import character
 import console
+import effects
+
+
+def run(steps, provider=None):
+    """
+    Drive a combat generator to completion, answering every prompt it yields with console.choose_action.
+
+    :param generator steps: The generator to drive, eg: combat_steps(player, enemy)
+    :param class|optional provider: Where the answers come from, console.input_provider by default.
+    :return: The value the generator returned.
+    """
+    choice = None
+    try:
+        while True:
+            prompt = steps.send(choice)
+            choice = console.choose_action(*prompt, provider=provider)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_async(steps, provider=None):
+    """
+    Same as run, but awaits each answer with console.choose_action_async.
+    """
+    choice = None
+    try:
+        while True:
+            prompt = steps.send(choice)
+            choice = await console.choose_action_async(*prompt, provider=provider)
+    except StopIteration as stop:
+        return stop.value
 
 
-def combat_attack(player, enemy):
+def combat_attack_steps(player, enemy):
     """
+    Ask the player which attack to perform and perform it.
 
+    :return: False if the player backed out of the menu, otherwise True.
+    :rtype: bool
     """
-    attack_action = console.choose_action(header='Choose an Attack',
-                                          actions_dict=player.attack_actions,
-                                          attack=True,
-                                          back=True)
+    attack_action = yield console.Prompt(header='Choose an Attack',
+                                         actions_dict=player.attack_actions,
+                                         attack=True,
+                                         back=True)
 
     if attack_action == 0:
         return False
@@ -23,41 +61,108 @@ def combat_attack(player, enemy):
         return True
 
 
-def combat(player, enemy):
+def combat_inventory_steps(player):
+    """
+    Ask the player which item from their inventory to use and use it.
+
+    :return: False if the player backed out of the menu or there was nothing to do, otherwise True.
+    :rtype: bool
+    """
+    items = player.inventory.menu()
+    if not items:
+        console.write(f'{player.name} has nothing in their inventory.')
+        return False
+
+    item_action = yield console.Prompt(header='Choose an Item', actions_dict=items, back=True)
+
+    if item_action == 0:
+        return False
+    return player.use_item(items[item_action]['slot'])
+
+
+def combat_steps(player, enemy, turn=0, autosaver=None, engine=None):
+    """
+    Fight until one side is dead. Status effects tick once a turn, after both characters have acted.
+
+    :param int|optional turn: The turn to count from, eg: when carrying on a fight loaded with savegame.load.
+    :param Autosaver|optional autosaver: If given, the fight is saved with it at the start of every turn.
+    :param Engine|optional engine: The status effects to carry on with, eg: restored by a replay. By default the
+                                   one the characters were loaded in by savegame.load, or a new effects.Engine.
+    :return: The number of turns played.
+    :rtype: int
+    """
     # Player to attack
     # console.draw_hud([player, enemy])
 
-    while player.alive and enemy.alive:
-        console.draw_hud([player, enemy])
+    engine = engine or player.effects or enemy.effects or effects.Engine()
+    engine.attach(player, enemy)
+    try:
+        while player.alive and enemy.alive:
+            if autosaver:
+                autosaver.save(turn, [player, enemy])
+
+            console.draw_hud([player, enemy])
+
+            # Get an action from the player
+            combat_action = yield console.Prompt('Choose an Action', player.combat_actions)
+
+            # ATTACK
+            if combat_action == 1:
+                combat_result = yield from combat_attack_steps(player, enemy)
+                if not combat_result:
+                    continue
 
-        # Get an action from the player
-        combat_action = console.choose_action('Choose an Action', player.combat_actions)
+            # BLOCK
+            if combat_action == 2:
+                player.block()
 
-        # ATTACK
-        if combat_action == 1:
-            combat_result = combat_attack(player, enemy)
-            if not combat_result:
-                continue
+            # REST
+            if combat_action == 3:
+                player.rest()
 
-        # BLOCK
-        if combat_action == 2:
-            continue
+            # INVENTORY
+            if combat_action == 4:
+                inventory_result = yield from combat_inventory_steps(player)
+                if not inventory_result:
+                    continue
 
-        # REST
-        if combat_action == 3:
-            player.rest()
+            # If the monster is alive, play its turn.
+            if enemy.alive:
+                enemy.choose_combat_action(player)
 
-        # INVENTORY
-        if combat_action == 4:
-            continue
+            engine.tick()
+            turn += 1
+    finally:
+        engine.detach()
 
-        # If the monster is alive, play its turn.
-        if enemy.alive:
-            enemy.choose_combat_action(player)
+    if autosaver:
+        autosaver.save(turn, [player, enemy])
 
-    print('-' * 20)
-    print(f'{enemy.name} : {enemy.alive}')
-    print(f'{player.name} : {player.alive}')
+    console.write('-' * 20)
+    console.write(f'{enemy.name} : {enemy.alive}')
+    console.write(f'{player.name} : {player.alive}')
+    console.flush()
+    return turn
+
+
+def combat_attack(player, enemy, provider=None):
+    """
+    :param class|optional provider: Where the player's decisions come from, console.input_provider by default.
+    :return: False if the player backed out of the menu, otherwise True.
+    :rtype: bool
+    """
+    return run(combat_attack_steps(player, enemy), provider)
+
+
+def combat(player, enemy, provider=None, turn=0, autosaver=None):
+    """
+    :param class|optional provider: Where the player's decisions come from, console.input_provider by default.
+    :param int|optional turn: The turn to count from.
+    :param Autosaver|optional autosaver: If given, the fight is saved with it at the start of every turn.
+    :return: The number of turns played.
+    :rtype: int
+    """
+    return run(combat_steps(player, enemy, turn, autosaver), provider)
 
 
 def main():
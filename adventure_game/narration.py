@@ -0,0 +1,319 @@
+"""
+Precompiled sentence templates for everything the console narrates during combat.
+
+All the sentence variants are compiled once when the module is loaded. The 'a' / 'an' corrections are worked
+out at that point too, for the fixed text of the templates and for every damage verb, so narrating an event is
+just picking a template and formatting it.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import rng as rngs
+
+VOWEL_EXPRESSION = re.compile(r'( [aA] )([aAeEiIoOuU])')
+
+# A field in a template that directly follows an 'a', eg: 'deals a {verb}'.
+ARTICLE_FIELD_EXPRESSION = re.compile(r' a \{(\w+)\}')
+
+# Verbs to be used to describe damage amounts in order of severity.
+DAMAGE_VERBS = {0: ['measly', 'frail', 'feeble', 'weakly', 'shaky', 'decrepit', 'faint', 'poor'],
+                1: ['brawny', 'sturdy', 'hefty', 'sharp', 'strong'],
+                2: ['mighty', 'tremendous', 'heavy', 'enormous', 'hefty', 'powerful'],
+                3: ['crippling', 'crushing', 'mammoth', 'massive'],
+                4: ['bone crushing', 'obliterating', 'annihilating', 'blackout', 'ravaging', 'paralyzing']}
+
+ATTACK_TEMPLATES = ['{attacker} performs a {attack}, charging {victim} with {item} and deals a {verb} {damage} Damage!',
+                    '{attacker} {attack}\'s {victim} using {item}, for a {verb} {damage} Damage!',
+                    '{attacker} {attack}\'s {victim} with {item}, inflicting a {verb} {damage} Damage!',
+                    '{attacker} assaults {victim} with their {attack} wielding {item}, '
+                    'administering a {verb} {damage} Damage in the process!',
+                    '{victim} receives a {verb} {damage} Damage from {attacker}\'s {attack}'
+                    'wielding their {item}, lowering {victim}\'s health to {remaining}!']
+
+DEATH_TEMPLATES = ['{deceased} has died']
+
+KILLED_TEMPLATES = ['{deceased} has been slain by {killer}',
+                    '{deceased} has fallen in battle to {killer}',
+                    'Bloodied and broken, {deceased} falls to the ground at the hands of {killer}',
+                    '{deceased} draws their last breath as {killer} emerges victorious.',
+                    '{killer} has bested {deceased} in battle.']
+
+REST_TEMPLATES = ['{name} takes a knee to regenerate',
+                  '{name} steps back from battle for a moment to regenerate',
+                  'Knowing that time is precious, {name} takes a moment to rest, replenishing',
+                  'The wise {name} pauses to rejuvenating',
+                  'Short of breath, {name} pulls back to refresh',
+                  'Noticing that they have only {stamina} Stamina and {health} Health, '
+                  '{name} steps back momentarily restoring']
+
+EQUIP_TEMPLATES = ['{name} takes up their {item}',
+                   '{name} readies their {item} for battle']
+
+CONSUME_TEMPLATES = ['{name} drinks a {item}',
+                     '{name} quickly downs a {item}']
+
+CRITICAL_TEMPLATES = ['A critical hit from {attacker}!',
+                      '{attacker} finds a gap in {victim}\'s guard, a critical hit!']
+
+EFFECT_TEMPLATES = ['{target} is struck by {effect}{stacks}',
+                    '{effect}{stacks} takes hold of {target}']
+
+EFFECT_TICK_TEMPLATES = ['{target} suffers {damage} Damage from {effect}',
+                         '{effect} wears away at {target} for {damage} Damage']
+
+EFFECT_EXPIRED_TEMPLATES = ['{effect} on {target} wears off']
+
+VOLLEY_TEMPLATES = ['{attacker}\'s {attack} sweeps over {targets} foes for {damage} Damage!',
+                    '{attacker} unleashes a {attack} on {targets} foes, dealing {damage} Damage!']
+
+VOLLEY_KILLS_TEMPLATES = ['{attacker}\'s {attack} sweeps over {targets} foes for {damage} Damage, slaying {kills}!',
+                          '{attacker} unleashes a {attack} on {targets} foes, dealing {damage} Damage and leaving '
+                          '{kills} dead!']
+
+
+def correct_vowels(sentence):
+    """
+    Scan the input sentence and if it contains an 'a' followed by a letter beginning with a vowel, replace
+    the 'a' for 'an'
+
+    :param str sentence: The sentence to scan.
+    :returns: The grammatically correct sentence:
+    :rtype: str
+    """
+    return VOWEL_EXPRESSION.sub(r' an \2', sentence)
+
+
+@lru_cache(maxsize=1024)
+def with_article(word):
+    """
+    :param str word: The word to put an article in front of.
+    :return: The word prefixed by 'a' or 'an', eg: 'an Enormous'.
+    :rtype: str
+    """
+    return correct_vowels(f' a {word}')[1:]
+
+
+@lru_cache(maxsize=1024)
+def format_name(name):
+    """
+    Helper function to format item names neatly for better representation.
+
+    :param str name: Name to be formatted.
+    :return: Capitalised and separated name.
+    :rtype: str
+    """
+    return ' '.join([x.capitalize() for x in name.split('_')])
+
+
+class Template(object):
+    """
+    A sentence compiled for fast formatting. Fields that follow an 'a' are rewritten to take the value with
+    its article already attached, so no regex has to run when the sentence is rendered.
+    """
+    __slots__ = ('text', 'article_fields')
+
+    def __init__(self, text):
+        """
+        :param str text: The sentence, with str.format style named fields.
+        """
+        self.article_fields = tuple(ARTICLE_FIELD_EXPRESSION.findall(text))
+        text = ARTICLE_FIELD_EXPRESSION.sub(r' {\1__a}', text)
+
+        # Only the literal text is left for the vowel correction.
+        self.text = correct_vowels(text)
+
+    def render(self, fields):
+        """
+        :param dict fields: Values for each field of the template.
+        :return: The finished sentence.
+        :rtype: str
+        """
+        for field in self.article_fields:
+            fields[f'{field}__a'] = with_article(str(fields[field]))
+        return self.text.format(**fields)
+
+
+class Token(namedtuple('Token', ['kind', 'template', 'fields'])):
+    """
+    A structured narration event: which kind of message, which variant was picked and the values that fill it.
+    Converting it to a string renders the sentence it stands for.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return TEMPLATES[self.kind][self.template].render(dict(self.fields))
+
+
+TEMPLATES = {'attack': [Template(text) for text in ATTACK_TEMPLATES],
+             'death': [Template(text) for text in DEATH_TEMPLATES],
+             'killed': [Template(text) for text in KILLED_TEMPLATES],
+             'rest': [Template(text + ' {info}') for text in REST_TEMPLATES],
+             'equip': [Template(text) for text in EQUIP_TEMPLATES],
+             'consume': [Template(text) for text in CONSUME_TEMPLATES],
+             'critical': [Template(text) for text in CRITICAL_TEMPLATES],
+             'effect': [Template(text) for text in EFFECT_TEMPLATES],
+             'effect_tick': [Template(text) for text in EFFECT_TICK_TEMPLATES],
+             'effect_expired': [Template(text) for text in EFFECT_EXPIRED_TEMPLATES],
+             'volley': [Template(text) for text in VOLLEY_TEMPLATES],
+             'volley_kills': [Template(text) for text in VOLLEY_KILLS_TEMPLATES]}
+
+# Each bracket's verbs, capitalised ahead of time.
+VERB_TABLE = tuple(tuple(verb.capitalize() for verb in DAMAGE_VERBS[bracket]) for bracket in sorted(DAMAGE_VERBS))
+
+# Resolve the article of every verb now rather than on first use.
+for verbs in VERB_TABLE:
+    for verb in verbs:
+        with_article(verb)
+
+# Brackets are centred on every 20%, so the closest one to each damage percent can be looked up directly.
+# Ties go to the lower bracket, percentages past the last one use the highest bracket.
+BRACKET_TABLE = tuple(min(range(len(VERB_TABLE)), key=lambda bracket: abs(bracket * 20 - percent))
+                      for percent in range(len(VERB_TABLE) * 20))
+
+
+def damage_bracket(victim_health, damage):
+    """
+    :param float victim_health: The health of the character before the damage was dealt.
+    :param float damage: The amount of damage dealt.
+    :return: The severity of the damage, 0 - 4.
+    :rtype: int
+    """
+    damage_percent = max(round(damage / victim_health * 100), 0)
+    if damage_percent >= len(BRACKET_TABLE):
+        return len(VERB_TABLE) - 1
+    return BRACKET_TABLE[damage_percent]
+
+
+class Narrator(object):
+    """
+    Picks and fills in the sentence for each combat event.
+    """
+
+    def __init__(self, structured=False, rng=None):
+        """
+        :param bool|optional structured: If True return Token objects instead of strings, for log pipelines.
+        :param RandomStream|optional rng: The stream used to pick sentences, spawned from rng.default if not given.
+        """
+        self.structured = structured
+        self.rng = rng or rngs.spawn()
+
+    def _emit(self, kind, fields):
+        templates = TEMPLATES[kind]
+        index = self.rng.randrange(len(templates))
+
+        if self.structured:
+            return Token(kind, index, fields)
+        return templates[index].render(fields)
+
+    def damage_verb(self, victim_health, damage):
+        """
+        :param float victim_health: The health of the character before the damage was dealt.
+        :param float damage: The amount of damage dealt.
+        :return: A random capitalised verb describing how severe the damage was.
+        :rtype: str
+        """
+        verbs = VERB_TABLE[damage_bracket(victim_health, damage)]
+        return verbs[self.rng.randrange(len(verbs))]
+
+    def attack(self, attacker_name, victim_name, victim_health, item_name, damage, attack_type):
+        """
+        :param str attacker_name: Name of the character that performed the attack.
+        :param str victim_name: Name of the character that received the attack.
+        :param float victim_health: Health of the victim before the damage was dealt.
+        :param str item_name: The weapon that was used, eg: bare_fists
+        :param float damage: The amount of damage dealt.
+        :param str attack_type: The type of attack used, eg: light_attack
+        :return: The narration of the attack.
+        """
+        return self._emit('attack', {'attacker': attacker_name,
+                                     'victim': victim_name,
+                                     'item': format_name(item_name),
+                                     'attack': format_name(attack_type),
+                                     'verb': self.damage_verb(victim_health, damage),
+                                     'damage': damage,
+                                     'remaining': victim_health - damage})
+
+    def death(self, deceased_name, killer_name=None):
+        """
+        :param str deceased_name: Name of the character that died.
+        :param str|optional killer_name: Name of the killer, if there was one.
+        :return: The narration of the death.
+        """
+        if killer_name:
+            return self._emit('killed', {'deceased': deceased_name, 'killer': killer_name})
+        return self._emit('death', {'deceased': deceased_name})
+
+    def rest(self, name, health, stamina, info):
+        """
+        :param str name: Name of the character who rested.
+        :param float health: Health of the character.
+        :param float stamina: Stamina of the character.
+        :param dict info: {'attribute name': amount regenerated}
+        :return: The narration of the rest.
+        """
+        fields = {'name': name, 'health': health, 'stamina': stamina}
+        amounts = [f'{value} {attribute}' for attribute, value in info.items()]
+
+        if len(amounts) > 1:
+            amounts = [', '.join(amounts[:-1]), amounts[-1]]
+        fields['info'] = ' and '.join(amounts)
+
+        return self._emit('rest', fields)
+
+    def use_item(self, name, item_name, kind):
+        """
+        :param str name: Name of the character who used the item.
+        :param str item_name: The item used, eg: health_potion
+        :param str kind: Kind of the item, weapons are equipped and everything else used up.
+        :return: The narration of the item being used.
+        """
+        return self._emit('equip' if kind == 'weapon' else 'consume', {'name': name, 'item': format_name(item_name)})
+
+    def critical(self, attacker_name, victim_name):
+        """
+        :param str attacker_name: Name of the character that landed the critical hit.
+        :param str victim_name: Name of the character that was hit.
+        :return: The narration of the critical hit.
+        """
+        return self._emit('critical', {'attacker': attacker_name, 'victim': victim_name})
+
+    def effect(self, target_name, effect_id, stacks=1):
+        """
+        :param str target_name: Name of the character the effect was applied to.
+        :param str effect_id: The effect, eg: poison
+        :param int|optional stacks: How many stacks of the effect the character has now.
+        :return: The narration of the effect taking hold.
+        """
+        return self._emit('effect', {'target': target_name, 'effect': format_name(effect_id),
+                                     'stacks': f' x{stacks}' if stacks > 1 else ''})
+
+    def effect_tick(self, target_name, effect_id, damage):
+        """
+        :param str target_name: Name of the character taking the damage.
+        :param str effect_id: The effect dealing it, eg: poison
+        :param float damage: The amount of damage dealt.
+        :return: The narration of the effect's damage.
+        """
+        return self._emit('effect_tick', {'target': target_name, 'effect': format_name(effect_id), 'damage': damage})
+
+    def effect_expired(self, target_name, effect_id):
+        """
+        :param str target_name: Name of the character the effect wore off.
+        :param str effect_id: The effect, eg: poison
+        :return: The narration of the effect ending.
+        """
+        return self._emit('effect_expired', {'target': target_name, 'effect': format_name(effect_id)})
+
+    def volley(self, attacker_name, attack_type, targets, damage, kills=0):
+        """
+        :param str attacker_name: Name of the character that performed the area attack.
+        :param str attack_type: The area attack used, eg: cleave
+        :param int targets: How many characters it hit.
+        :param float damage: The damage dealt over all of them.
+        :param int|optional kills: How many of them it killed.
+        :return: The narration of the whole volley.
+        """
+        fields = {'attacker': attacker_name, 'attack': format_name(attack_type), 'targets': targets,
+                  'damage': round(damage, 2), 'kills': kills}
+        return self._emit('volley_kills' if kills else 'volley', fields)
@@ -0,0 +1,406 @@
+"""
+Runtime profiling of the combat loop.
+
+enable() wraps the functions and methods that make up a turn with timers: main.combat and the combat generators
+it runs, the character actions, every console function, input providers, the console sink and the narration it
+writes, renderers, random streams and the event bus. disable() puts the originals back, so the game runs exactly as
+fast as it did before when profiling is off.
+
+While enabled, every call records how long it took in total and on its own (minus the timed calls it made), and
+under which chain of timed calls it happened. A generator, eg: main.combat_steps, is timed while it runs, from each
+time it's resumed to the next prompt it yields, and counts as one call once it's done. Durations are counted in
+buckets BUCKETS_PER_DOUBLING to a doubling, so memory stays the same however long the game is profiled for.
+The results can be written out as:
+    stats           - Calls, total and self time, p50 and p99 per phase, turns and turns/sec, as text or JSON.
+    collapsed stack - One line per call chain with its self time in microseconds, the input format of
+                      flamegraph.pl, speedscope and most other flame graph tools.
+For a cProfile of everything rather than the phases above, see run_cprofile.
+
+Run with: python profiling.py [--fights 2000] [--stats stats.json] [--collapsed combat.folded]
+"""
+import argparse
+import cProfile
+import inspect
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+from math import floor, log2
+
+import ai
+import character
+import console
+import events
+import inputs
+import main
+import narration
+import renderer
+import rng as rngs
+
+# (owner, attribute names) of everything timed, on top of every function in console. Owners are modules or
+# classes, methods are wrapped on the class so every instance is timed.
+TARGETS = [(main, ('combat', 'combat_steps', 'combat_attack_steps', 'combat_inventory_steps')),
+           (character.Character, ('perform_attack', '_Character__deal_damage', 'rest', 'regenerate', 'kill')),
+           (character.Monster, ('choose_combat_action',)),
+           (ai.Policy, ('decide',)),
+           (inputs.StdinInput, ('read',)),
+           (inputs.ScriptedInput, ('read',)),
+           (inputs.PolicyInput, ('read',)),
+           (narration.Narrator, ('attack', 'death', 'rest', 'use_item', 'critical', 'effect', 'effect_tick',
+                                 'effect_expired', 'volley')),
+           (renderer.BufferedRenderer, ('write', 'draw_hud', 'flush')),
+           (renderer.RecordingRenderer, ('write', 'draw_hud', 'flush')),
+           (renderer.NullRenderer, ('write', 'draw_hud', 'flush')),
+           (rngs.RandomStream, ('random', 'randint', 'randrange', 'choice')),
+           (events.ConsoleSink, ('handle',))]
+
+# Durations are counted in buckets this many to a doubling, which puts p50 and p99 within 2.2% of the real value.
+BUCKETS_PER_DOUBLING = 16
+
+
+def console_functions():
+    """
+    :return: The name of every plain function in console. Coroutines and context managers are left out, as
+             timing them would only time creating them.
+    :rtype: tuple
+    """
+    return tuple(name for name, value in vars(console).items()
+                 if inspect.isfunction(value) and value.__module__ == console.__name__
+                 and not inspect.iscoroutinefunction(value) and not hasattr(value, '__wrapped__'))
+
+
+def phase_name(owner, attribute):
+    """
+    :return: How a timed function is shown, eg: 'Character.__deal_damage' or 'console.write'
+    :rtype: str
+    """
+    prefix = owner.__name__
+    if attribute.startswith(f'_{prefix}__'):
+        attribute = attribute[len(prefix) + 1:]
+    return f'{prefix}.{attribute}'
+
+
+def bucket(seconds):
+    """
+    :return: The bucket of the durations histogram a duration is counted in.
+    :rtype: int
+    """
+    # Clocks can measure a call as taking no time at all, it goes in the bucket of a nanosecond.
+    return floor(log2(max(seconds, 1e-9)) * BUCKETS_PER_DOUBLING)
+
+
+def percentile(histogram, percent):
+    """
+    :param dict histogram: {bucket: number of durations in it}
+    :param float percent: The percentile to find, 0 - 100.
+    :return: The middle of the bucket the percentile falls in, in seconds.
+    :rtype: float
+    """
+    target = sum(histogram.values()) * percent / 100.0
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= target:
+            return 2 ** ((index + 0.5) / BUCKETS_PER_DOUBLING)
+    return 0.0
+
+
+class Phase(object):
+    """
+    Timings of one timed function.
+    """
+    __slots__ = ('name', 'calls', 'total', 'self_time', 'durations')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.self_time = 0.0
+
+        # {bucket: number of calls}
+        self.durations = {}
+
+    def summary(self, turns):
+        """
+        :param int turns: Turns played while profiling, for the calls per turn.
+        :return: The stats of the phase, times in seconds.
+        :rtype: dict
+        """
+        durations = self.durations
+        return {'calls': self.calls,
+                'calls_per_turn': self.calls / turns if turns else 0.0,
+                'total': self.total,
+                'self': self.self_time,
+                'p50': percentile(durations, 50),
+                'p99': percentile(durations, 99)}
+
+
+class Profiler(object):
+    """
+    Collects the timings of every call made to the timed functions while it's enabled.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.stacks = {}
+        self.turns = 0
+        self.elapsed = 0.0
+
+        self._frames = []
+        self._originals = []
+        self._started = None
+
+    @property
+    def enabled(self):
+        return bool(self._originals)
+
+    def _wrap(self, name, function):
+        phase = self.phases.setdefault(name, Phase(name))
+        durations = phase.durations
+        frames = self._frames
+        stacks = self.stacks
+        perf_counter = time.perf_counter
+        counts_turns = name == 'main.combat'
+
+        def record(elapsed, own):
+            # Adds what a call, or one run of a generator between prompts, did to its call chain.
+            stack = tuple(parent[0] for parent in frames) + (name,)
+            stacks[stack] = stacks.get(stack, 0.0) + own
+            if frames:
+                frames[-1][1] += elapsed
+
+        def finish(elapsed, own):
+            index = bucket(elapsed)
+            durations[index] = durations.get(index, 0) + 1
+            phase.calls += 1
+            phase.total += elapsed
+            phase.self_time += own
+
+        if inspect.isgeneratorfunction(function):
+            @wraps(function)
+            def timed_steps(*args, **kwargs):
+                steps = function(*args, **kwargs)
+                elapsed = own = 0.0
+                answer = error = None
+                try:
+                    while True:
+                        # Each frame is [name, time spent in timed calls made from it].
+                        frames.append([name, 0.0])
+                        start = perf_counter()
+                        try:
+                            prompt = steps.send(answer) if error is None else steps.throw(error)
+                        finally:
+                            ran = perf_counter() - start
+                            frame = frames.pop()
+                            elapsed += ran
+                            own += ran - frame[1]
+                            record(ran, ran - frame[1])
+
+                        answer = error = None
+                        try:
+                            answer = yield prompt
+                        except GeneratorExit:
+                            steps.close()
+                            raise
+                        except BaseException as raised:
+                            error = raised
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    finish(elapsed, own)
+
+            return timed_steps
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            # Each frame is [name, time spent in timed calls made from it].
+            frames.append([name, 0.0])
+            start = perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                frame = frames.pop()
+                record(elapsed, elapsed - frame[1])
+                finish(elapsed, elapsed - frame[1])
+
+            # main.combat returns the number of turns it played.
+            if counts_turns and type(result) is int:
+                self.turns += result
+            return result
+
+        return timed
+
+    def enable(self):
+        """
+        Start timing, wrapping every target. Does nothing if already enabled.
+        """
+        if self.enabled:
+            return
+
+        for owner, attributes in TARGETS + [(console, console_functions())]:
+            for attribute in attributes:
+                original = vars(owner)[attribute]
+                self._originals.append((owner, attribute, original))
+                setattr(owner, attribute, self._wrap(phase_name(owner, attribute), original))
+        events.bus.route()
+        self._started = time.perf_counter()
+
+    def disable(self):
+        """
+        Stop timing and put every original function back.
+        """
+        if not self.enabled:
+            return
+
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+        self._originals.clear()
+        events.bus.route()
+        self.elapsed += time.perf_counter() - self._started
+
+    def reset(self):
+        """
+        Forget everything recorded so far.
+        """
+        # Phases are emptied rather than replaced, as the wrappers of an enabled profiler hold on to them.
+        for phase in self.phases.values():
+            phase.__init__(phase.name)
+        self.stacks.clear()
+        self.turns = 0
+        self.elapsed = 0.0
+        if self.enabled:
+            self._started = time.perf_counter()
+
+    def stats(self):
+        """
+        :return: {'turns', 'seconds', 'turns_per_second', 'phases': {name: Phase.summary}}, times in seconds.
+        :rtype: dict
+        """
+        elapsed = self.elapsed + (time.perf_counter() - self._started if self.enabled else 0.0)
+        combat = self.phases.get('main.combat')
+        seconds = combat.total if combat and combat.calls else elapsed
+        return {'turns': self.turns,
+                'seconds': seconds,
+                'turns_per_second': self.turns / seconds if seconds else 0.0,
+                'phases': {name: phase.summary(self.turns) for name, phase in self.phases.items() if phase.calls}}
+
+    def format_stats(self):
+        """
+        :return: The stats as a table, phases with the most self time first.
+        :rtype: str
+        """
+        stats = self.stats()
+        lines = [f'{stats["turns"]:,} turns in {stats["seconds"]:.3f}s, {stats["turns_per_second"]:,.0f} turns/sec',
+                 '{:34s} {:>9s} {:>8s} {:>10s} {:>10s} {:>9s} {:>9s}'.format(
+                     'phase', 'calls', '/turn', 'total ms', 'self ms', 'p50 us', 'p99 us')]
+        for name, phase in sorted(stats['phases'].items(), key=lambda item: -item[1]['self']):
+            lines.append('{:34s} {:9,d} {:8.2f} {:10.1f} {:10.1f} {:9.1f} {:9.1f}'.format(
+                name, phase['calls'], phase['calls_per_turn'], phase['total'] * 1e3, phase['self'] * 1e3,
+                phase['p50'] * 1e6, phase['p99'] * 1e6))
+        return '\n'.join(lines)
+
+    def write_stats(self, path):
+        """
+        :param str path: JSON file to write the stats to.
+        """
+        with open(path, 'w') as stats_file:
+            json.dump(self.stats(), stats_file, indent=2)
+
+    def write_collapsed(self, path):
+        """
+        :param str path: File to write every call chain to, as 'outer;inner self_time_in_microseconds' lines.
+        """
+        with open(path, 'w') as collapsed_file:
+            for stack, seconds in sorted(self.stacks.items()):
+                collapsed_file.write(f'{";".join(stack)} {round(seconds * 1e6)}\n')
+
+
+# The profiler behind the module level functions.
+default = Profiler()
+
+
+def enable():
+    """
+    Start timing the combat loop with the default profiler.
+    """
+    default.enable()
+
+
+def disable():
+    """
+    Stop timing, the game is back to running its original functions.
+    """
+    default.disable()
+
+
+@contextmanager
+def profiled(profiler=None):
+    """
+    Time everything inside the with block.
+
+    :param Profiler|optional profiler: The profiler to use, the default one if not given.
+    """
+    profiler = profiler or default
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+
+
+def run_cprofile(path, function, *args, **kwargs):
+    """
+    Run a function under cProfile, for a view of every call rather than only the timed phases.
+
+    :param str path: Where to write the profile, readable by pstats, snakeviz, gprof2dot and the like.
+    :param function function: The function to run with the given arguments.
+    :return: What the function returned.
+    """
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(function, *args, **kwargs)
+    finally:
+        profile.dump_stats(path)
+
+
+def play_fights(fights):
+    """
+    Play fights through main.combat without any output, attacking at random and resting when exhausted.
+
+    :param int fights: Number of fights to play.
+    """
+    def decide(header, actions_dict):
+        if len(actions_dict) == 4:
+            return 1 if player.stamina > 0 else 3
+        return player.rng.randint(1, len(actions_dict))
+
+    with console.use_renderer(renderer.NullRenderer()):
+        for _ in range(fights):
+            player = character.Character('Hero')
+            main.combat(player, character.Monster('Wolf'), inputs.PolicyInput(decide))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fights', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stats', help='Write the stats to this JSON file.')
+    parser.add_argument('--collapsed', help='Write collapsed stacks for a flame graph to this file.')
+    parser.add_argument('--cprofile', help='Also play the fights under cProfile, writing its stats here.')
+    arguments = parser.parse_args()
+
+    rngs.seed(arguments.seed)
+    with profiled() as profiler:
+        play_fights(arguments.fights)
+
+    console.write(profiler.format_stats())
+    console.flush()
+
+    if arguments.stats:
+        profiler.write_stats(arguments.stats)
+    if arguments.collapsed:
+        profiler.write_collapsed(arguments.collapsed)
+    if arguments.cprofile:
+        rngs.seed(arguments.seed)
+        run_cprofile(arguments.cprofile, play_fights, arguments.fights)
@@ -0,0 +1,164 @@
+"""
+Output back ends for the console module.
+
+Every console message goes through a renderer instead of calling print() directly. Renderers collect
+the output for a turn in a frame buffer and write it out in one go when flushed, and only redraw the parts
+of the HUD that changed since the last frame.
+"""
+import sys
+import unicodedata
+from functools import lru_cache
+
+# Eighths of a block, used to draw smooth progress bars.
+BAR_BLOCKS = ' ▏▎▍▌▋▊▉█'
+BAR_EMPTY = '░'
+
+
+@lru_cache(maxsize=4096)
+def display_width(text):
+    """
+    :param str text: The text to measure.
+    :return: The number of terminal columns the text occupies, wide characters take two and combining ones none.
+    :rtype: int
+    """
+    if text.isascii():
+        return len(text)
+
+    width = 0
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+    return width
+
+
+def pad(text, width):
+    """
+    :param str text: The text to pad.
+    :param int width: The number of terminal columns to fill.
+    :return: The text padded with spaces to the given display width.
+    :rtype: str
+    """
+    return text + ' ' * max(width - display_width(text), 0)
+
+
+@lru_cache(maxsize=1024)
+def _bar(eighths, width):
+    full, partial = divmod(eighths, 8)
+    bar = BAR_BLOCKS[-1] * full
+    if full < width:
+        bar += (BAR_BLOCKS[partial] if partial else BAR_EMPTY) + BAR_EMPTY * (width - full - 1)
+    return bar
+
+
+def bar(value, maximum, width=10):
+    """
+    :param float value: The current value, eg: health.
+    :param float maximum: The value at which the bar is full.
+    :param int|optional width: The number of columns of the bar.
+    :return: A unicode bar showing how full the value is.
+    :rtype: str
+    """
+    fraction = min(max(value / maximum, 0), 1) if maximum else 0
+    return _bar(round(fraction * width * 8), width)
+
+
+class NullRenderer(object):
+    """
+    Renderer that throws everything away, for headless simulations and bots.
+    """
+
+    def write(self, text):
+        pass
+
+    def draw_hud(self, rows):
+        pass
+
+    def flush(self):
+        pass
+
+
+class RecordingRenderer(object):
+    """
+    Keeps everything written in a list rather than displaying it, eg: structured narration tokens for a log
+    pipeline to consume.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.append(text)
+
+    def draw_hud(self, rows):
+        pass
+
+    def flush(self):
+        pass
+
+
+class BufferedRenderer(object):
+    """
+    Collects the output of a turn and writes it to the stream in a single call when flushed.
+
+    In plain mode the HUD is only printed again when something on it changed. In ansi mode the HUD is pinned to
+    the top of the terminal and only the cells that changed are redrawn, with the narration scrolling beneath it.
+    """
+
+    def __init__(self, stream=None, ansi=False, column_width=30):
+        """
+        :param file|optional stream: The stream to write to, sys.stdout by default.
+        :param bool|optional ansi: If True use cursor movement to redraw the HUD in place.
+        :param int|optional column_width: The display width of every HUD cell.
+        """
+        self.stream = stream
+        self.ansi = ansi
+        self.column_width = column_width
+
+        self._buffer = []
+        self._hud = []
+
+    def write(self, text):
+        """
+        :param str text: Line of text to add to the current frame, narration tokens are rendered to text.
+        """
+        self._buffer.append(str(text))
+        self._buffer.append('\n')
+
+    def draw_hud(self, rows):
+        """
+        :param list rows: The HUD to draw, given as a list of rows, each being a list of cell strings.
+        """
+        rows = [[pad(cell, self.column_width) for cell in row] for row in rows]
+
+        if not self.ansi:
+            if rows != self._hud:
+                self._buffer.extend(''.join(row).rstrip() + '\n' for row in rows)
+
+        elif len(rows) != len(self._hud):
+            # Layout changed, clear the screen and reserve the rows beneath the HUD for scrolling text.
+            self._buffer.append('\x1b[2J\x1b[H')
+            self._buffer.extend(''.join(row) + '\n' for row in rows)
+            self._buffer.append(f'\x1b[{len(rows) + 1};r\x1b[{len(rows) + 1};1H')
+
+        else:
+            # Save the cursor, write each changed cell in place, then put the cursor back.
+            self._buffer.append('\x1b7')
+            for row_index, (row, previous) in enumerate(zip(rows, self._hud)):
+                for cell_index, cell in enumerate(row):
+                    if cell_index >= len(previous) or cell != previous[cell_index]:
+                        column = cell_index * self.column_width + 1
+                        self._buffer.append(f'\x1b[{row_index + 1};{column}H{cell}')
+            self._buffer.append('\x1b8')
+
+        self._hud = rows
+
+    def flush(self):
+        """
+        Write the current frame out to the stream.
+        """
+        if self._buffer:
+            stream = self.stream or sys.stdout
+            stream.write(''.join(self._buffer))
+            stream.flush()
+            self._buffer.clear()
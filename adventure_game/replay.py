@@ -0,0 +1,447 @@
+"""
+Recording fights and playing them back exactly, eg: to reproduce a fight a player reported.
+
+A fight is decided by the random streams of its characters and the choices the player made, so that's all a
+recording holds: the state of every character at the start, the position of the narrator's stream and every
+choice console.choose_action returned. Playing it back runs the same main.combat_steps with a ScriptedInput of the
+choices, headless unless a renderer is given, and comes out exactly as the original did.
+
+Every keyframe_interval turns the recording also takes a keyframe, a savegame file of the characters along
+with the status effects in play and the position in the choices. Seeking to a turn starts from the last keyframe
+before it and only plays the turns after that, so a seek costs the same however far into a long fight it goes.
+
+File layout, little endian:
+    header      MAGIC, version (H)
+    record      kind (B), payload length (I), payload, framed as savegame records
+    keyframe    turn (I), choice position (I), narrator seed and position written as savegame writes a stream's,
+                savegame file of a single snapshot, effects
+    choices     count (I), one byte per choice, the choices made since the record before
+    end         turn (I), the fight's final state as a savegame file of a single snapshot
+    effects     written as savegame writes a fight's effects
+Characters in the effects are their position in the snapshot.
+"""
+import argparse
+import struct
+from collections import namedtuple
+
+import console
+import effects
+import events
+import inputs
+import main
+import narration
+import renderer as renderers
+import rng as rngs
+import savegame
+
+MAGIC = b'URPL'
+VERSION = 2
+
+# Versions before this one saved the narrator's seed as an unsigned 64 bit integer (QQ), and the snapshots as bare
+# savegame records of the version of savegame before its SEED_VERSION.
+SEED_VERSION = 2
+LEGACY_SAVEGAME_HEADER = savegame.HEADER.pack(savegame.MAGIC, savegame.SEED_VERSION - 1)
+
+# Record kinds.
+KEYFRAME = 1
+CHOICES = 2
+END = 3
+
+KEYFRAME_INTERVAL = 10
+
+KEYFRAME_HEAD = struct.Struct('<II')
+LEGACY_KEYFRAME_HEAD = struct.Struct('<IIQQ')
+TURN = struct.Struct('<I')
+
+# The state of a fight at the start of a turn. Choice is the position of the turn's first choice in the recording,
+# narrator the seed and position of console.narrator's stream, snapshot a savegame file of the characters.
+Keyframe = namedtuple('Keyframe', ['turn', 'choice', 'narrator', 'snapshot', 'effects'])
+
+
+class ReplayError(Exception):
+    """
+    Raised when a recording can't be read, or doesn't play back the way it was recorded.
+    """
+
+
+class Recording(object):
+    """
+    A recorded fight: its keyframes, every choice made in it and how it ended.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        """
+        :param int|optional keyframe_interval: Turns between keyframes.
+        """
+        self.keyframe_interval = keyframe_interval
+        self.keyframes = []
+        self.choices = []
+
+        # The number of turns played and a savegame file of the characters once the fight was over, None until
+        # it is.
+        self.turns = None
+        self.end = None
+
+    def keyframe(self, turn):
+        """
+        :return: The last keyframe at or before the turn.
+        :rtype: Keyframe
+        """
+        if not self.keyframes:
+            raise ReplayError('Recording has no keyframes')
+        found = self.keyframes[0]
+        for keyframe in self.keyframes:
+            if keyframe.turn > turn:
+                break
+            found = keyframe
+        return found
+
+    # Saving
+
+    def dumps(self):
+        """
+        :return: The recording as a file.
+        :rtype: bytes
+        """
+        parts = [savegame.HEADER.pack(MAGIC, VERSION)]
+        written = 0
+        for keyframe in self.keyframes:
+            if keyframe.choice > written:
+                parts.append(choices_record(self.choices[written:keyframe.choice]))
+                written = keyframe.choice
+            parts.append(keyframe_record(keyframe))
+        if len(self.choices) > written:
+            parts.append(choices_record(self.choices[written:]))
+        if self.end is not None:
+            parts.append(savegame.record(END, TURN.pack(self.turns) + self.end))
+        return b''.join(parts)
+
+    @classmethod
+    def loads(cls, data):
+        """
+        :param bytes data: A recording written by dumps.
+        :return: The recording, up to the last complete record if the file was cut short.
+        :rtype: Recording
+        """
+        reader = savegame.Reader(data)
+        if len(data) < savegame.HEADER.size:
+            raise ReplayError('Not a recording')
+        magic, version = reader.unpack(savegame.HEADER)
+        if magic != MAGIC:
+            raise ReplayError('Not a recording')
+        if version > VERSION:
+            raise ReplayError(f'Recording version {version} is newer than this game supports ({VERSION})')
+
+        recording = cls()
+        while reader.offset + savegame.RECORD.size <= len(data):
+            kind, length = reader.unpack(savegame.RECORD)
+            if reader.offset + length > len(data):
+                break
+            payload = savegame.Reader(data[reader.offset:reader.offset + length])
+            reader.offset += length
+
+            if kind == KEYFRAME:
+                recording.keyframes.append(read_keyframe(payload, version))
+            elif kind == CHOICES:
+                count, = payload.unpack(TURN)
+                recording.choices.extend(payload.data[payload.offset:payload.offset + count])
+            elif kind == END:
+                recording.turns, = payload.unpack(TURN)
+                recording.end = payload.data[payload.offset:]
+                if version < SEED_VERSION:
+                    recording.end = LEGACY_SAVEGAME_HEADER + recording.end
+            else:
+                raise ReplayError(f'Unknown record kind {kind}')
+
+        if len(recording.keyframes) > 1:
+            recording.keyframe_interval = recording.keyframes[1].turn - recording.keyframes[0].turn
+        return recording
+
+    def save(self, path):
+        with open(path, 'wb') as recording_file:
+            recording_file.write(self.dumps())
+
+    @classmethod
+    def load(cls, path):
+        """
+        :return: The recording in the file.
+        :rtype: Recording
+        """
+        with open(path, 'rb') as recording_file:
+            return cls.loads(recording_file.read())
+
+
+def choices_record(choices):
+    """
+    :return: A record of the choices.
+    :rtype: bytes
+    """
+    return savegame.record(CHOICES, TURN.pack(len(choices)) + bytes(choices))
+
+
+def keyframe_record(keyframe):
+    """
+    :return: A record of the keyframe.
+    :rtype: bytes
+    """
+    writer = savegame.Writer()
+    narrator_seed, narrator_position = keyframe.narrator
+    writer.pack(KEYFRAME_HEAD, keyframe.turn, keyframe.choice)
+    writer.seed(narrator_seed)
+    writer.pack(savegame.POSITION, narrator_position)
+    writer.parts.append(keyframe.snapshot)
+    savegame.write_effects(writer, keyframe.effects)
+    return savegame.record(KEYFRAME, writer.getvalue())
+
+
+def read_keyframe(reader, version=VERSION):
+    """
+    :param savegame.Reader reader: Reader of a keyframe record's payload.
+    :param int|optional version: Version of the recording the record is from.
+    :rtype: Keyframe
+    """
+    if version < SEED_VERSION:
+        turn, choice, narrator_seed, narrator_position = reader.unpack(LEGACY_KEYFRAME_HEAD)
+        header = LEGACY_SAVEGAME_HEADER
+    else:
+        turn, choice = reader.unpack(KEYFRAME_HEAD)
+        narrator_seed = reader.seed()
+        narrator_position, = reader.unpack(savegame.POSITION)
+        header = b''
+
+    # The snapshot is kept as the save file it was written as, for savegame.loads.
+    start = reader.offset
+    if not header:
+        reader.unpack(savegame.HEADER)
+    _, length = reader.unpack(savegame.RECORD)
+    reader.offset += length
+    snapshot = header + reader.data[start:reader.offset]
+
+    return Keyframe(turn, choice, (narrator_seed, narrator_position), snapshot, savegame.read_effects(reader))
+
+
+def take_keyframe(turn, choice, characters, engine):
+    """
+    :return: A keyframe of the fight as it is now.
+    :rtype: Keyframe
+    """
+    narrator_stream = console.narrator.rng
+    return Keyframe(turn, choice, (narrator_stream.seed, narrator_stream.tell()),
+                    savegame.dumps(characters, turn), engine.state(characters))
+
+
+class Recorder(object):
+    """
+    Takes the keyframes of a recording. Given to main.combat_steps as its autosaver, so it's called at the start of
+    every turn.
+    """
+
+    def __init__(self, recording, engine):
+        """
+        :param Recording recording: The recording to add keyframes to.
+        :param effects.Engine engine: The status effects of the fight.
+        """
+        self.recording = recording
+        self.engine = engine
+
+    def save(self, turn, characters):
+        keyframes = self.recording.keyframes
+        if not keyframes or turn - keyframes[-1].turn >= self.recording.keyframe_interval:
+            keyframes.append(take_keyframe(turn, len(self.recording.choices), characters, self.engine))
+
+
+class Reached(Exception):
+    """
+    Raised by a Stopper to stop a fight being played at the turn it's seeking to.
+    """
+
+    def __init__(self, keyframe):
+        super().__init__(keyframe.turn)
+        self.keyframe = keyframe
+
+
+class Stopper(object):
+    """
+    Stops a fight at the start of a turn, taking a keyframe of it there. Given to main.combat_steps as its autosaver.
+    """
+
+    def __init__(self, turn, engine, choice, provider):
+        """
+        :param int turn: The turn to stop at.
+        :param effects.Engine engine: The status effects of the fight.
+        :param int choice: Position in the recording's choices the fight is being played from.
+        :param CountingInput provider: Where the choices are coming from.
+        """
+        self.turn = turn
+        self.engine = engine
+        self.choice = choice
+        self.provider = provider
+
+    def save(self, turn, characters):
+        if turn >= self.turn:
+            raise Reached(take_keyframe(turn, self.choice + self.provider.used, characters, self.engine))
+
+
+class CountingInput(inputs.ScriptedInput):
+    """
+    Plays back recorded choices, keeping count of how many it gave. Going back in a menu is recorded as 0, the way
+    console.choose_action returns it, and answered with the option after the menu's last action.
+    """
+
+    def __init__(self, choices):
+        super().__init__(choices)
+        self.used = 0
+
+    def read(self, header, actions_dict):
+        answer = super().read(header, actions_dict)
+        self.used += 1
+        return answer or len(actions_dict) + 1
+
+
+def record(player, enemy, provider=None, keyframe_interval=KEYFRAME_INTERVAL):
+    """
+    Fight, the same as main.combat, recording everything needed to play the fight back.
+
+    :param class|optional provider: Where the player's decisions come from, console.input_provider by default.
+    :param int|optional keyframe_interval: Turns between keyframes.
+    :return: The recording.
+    :rtype: Recording
+    """
+    recording = Recording(keyframe_interval)
+    engine = effects.Engine()
+    steps = main.combat_steps(player, enemy, autosaver=Recorder(recording, engine), engine=engine)
+
+    choice = None
+    try:
+        while True:
+            prompt = steps.send(choice)
+            choice = console.choose_action(*prompt, provider=provider)
+            recording.choices.append(choice)
+    except StopIteration as stop:
+        recording.turns = stop.value
+    recording.end = savegame.dumps([player, enemy], recording.turns)
+    return recording
+
+
+def restore(keyframe):
+    """
+    :return: The characters of the keyframe and an engine with its status effects.
+    :rtype: tuple
+    """
+    _, characters = savegame.loads(keyframe.snapshot)
+    engine = effects.Engine()
+    engine.restore(keyframe.effects, characters)
+    return characters, engine
+
+
+def play(recording, keyframe, until=None, renderer=None):
+    """
+    Play a recording from one of its keyframes.
+
+    :param Recording recording: The recording to play.
+    :param Keyframe keyframe: Where to play it from.
+    :param int|optional until: Stop at the start of this turn, rather than playing the fight out.
+    :param class|optional renderer: Where the fight is narrated to, it's played headless if not given.
+    :return: The turn it stopped at, the characters and the engine with their status effects. The characters are
+             as the fight left them if it was played out, the engine is then empty.
+    :rtype: tuple
+    """
+    characters, engine = restore(keyframe)
+    if keyframe.turn == until:
+        return keyframe.turn, characters, engine
+
+    provider = CountingInput(recording.choices[keyframe.choice:])
+    stopper = Stopper(until, engine, keyframe.choice, provider) if until is not None else None
+
+    previous_narrator = console.narrator
+    if renderer is not None:
+        narrator_stream = rngs.RandomStream(keyframe.narrator[0])
+        narrator_stream.seek(keyframe.narrator[1])
+        console.narrator = narration.Narrator(structured=previous_narrator.structured, rng=narrator_stream)
+
+    headless = renderer is None and events.console_sink in events.bus.sinks
+    if headless:
+        events.bus.unsubscribe(events.console_sink)
+    try:
+        with console.use_renderer(renderer or renderers.NullRenderer()):
+            turns = main.run(main.combat_steps(*characters, keyframe.turn, stopper, engine), provider)
+    except Reached as reached:
+        characters, engine = restore(reached.keyframe)
+        return reached.keyframe.turn, characters, engine
+    except inputs.InputExhausted:
+        raise ReplayError('The recording ran out of choices before the fight was over') from None
+    finally:
+        console.narrator = previous_narrator
+        if headless:
+            events.bus.subscribe(events.console_sink)
+    return turns, characters, engine
+
+
+def replay(recording, renderer=None):
+    """
+    Play a recording from the start to the end of the fight.
+
+    :param class|optional renderer: Where the fight is narrated to, it's played headless if not given.
+    :return: The number of turns played and the characters as the fight left them.
+    :rtype: tuple
+    """
+    turns, characters, _ = play(recording, recording.keyframes[0], renderer=renderer)
+    return turns, characters
+
+
+def seek(recording, turn):
+    """
+    Get the state of a recorded fight at the start of a turn, playing it from the last keyframe before the turn.
+
+    :param Recording recording: The recording to seek in.
+    :param int turn: The turn to seek to, the fight is played out if it was over before then.
+    :return: The turn reached, the characters at the start of it and the engine with their status effects. The
+             fight can be carried on from there with main.combat_steps(*characters, turn, engine=engine).
+    :rtype: tuple
+    """
+    return play(recording, recording.keyframe(turn), until=turn)
+
+
+def verify(recording):
+    """
+    :return: True if playing the recording back ends the fight exactly as it ended when it was recorded, which
+             fails once the rules of the game have changed since.
+    :rtype: bool
+    """
+    if recording.end is None:
+        raise ReplayError('Recording is of a fight that never finished')
+    turns, characters = replay(recording)
+    return ended_as_recorded(recording, turns, characters)
+
+
+def ended_as_recorded(recording, turns, characters):
+    """
+    :param int turns: The number of turns a playback of the recording took.
+    :param list characters: The characters as the playback left them.
+    :return: True if the playback ended the same as the recorded fight.
+    :rtype: bool
+    """
+    # Compared by state rather than the bytes of the save, which can be in an older version of the save format.
+    ended_turn, ended = savegame.loads(recording.end)
+    return turns == recording.turns == ended_turn and \
+        list(map(savegame.character_state, characters)) == list(map(savegame.character_state, ended))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', help='The recording file to play back.')
+    parser.add_argument('--turn', type=int, help='Seek to this turn and show the state of the fight there.')
+    parser.add_argument('--narrate', action='store_true', help='Narrate the whole fight as it was first played.')
+    arguments = parser.parse_args()
+
+    loaded = Recording.load(arguments.recording)
+    if arguments.turn is not None:
+        reached_turn, fighters, _ = seek(loaded, arguments.turn)
+        console.write(f'Turn {reached_turn}')
+        console.draw_hud(fighters)
+        console.flush()
+    else:
+        final_turn, fighters = replay(loaded, console.renderer if arguments.narrate else None)
+        same = ended_as_recorded(loaded, final_turn, fighters)
+        console.write(f'Fight over after {final_turn} turns, {"as" if same else "NOT as"} recorded')
+        console.flush()
@@ -0,0 +1,190 @@
+"""
+Seeded random number streams.
+
+Every character, narrator and simulation draws from its own RandomStream rather than the global random module,
+so a fight can be reproduced exactly from its seeds. Streams hand out numbers from a buffer that is refilled in
+large batches, which keeps each roll down to an index lookup and a multiply.
+"""
+import random
+from itertools import repeat
+
+DEFAULT_BUFFER_SIZE = 4096
+
+# The first buffer is small, as most characters only live for a handful of rolls. Each refill doubles it.
+INITIAL_BUFFER_SIZE = 32
+
+
+class RandomStream(object):
+    """
+    A reproducible stream of random numbers with the parts of the random module's interface the game uses.
+    """
+    __slots__ = ('seed', 'buffer_size', '_random', '_buffer', '_size', '_index', '_fill_state', '_generated')
+
+    def __init__(self, seed=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        :param int|optional seed: Seed for the stream, a random one is picked if not given.
+        :param int|optional buffer_size: The most numbers to generate each time the buffer runs out.
+        """
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.buffer_size = buffer_size
+
+        # Nothing is generated, or even seeded, until the first draw.
+        self._random = None
+        self._buffer = []
+        self._size = 0
+        self._index = 0
+        self._fill_state = None
+
+        # How many numbers were generated before the current buffer.
+        self._generated = 0
+
+    def _fill(self, size=None):
+        self._generated += self._size
+
+        # The state before generating is kept so the buffer can be rebuilt by setstate. The first buffer is rebuilt
+        # from the seed instead, copying out the state costs more than generating the buffer does.
+        if self._random is None:
+            self._random = random.Random(self.seed)
+            self._fill_state = None
+        else:
+            self._fill_state = self._random.getstate()
+        self._size = size or min(max(self._size * 2, INITIAL_BUFFER_SIZE), self.buffer_size)
+        self._buffer = [value() for value in repeat(self._random.random, self._size)]
+        self._index = 0
+
+    def random(self):
+        """
+        :return: The next float in the range [0, 1).
+        :rtype: float
+        """
+        index = self._index
+        if index == self._size:
+            self._fill()
+            index = 0
+        self._index = index + 1
+        return self._buffer[index]
+
+    def randint(self, a, b):
+        """
+        This is the hot path of every fight, so the buffer lookup is inlined rather than calling self.random().
+        Bounds are truncated to whole numbers first, the way simulation.py and solver.py work out damage ranges.
+
+        :param int a: Lowest value to return.
+        :param int b: Highest value to return.
+        :return: A random integer N such that int(a) <= N <= int(b).
+        :rtype: int
+        """
+        a = int(a)
+        index = self._index
+        if index == self._size:
+            self._fill()
+            index = 0
+        self._index = index + 1
+        return int(a + self._buffer[index] * (int(b) - a + 1))
+
+    def randoms(self, count):
+        """
+        Draw a batch of numbers at once, straight out of the buffer.
+
+        :param int count: How many numbers to draw.
+        :return: The next count floats in the range [0, 1), the same ones count calls to random() would return.
+        :rtype: list
+        """
+        drawn = self._buffer[self._index:self._index + count]
+        self._index += len(drawn)
+        while len(drawn) < count:
+            self._fill()
+            self._index = min(count - len(drawn), self._size)
+            drawn += self._buffer[:self._index]
+        return drawn
+
+    def randrange(self, stop):
+        """
+        :param int stop: The number of values to choose from.
+        :return: A random integer N such that 0 <= N < stop.
+        :rtype: int
+        """
+        return int(self.random() * stop)
+
+    def choice(self, sequence):
+        """
+        :param list sequence: The sequence to choose from.
+        :return: A random element of the sequence.
+        """
+        return sequence[int(self.random() * len(sequence))]
+
+    def spawn(self):
+        """
+        :return: A new independent stream, seeded from this one.
+        :rtype: RandomStream
+        """
+        return RandomStream(int(self.random() * 2 ** 53), self.buffer_size)
+
+    def getstate(self):
+        """
+        :return: Everything needed to continue this exact stream later on.
+        :rtype: tuple
+        """
+        return self.seed, self._fill_state, self._size, self._index, self._generated
+
+    def setstate(self, state):
+        """
+        :param tuple state: A state previously returned by getstate.
+        """
+        self.seed, fill_state, size, index, generated = state
+        self._random = None
+        self._buffer = []
+        self._fill_state = None
+        self._size = self._index = self._generated = 0
+
+        if size:
+            if fill_state is not None:
+                self._random = random.Random()
+                self._random.setstate(fill_state)
+            self._fill(size)
+            self._index = index
+            self._generated = generated
+
+    def tell(self):
+        """
+        :return: How many numbers have been drawn from the stream, which with the seed is all there is to its state.
+        :rtype: int
+        """
+        return self._generated + self._index
+
+    def seek(self, position):
+        """
+        Rewind the stream to its seed and skip ahead, so the next number drawn is the one after position.
+        Skipping costs about as much as drawing the numbers did, which is little for the length of a fight.
+
+        :param int position: A position previously returned by tell.
+        """
+        self._random = random.Random(self.seed)
+        skip = self._random.random
+        for _ in repeat(None, position):
+            skip()
+
+        self._size = 0
+        self._generated = position
+        self._fill()
+
+
+# Root stream that every stream without an explicit seed is spawned from.
+default = RandomStream()
+
+
+def seed(value):
+    """
+    Reseed the root stream, making every stream spawned from here on reproducible.
+
+    :param int value: The seed to use.
+    """
+    default.setstate((value, None, 0, 0, 0))
+
+
+def spawn():
+    """
+    :return: A new stream seeded from the root stream.
+    :rtype: RandomStream
+    """
+    return default.spawn()
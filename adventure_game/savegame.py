@@ -0,0 +1,526 @@
+"""
+Saving and loading games in a compact, versioned binary format.
+
+A save file is a header followed by records. A snapshot record holds the full state of every character in the
+game: their class, name, stats, extra attributes, inventory, equipped items and the position of their random
+stream, along with the turn number and the status effects of the fight they're in. A delta record holds only what
+changed on each character since the record before it, and the effects if they changed. Loading takes the snapshot
+and replays the deltas after it. Saved stats include any buffs, so loaded characters in a fight are attached to an
+effects.Engine restored from the record, which takes the buffs off again when they run out.
+
+The Autosaver writes a delta every turn and starts the file over with a fresh snapshot every snapshot_interval
+turns, so a file never holds more than one snapshot and a handful of small deltas.
+
+Items are saved by their catalog id and random streams by their seed and position (see RandomStream.tell),
+so a snapshot of a fight between two characters is around 250 bytes and the delta for each turn under 100.
+
+Layout, all little endian:
+    header      MAGIC, version (H)
+    record      kind (B), payload length (I), payload
+    snapshot    turn (I), character count (B), then per character: class name, name and every part below,
+                then effects
+    parts       alive (B), health, strength, stamina and luck, rng seed and position (Q), inventory slots as
+                item id and count (H) with '' for an empty slot, equipped slots (H), extra attributes
+    delta       turn (I), changed character count (B), then per character: index (B), flags (B), the parts
+                of the character the flags mark as changed, then whether the effects changed (B) and if so effects
+    effects     time (I), active count (H) then per effect: effect id, target (B), stacks (H), expires (I) and
+                source (B), due count (H) then per entry: effect id, due (I), action (B) and target (B)
+Strings are a length (H) and UTF-8, numbers a type code (B) and either q or d. Seeds can be any int, so they're a
+length (H) and the seed as a signed little endian integer of that many bytes. Characters in the effects are their
+position in the record, NO_SOURCE for an effect without a source.
+"""
+import struct
+from functools import lru_cache
+
+import catalog
+import character
+import effects
+import rng as rngs
+
+MAGIC = b'URPG'
+VERSION = 4
+
+# Versions before this one saved inventories as {category: {slot: item id}} and equipped items by id.
+INVENTORY_VERSION = 2
+
+# Versions before this one saved seeds as an unsigned 64 bit integer, along with the position (QQ).
+SEED_VERSION = 3
+
+# Versions before this one didn't save status effects.
+EFFECTS_VERSION = 4
+
+HEADER = struct.Struct('<4sH')
+RECORD = struct.Struct('<BI')
+TURN = struct.Struct('<IB')
+CHANGE = struct.Struct('<BB')
+FLAG = struct.Struct('<B')
+LENGTH = struct.Struct('<H')
+RNG = struct.Struct('<QQ')
+POSITION = struct.Struct('<Q')
+INTEGER = struct.Struct('<Bq')
+FLOAT = struct.Struct('<Bd')
+TIME = struct.Struct('<I')
+EFFECT = struct.Struct('<BHIB')
+DUE = struct.Struct('<IBB')
+
+NO_SOURCE = 0xFF
+
+# Record kinds.
+SNAPSHOT = 1
+DELTA = 2
+
+# Parts of a character, as flags. A snapshot sets all of them.
+ALIVE = 1
+HEALTH = 2
+STRENGTH = 4
+STAMINA = 8
+LUCK = 16
+RNG_POSITION = 32
+ITEMS = 64
+EXTRA = 128
+ALL_PARTS = 255
+
+STATS = ((HEALTH, 'health'), (STRENGTH, 'strength'), (STAMINA, 'stamina'), (LUCK, 'luck'))
+
+# Classes that can be loaded, by name. Characters of other classes have to be registered before being saved.
+CLASSES = {cls.__name__: cls for cls in (character.Character, character.Monster)}
+
+
+class SaveError(Exception):
+    """
+    Raised when a save file can't be read, eg: it's from a newer version of the game.
+    """
+
+
+def register(cls):
+    """
+    Make characters of a class loadable. Can be used as a class decorator.
+
+    :param class cls: A Character subclass. Any slots it adds must hold strings.
+    :return: The class.
+    """
+    CLASSES[cls.__name__] = cls
+    return cls
+
+
+@lru_cache(maxsize=None)
+def extra_slots(cls):
+    """
+    :return: The slots a Character subclass adds on top of Character's own, eg: ('info',) for a Monster.
+    :rtype: tuple
+    """
+    slots = []
+    for base in reversed(cls.__mro__):
+        if issubclass(base, character.Character) and base is not character.Character:
+            slots.extend(base.__dict__.get('__slots__', ()))
+    return tuple(slots)
+
+
+class Writer(object):
+    """
+    Builds up a record payload.
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def string(self, text):
+        encoded = text.encode('utf-8')
+        self.parts.append(LENGTH.pack(len(encoded)))
+        self.parts.append(encoded)
+
+    def number(self, value):
+        # Whole numbers stay ints, so a loaded character prints its stats exactly as before it was saved.
+        if type(value) is int:
+            self.parts.append(INTEGER.pack(0, value))
+        else:
+            self.parts.append(FLOAT.pack(1, value))
+
+    def seed(self, value):
+        encoded = value.to_bytes(value.bit_length() // 8 + 1, 'little', signed=True)
+        self.parts.append(LENGTH.pack(len(encoded)))
+        self.parts.append(encoded)
+
+    def pack(self, record, *values):
+        self.parts.append(record.pack(*values))
+
+    def getvalue(self):
+        return b''.join(self.parts)
+
+
+class Reader(object):
+    """
+    Reads back the values a Writer wrote, in the same order.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, record):
+        values = record.unpack_from(self.data, self.offset)
+        self.offset += record.size
+        return values
+
+    def string(self):
+        length, = self.unpack(LENGTH)
+        text = self.data[self.offset:self.offset + length].decode('utf-8')
+        self.offset += length
+        return text
+
+    def number(self):
+        kind = self.data[self.offset]
+        return self.unpack(INTEGER if kind == 0 else FLOAT)[1]
+
+    def seed(self):
+        length, = self.unpack(LENGTH)
+        value = int.from_bytes(self.data[self.offset:self.offset + length], 'little', signed=True)
+        self.offset += length
+        return value
+
+
+def character_state(game_character):
+    """
+    :param class game_character: The character to take the state of.
+    :return: A comparable tuple of each part of the character, in the order of the part flags.
+    :rtype: tuple
+    """
+    # Items are kept as the shared catalog definitions, which compare by identity first, and only turned into
+    # ids when written. The inventory keeps its state until something in it changes.
+    stream = game_character.rng
+    extra = extra_slots(type(game_character))
+    return (game_character.alive, game_character.health, game_character.strength, game_character.stamina,
+            game_character.luck, (stream.seed, stream.tell()), game_character.inventory.state(),
+            tuple([getattr(game_character, slot) for slot in extra]) if extra else ())
+
+
+def changed_parts(previous, current):
+    """
+    :return: The flags of every part that differs between two character states.
+    :rtype: int
+    """
+    flags = 0
+    flag = 1
+    for old, new in zip(previous, current):
+        if old != new:
+            flags |= flag
+        flag <<= 1
+    return flags
+
+
+def write_parts(writer, state, flags):
+    """
+    Write the parts of a character state marked by flags.
+    """
+    alive, health, strength, stamina, luck, (seed, position), (slots, equipped), extra = state
+    if flags & ALIVE:
+        writer.pack(FLAG, alive)
+    for flag, value in ((HEALTH, health), (STRENGTH, strength), (STAMINA, stamina), (LUCK, luck)):
+        if flags & flag:
+            writer.number(value)
+    if flags & RNG_POSITION:
+        writer.seed(seed)
+        writer.pack(POSITION, position)
+    if flags & ITEMS:
+        writer.pack(LENGTH, len(slots))
+        for stack in slots:
+            writer.string(stack.item['item_name'] if stack else '')
+            writer.pack(LENGTH, stack.count if stack else 0)
+        writer.pack(FLAG, len(equipped))
+        for slot in equipped:
+            writer.pack(LENGTH, slot)
+    if flags & EXTRA:
+        for value in extra:
+            writer.string(value)
+
+
+def read_items(reader, game_character, version):
+    """
+    Replace a character's inventory with the one in a record.
+    """
+    if version < INVENTORY_VERSION:
+        items = []
+        for _ in range(reader.unpack(FLAG)[0]):
+            reader.string()
+            for _ in range(reader.unpack(LENGTH)[0]):
+                reader.unpack(LENGTH)
+                items.append(catalog.item(reader.string()))
+        equipped = [catalog.item(reader.string()) for _ in range(reader.unpack(FLAG)[0])]
+
+        game_character.inventory.restore([(item, 1) for item in items], ())
+        game_character.equipped = equipped
+        return
+
+    slots = []
+    for _ in range(reader.unpack(LENGTH)[0]):
+        item_id = reader.string()
+        count, = reader.unpack(LENGTH)
+        slots.append((catalog.item(item_id), count) if item_id else None)
+    equipped = [reader.unpack(LENGTH)[0] for _ in range(reader.unpack(FLAG)[0])]
+    game_character.inventory.restore(slots, equipped)
+
+
+def read_parts(reader, game_character, flags, version=VERSION):
+    """
+    Apply the parts marked by flags to a character. Seeking a random stream means replaying it from the start,
+    so that's left to the caller to do once all records are read.
+
+    :param int|optional version: Version of the save file the record is from.
+
+    :return: The seed and position of the character's random stream if they were part of the record, else None.
+    :rtype: tuple
+    """
+    stream = None
+    if flags & ALIVE:
+        game_character.alive = bool(reader.unpack(FLAG)[0])
+    for flag, attribute in STATS:
+        if flags & flag:
+            setattr(game_character, attribute, reader.number())
+    if flags & RNG_POSITION:
+        stream = reader.unpack(RNG) if version < SEED_VERSION else (reader.seed(), reader.unpack(POSITION)[0])
+    if flags & ITEMS:
+        read_items(reader, game_character, version)
+    if flags & EXTRA:
+        for slot in extra_slots(type(game_character)):
+            setattr(game_character, slot, reader.string())
+    return stream
+
+
+def effects_state(characters):
+    """
+    :param list characters: Every character in the game.
+    :return: The Engine.state of the fight the characters are in, None if they're not in one or no effects are active.
+    :rtype: tuple
+    """
+    for game_character in characters:
+        engine = game_character.effects
+        if engine is not None:
+            return engine.state(characters) if engine.active else None
+    return None
+
+
+def write_effects(writer, state):
+    """
+    Write an Engine.state, or no effects for None.
+    """
+    time, active, due = state or (0, (), ())
+    writer.pack(TIME, time)
+    writer.pack(LENGTH, len(active))
+    for target, effect_id, stacks, expires, source in active:
+        writer.string(effect_id)
+        writer.pack(EFFECT, target, stacks, expires, NO_SOURCE if source is None else source)
+    writer.pack(LENGTH, len(due))
+    for when, action, target, effect_id in due:
+        writer.string(effect_id)
+        writer.pack(DUE, when, action, target)
+
+
+def read_effects(reader):
+    """
+    :return: The Engine.state write_effects wrote.
+    :rtype: tuple
+    """
+    time, = reader.unpack(TIME)
+    active = []
+    for _ in range(reader.unpack(LENGTH)[0]):
+        effect_id = reader.string()
+        target, stacks, expires, source = reader.unpack(EFFECT)
+        active.append((target, effect_id, stacks, expires, None if source == NO_SOURCE else source))
+    due = []
+    for _ in range(reader.unpack(LENGTH)[0]):
+        effect_id = reader.string()
+        when, action, target = reader.unpack(DUE)
+        due.append((when, action, target, effect_id))
+    return time, tuple(active), tuple(due)
+
+
+def record(kind, payload):
+    """
+    :return: The payload framed as a record of the given kind.
+    :rtype: bytes
+    """
+    return RECORD.pack(kind, len(payload)) + payload
+
+
+def snapshot(turn, characters, states=None, fight_effects=None):
+    """
+    :param int turn: The turn number.
+    :param list characters: Every character in the game.
+    :param list|optional states: Their character_state, if already taken.
+    :param tuple|optional fight_effects: Their effects_state, taken now if states aren't given.
+    :return: A snapshot record of the characters and their effects.
+    :rtype: bytes
+    """
+    writer = Writer()
+    writer.pack(TURN, turn, len(characters))
+    for game_character, state in zip(characters, states or map(character_state, characters)):
+        if type(game_character).__name__ not in CLASSES:
+            raise SaveError(f'{type(game_character).__name__} has not been registered with savegame.register')
+        writer.string(type(game_character).__name__)
+        writer.string(game_character.name)
+        write_parts(writer, state, ALL_PARTS)
+    write_effects(writer, fight_effects if states else effects_state(characters))
+    return record(SNAPSHOT, writer.getvalue())
+
+
+def delta(turn, previous, current, previous_effects=None, current_effects=None):
+    """
+    :param int turn: The turn number.
+    :param list previous: The character_state of every character when the last record was written.
+    :param list current: Their character_state now.
+    :param tuple|optional previous_effects: Their effects_state when the last record was written.
+    :param tuple|optional current_effects: Their effects_state now.
+    :return: A delta record of what changed.
+    :rtype: bytes
+    """
+    changes = [(index, changed_parts(old, new), new) for index, (old, new) in enumerate(zip(previous, current))]
+    changes = [change for change in changes if change[1]]
+
+    writer = Writer()
+    writer.pack(TURN, turn, len(changes))
+    for index, flags, state in changes:
+        writer.pack(CHANGE, index, flags)
+        write_parts(writer, state, flags)
+    effects_changed = previous_effects != current_effects
+    writer.pack(FLAG, effects_changed)
+    if effects_changed:
+        write_effects(writer, current_effects)
+    return record(DELTA, writer.getvalue())
+
+
+def dumps(characters, turn=0):
+    """
+    :param list characters: Every character in the game.
+    :param int|optional turn: The turn number.
+    :return: A complete save file.
+    :rtype: bytes
+    """
+    return HEADER.pack(MAGIC, VERSION) + snapshot(turn, characters)
+
+
+def loads(data):
+    """
+    :param bytes data: A save file, either written whole by dumps or by an Autosaver.
+    :return: The turn number and the list of characters, as of the last complete record. If they were in a fight
+             with effects active, they're attached to an effects.Engine carrying those on.
+    :rtype: tuple
+    """
+    reader = Reader(data)
+    if len(data) < HEADER.size:
+        raise SaveError('Not a save file')
+    magic, version = reader.unpack(HEADER)
+    if magic != MAGIC:
+        raise SaveError('Not a save file')
+    if version > VERSION:
+        raise SaveError(f'Save file version {version} is newer than this game supports ({VERSION})')
+
+    turn, characters, streams, fight_effects = 0, None, {}, None
+    while reader.offset + RECORD.size <= len(data):
+        kind, length = reader.unpack(RECORD)
+        if reader.offset + length > len(data):
+            # The game stopped part way through writing this record, the ones before it still stand.
+            break
+
+        payload = Reader(data[reader.offset:reader.offset + length])
+        reader.offset += length
+
+        if kind == SNAPSHOT:
+            turn, count = payload.unpack(TURN)
+            characters, streams = [], {}
+            for index in range(count):
+                cls = CLASSES.get(payload.string())
+                if cls is None:
+                    raise SaveError('Save file contains a character class that has not been registered')
+                game_character = cls(payload.string(), rng=rngs.RandomStream(0))
+                streams[index] = read_parts(payload, game_character, ALL_PARTS, version)
+                characters.append(game_character)
+            fight_effects = read_effects(payload) if version >= EFFECTS_VERSION else None
+
+        elif kind == DELTA:
+            if characters is None:
+                raise SaveError('Save file has a delta before any snapshot')
+            turn, count = payload.unpack(TURN)
+            for _ in range(count):
+                index, flags = payload.unpack(CHANGE)
+                streams[index] = read_parts(payload, characters[index], flags, version) or streams[index]
+            if version >= EFFECTS_VERSION and payload.unpack(FLAG)[0]:
+                fight_effects = read_effects(payload)
+
+        else:
+            raise SaveError(f'Unknown record kind {kind}')
+
+    if characters is None:
+        raise SaveError('Save file has no snapshot')
+
+    for index, (seed, position) in streams.items():
+        characters[index].rng = rngs.RandomStream(seed)
+        characters[index].rng.seek(position)
+    if fight_effects and fight_effects[1]:
+        engine = effects.Engine()
+        engine.restore(fight_effects, characters)
+        engine.attach(*characters)
+    return turn, characters
+
+
+def save(path, characters, turn=0):
+    """
+    Write a save file containing a single snapshot.
+    """
+    with open(path, 'wb') as save_file:
+        save_file.write(dumps(characters, turn))
+
+
+def load(path):
+    """
+    :return: The turn number and the list of characters from a save file.
+    :rtype: tuple
+    """
+    with open(path, 'rb') as save_file:
+        return loads(save_file.read())
+
+
+class Autosaver(object):
+    """
+    Saves a game every turn, writing only what changed since the last turn.
+    """
+
+    def __init__(self, stream, snapshot_interval=25):
+        """
+        :param file stream: Seekable binary stream to save to, eg: open(path, 'w+b')
+        :param int|optional snapshot_interval: Turns between full snapshots, the file is started over at each one.
+        """
+        self.stream = stream
+        self.snapshot_interval = snapshot_interval
+        self.bytes_written = 0
+
+        self._states = None
+        self._effects = None
+        self._turn = None
+        self._snapshot_turn = None
+
+    def save(self, turn, characters):
+        """
+        :param int turn: The turn number.
+        :param list characters: Every character in the game, always in the same order.
+        """
+        states = [character_state(game_character) for game_character in characters]
+        fight_effects = effects_state(characters)
+        if turn == self._turn and states == self._states and fight_effects == self._effects:
+            # Nothing happened, eg: the player backed out of a menu.
+            return
+
+        if self._states is None or len(states) != len(self._states) or \
+                turn - self._snapshot_turn >= self.snapshot_interval:
+            data = HEADER.pack(MAGIC, VERSION) + snapshot(turn, characters, states, fight_effects)
+            self.stream.seek(0)
+            self.stream.truncate()
+            self._snapshot_turn = turn
+        else:
+            data = delta(turn, self._states, states, self._effects, fight_effects)
+
+        self.stream.write(data)
+        self.stream.flush()
+        self.bytes_written += len(data)
+        self._states = states
+        self._effects = fight_effects
+        self._turn = turn
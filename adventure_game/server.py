@@ -0,0 +1,228 @@
+"""
+Line based game server hosting many fights in one process.
+
+Each connection gets its own hero and monster and plays main.combat_steps as a coroutine. Output for a
+session is collected by its own BufferedRenderer and written to the socket once per prompt, and the session
+waits for the socket to drain before carrying on, so a slow client only ever holds up its own fight.
+
+Protocol: The server sends lines of text. A line containing only PROMPT means it is waiting for the player's
+answer, which is sent back as a single line. The connection is closed once the fight is over.
+
+Run with: python server.py [--host 127.0.0.1] [--port 8023]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import signal
+
+import character
+import console
+import main
+import renderer
+import savegame
+
+PROMPT = '?>'
+
+# Bytes buffered for a client before the session waits for it to catch up.
+HIGH_WATER = 64 * 1024
+LOW_WATER = 16 * 1024
+
+# Connections that can wait to be accepted, large enough for bursts of players connecting at once.
+BACKLOG = 4096
+
+
+class SessionStream(object):
+    """
+    File-like adapter that lets a BufferedRenderer write straight into a StreamWriter.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, text):
+        self.writer.write(text.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+
+class Session(object):
+    """
+    One player's connection and fight.
+    """
+    # Players are told when an answer is wrong rather than the session giving up, see console.invalid_choice.
+    echo = True
+
+    def __init__(self, reader, writer, monster_class=character.Monster, autosaver=None):
+        """
+        :param StreamReader reader: Where the player's answers are read from.
+        :param StreamWriter writer: Where the game's output is written to.
+        :param class|optional monster_class: The monster the player will fight.
+        :param Autosaver|optional autosaver: If given, the fight is saved with it every turn.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.renderer = renderer.BufferedRenderer(SessionStream(writer))
+        self.autosaver = autosaver
+
+        self.hero = character.Character('Player')
+        self.monster = monster_class('Wolf')
+
+    async def send(self):
+        """
+        Write the session's pending output, then wait until the client has taken enough of it.
+        """
+        self.renderer.flush()
+        await self.writer.drain()
+
+    async def answer(self, prompt):
+        """
+        :param Prompt prompt: The decision the player has to make.
+        :return: The chosen index, or None if the player disconnected.
+        :rtype: int
+        """
+        while True:
+            self.renderer.write(PROMPT)
+            await self.send()
+
+            line = await self.reader.readline()
+            if not line:
+                return None
+
+            choice = console.parse_choice(line.decode('utf-8', 'replace').strip(), prompt.actions_dict, prompt.back)
+            if choice is not None:
+                return choice
+
+            with console.use_renderer(self.renderer):
+                console.invalid_choice(self, line, prompt.actions_dict, prompt.back)
+
+    async def play(self):
+        """
+        Run the fight until it's over or the player leaves.
+        """
+        steps = main.combat_steps(self.hero, self.monster, autosaver=self.autosaver)
+        choice = None
+
+        while True:
+            # The rules only ever run between awaits, so the console can safely point at this session meanwhile.
+            with console.use_renderer(self.renderer):
+                try:
+                    prompt = steps.send(choice)
+                except StopIteration:
+                    break
+                console.present_actions(*prompt)
+
+            choice = await self.answer(prompt)
+            if choice is None:
+                steps.close()
+                return
+
+        await self.send()
+
+
+class GameServer(object):
+    """
+    Accepts connections and runs a Session for each of them.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8023, save_dir=None):
+        """
+        :param str|optional host: Interface to listen on.
+        :param int|optional port: Port to listen on, 0 picks a free one.
+        :param str|optional save_dir: If given, every session autosaves its fight to a file in this directory.
+        """
+        self.host = host
+        self.port = port
+        self.save_dir = save_dir
+        self.sessions = set()
+        self.completed = 0
+        self._server = None
+
+        # Save files of fights that finished, reused by new sessions so files aren't created for every one.
+        # Files of fights the player left part way through are kept, so they can be picked up again.
+        self._slot_numbers = itertools.count()
+        self._free_slots = []
+
+    def _open_slot(self):
+        if self._free_slots:
+            return self._free_slots.pop()
+        return open(os.path.join(self.save_dir, f'slot-{next(self._slot_numbers)}.sav'), 'w+b')
+
+    async def handle(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=HIGH_WATER, low=LOW_WATER)
+        task = asyncio.current_task()
+        self.sessions.add(task)
+
+        save_file = self._open_slot() if self.save_dir else None
+        finished = False
+        try:
+            session = Session(reader, writer, autosaver=savegame.Autosaver(save_file) if save_file else None)
+            await session.play()
+            finished = not (session.hero.alive and session.monster.alive)
+            if finished:
+                self.completed += 1
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions.discard(task)
+            writer.close()
+            if save_file:
+                if finished:
+                    self._free_slots.append(save_file)
+                else:
+                    save_file.close()
+
+    async def start(self):
+        """
+        Start listening, the port actually used is stored on self.port.
+        """
+        self._server = await asyncio.start_server(self.handle, self.host, self.port, backlog=BACKLOG)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Stop accepting players, end every running session and wait for them to finish.
+        """
+        self._server.close()
+
+        sessions = list(self.sessions)
+        for task in sessions:
+            task.cancel()
+        await asyncio.gather(*sessions, return_exceptions=True)
+
+        for save_file in self._free_slots:
+            save_file.close()
+        self._free_slots.clear()
+
+        await self._server.wait_closed()
+
+    async def serve(self):
+        """
+        Serve until interrupted with SIGINT or SIGTERM, then shut down cleanly.
+        """
+        await self.start()
+        console.write(f'Serving on {self.host}:{self.port}')
+        console.flush()
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Not supported on this platform, ctrl+c will still interrupt the loop.
+                pass
+
+        await stop.wait()
+        await self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8023)
+    parser.add_argument('--save-dir', help='Autosave every session to a file in this directory.')
+    arguments = parser.parse_args()
+
+    asyncio.run(GameServer(arguments.host, arguments.port, arguments.save_dir).serve())
@@ -0,0 +1,280 @@
+"""
+Headless combat simulation used for balancing.
+
+The rules here mirror Character.perform_attack, Character.__deal_damage, Character.rest and
+Monster.choose_combat_action exactly, but operate on plain numbers instead of character objects and never
+touch the console. Critical hits are included, status effects are not: fights are simulated without on-hit
+effects, blocking or consumables. This lets a balance run play out hundreds of thousands of fights in the time it takes
+main.combat() to print a handful.
+"""
+from collections import Counter
+
+import ai
+import effects
+import rng as rngs
+
+# Action returned by a policy when the combatant wants to rest instead of attack.
+REST = ai.REST
+
+# Outcomes of a single simulated fight.
+HERO_WIN = 'hero'
+MONSTER_WIN = 'monster'
+DRAW = 'draw'
+
+
+class Fighter(object):
+    """
+    Lightweight mutable copy of the combat relevant state of a character.
+    """
+    __slots__ = ('name', 'health', 'stamina', 'strength', 'luck', 'bonuses', 'attacks', 'policy')
+
+    def __init__(self, character):
+        """
+        :param class character: The Character or Monster to copy the starting state from.
+        """
+        self.name = character.name
+        self.health = character.health
+        self.stamina = character.stamina
+        self.strength = character.strength
+        self.luck = character.luck
+
+        # Only the damage bonus of each equipped item matters to the damage roll.
+        self.bonuses = tuple(item['damage_bonus'] for item in character.equipped)
+
+        # {attack_index: (stamina_cost, damage_multiplier)}
+        self.attacks = {index: (action['stamina_cost'], action['damage_multiplier'])
+                        for index, action in character.attack_actions.items()}
+
+        # Compiled ai.Policy of monsters, None for characters driven by a player.
+        self.policy = getattr(character, 'policy', None)
+
+
+def monster_policy(fighter, opponent, rng):
+    """
+    Monster.choose_combat_action expressed as a simulation policy, using the monster's compiled ai.Policy.
+
+    :param Fighter fighter: The fighter making the decision.
+    :param Fighter opponent: The fighter being attacked.
+    :param RandomStream rng: Random number generator to draw from.
+    :return: REST or the index of the attack to perform.
+    """
+    return (fighter.policy or ai.WOLF_POLICY).decide(fighter.health, fighter.stamina, opponent.health, rng)
+
+
+def hero_policy(fighter, opponent, rng):
+    """
+    Default stand-in for a human player: Pick any attack at random, resting once stamina runs dry.
+
+    :param Fighter fighter: The fighter making the decision.
+    :param Fighter opponent: The fighter being attacked.
+    :param RandomStream rng: Random number generator to draw from.
+    :return: REST or the index of the attack to perform.
+    """
+    if fighter.stamina <= 0:
+        return REST
+    return rng.randint(1, len(fighter.attacks))
+
+
+def deal_damage(attacker, target, multiplier, rng, damage_log=None):
+    """
+    One roll per equipped item, identical to Character.__deal_damage.
+
+    :param Fighter attacker: The fighter dealing the damage.
+    :param Fighter target: The fighter receiving the damage.
+    :param float multiplier: The multiplier for the final result of the attack.
+    :param RandomStream rng: Random number generator to draw from.
+    :param list|optional damage_log: If given, every damage value that lands is appended to it.
+    """
+    lower_damage_limit = int(attacker.strength * 0.1)
+    for bonus in attacker.bonuses:
+        damage = rng.randint(lower_damage_limit, int(bonus + attacker.strength)) * multiplier
+        if rng.random() * 100 < attacker.luck:
+            damage *= effects.CRIT_MULTIPLIER
+
+        if target.health > 0:
+            if damage_log is not None:
+                damage_log.append(damage)
+
+            if damage >= target.health:
+                target.health = 0
+            else:
+                target.health -= damage
+
+
+def perform_attack(attacker, target, attack_index, rng, damage_log=None):
+    """
+    Stamina handling of Character.perform_attack, including the half damage last stand.
+
+    :param Fighter attacker: The fighter performing the attack.
+    :param Fighter target: The fighter being attacked.
+    :param int attack_index: Index number of the attack from Fighter.attacks
+    :param RandomStream rng: Random number generator to draw from.
+    :param list|optional damage_log: If given, every damage value that lands is appended to it.
+    """
+    stamina_cost, damage_multiplier = attacker.attacks[attack_index]
+
+    if attacker.stamina >= stamina_cost:
+        deal_damage(attacker, target, damage_multiplier, rng, damage_log)
+        attacker.stamina -= stamina_cost
+
+    elif stamina_cost > attacker.stamina > 0:
+        deal_damage(attacker, target, damage_multiplier / 2, rng, damage_log)
+        attacker.stamina = 0
+
+
+def rest(fighter, rng):
+    """
+    Health and stamina regeneration of Character.rest.
+
+    :param Fighter fighter: The fighter taking a rest.
+    :param RandomStream rng: Random number generator to draw from.
+    """
+    fighter.health += rng.randint(10, round(fighter.health * 0.10 + fighter.strength))
+    fighter.stamina += rng.randint(10, round(fighter.stamina * 0.10 + fighter.strength))
+
+
+def take_turn(fighter, opponent, policy, rng, damage_log=None):
+    """
+    Let the policy pick an action for the fighter and carry it out.
+    """
+    action = policy(fighter, opponent, rng)
+    if action == REST:
+        rest(fighter, rng)
+    else:
+        perform_attack(fighter, opponent, action, rng, damage_log)
+
+
+def simulate_fight(hero, monster, rng=None, hero_policy=hero_policy, monster_policy=monster_policy,
+                   max_turns=1000, damage_log=None):
+    """
+    Play out a single fight in the same order as main.combat: The hero acts, then the monster if it is
+    still alive.
+
+    :param class hero: The Character to copy the hero's starting state from.
+    :param class monster: The Monster to copy the monster's starting state from.
+    :param RandomStream|optional rng: Random number generator to draw from, rng.default if not given.
+    :param function|optional hero_policy: Decision function for the hero.
+    :param function|optional monster_policy: Decision function for the monster.
+    :param int|optional max_turns: Turns after which the fight is called a draw.
+    :param list|optional damage_log: If given, every damage value that lands is appended to it.
+    :return: The outcome (HERO_WIN, MONSTER_WIN or DRAW) and the number of turns played.
+    :rtype: tuple
+    """
+    rng = rng or rngs.default
+    hero = Fighter(hero)
+    monster = Fighter(monster)
+
+    turn = 0
+    while hero.health > 0 and monster.health > 0:
+        if turn == max_turns:
+            return DRAW, turn
+        turn += 1
+
+        take_turn(hero, monster, hero_policy, rng, damage_log)
+        if monster.health > 0:
+            take_turn(monster, hero, monster_policy, rng, damage_log)
+
+    return (HERO_WIN if hero.health > 0 else MONSTER_WIN), turn
+
+
+class BatchReport(object):
+    """
+    Aggregated results of a batch of simulated fights.
+    """
+
+    def __init__(self, fights, outcomes, turns, damage, damage_bucket):
+        """
+        :param int fights: Number of fights simulated.
+        :param Counter outcomes: {outcome: number of fights}
+        :param Counter turns: {turns taken: number of fights}
+        :param Counter damage: {bucket start: number of hits}
+        :param int damage_bucket: The width of each damage histogram bucket.
+        """
+        self.fights = fights
+        self.outcomes = outcomes
+        self.turns = turns
+        self.damage = damage
+        self.damage_bucket = damage_bucket
+
+    def win_rate(self, side=HERO_WIN):
+        """
+        :param str|optional side: HERO_WIN, MONSTER_WIN or DRAW.
+        :return: Fraction of the fights that ended with the given outcome.
+        :rtype: float
+        """
+        return self.outcomes[side] / self.fights if self.fights else 0.0
+
+    def turn_percentile(self, percent):
+        """
+        :param float percent: The percentile to find, 0 - 100.
+        :return: The number of turns below which the given percent of fights ended.
+        :rtype: int
+        """
+        target = self.fights * percent / 100.0
+        seen = 0
+        for turns in sorted(self.turns):
+            seen += self.turns[turns]
+            if seen >= target:
+                return turns
+        return 0
+
+    def summary(self):
+        """
+        :return: Human readable summary of the batch.
+        :rtype: str
+        """
+        lines = [f'Fights     : {self.fights}',
+                 f'Hero wins  : {self.win_rate(HERO_WIN):.2%}',
+                 f'Monster    : {self.win_rate(MONSTER_WIN):.2%}',
+                 f'Draws      : {self.win_rate(DRAW):.2%}',
+                 'Turns      : p50 {} / p90 {} / p99 {}'.format(*[self.turn_percentile(p) for p in (50, 90, 99)]),
+                 'Damage     :']
+
+        total_hits = sum(self.damage.values()) or 1
+        for bucket in sorted(self.damage):
+            share = self.damage[bucket] / total_hits
+            lines.append('\t{:>4}-{:<4} {:6.2%} {}'.format(bucket, bucket + self.damage_bucket - 1,
+                                                            share, '#' * round(share * 50)))
+        return '\n'.join(lines)
+
+
+def simulate(hero, monster, fights=10000, seed=None, hero_policy=hero_policy, monster_policy=monster_policy,
+             max_turns=1000, damage_bucket=10):
+    """
+    Run a batch of headless fights between copies of the hero and the monster.
+
+    :param class hero: The Character to copy the hero's starting state from.
+    :param class monster: The Monster to copy the monster's starting state from.
+    :param int|optional fights: Number of fights to simulate.
+    :param int|optional seed: Seed for the batch, making the results reproducible.
+    :param function|optional hero_policy: Decision function for the hero.
+    :param function|optional monster_policy: Decision function for the monster.
+    :param int|optional max_turns: Turns after which a fight is called a draw.
+    :param int|optional damage_bucket: The width of each damage histogram bucket.
+    :return: Win rates, turn counts and damage histogram of the batch.
+    :rtype: BatchReport
+    """
+    rng = rngs.RandomStream(seed)
+    outcomes = Counter()
+    turns = Counter()
+    damage_log = []
+
+    for _ in range(fights):
+        outcome, turns_taken = simulate_fight(hero, monster, rng, hero_policy, monster_policy, max_turns, damage_log)
+        outcomes[outcome] += 1
+        turns[turns_taken] += 1
+
+    damage = Counter(int(value // damage_bucket) * damage_bucket for value in damage_log)
+    return BatchReport(fights, outcomes, turns, damage, damage_bucket)
+
+
+if __name__ == '__main__':
+    import time
+    import character
+
+    start = time.perf_counter()
+    report = simulate(character.Character('Sheep'), character.Monster('Wolf'), fights=100000, seed=0)
+    elapsed = time.perf_counter() - start
+
+    print(report.summary())
+    print(f'{report.fights / elapsed:,.0f} fights/sec')
@@ -0,0 +1,630 @@
+"""
+Outcome probabilities for a fight worked out on a grid of states, as an alternative to sampling it with simulation.py.
+
+A fight is treated as a Markov process over the health and stamina of both sides. The probability of every outcome
+of every action is worked out from the same damage ranges, last stand, rest and monster policy rules as the game,
+and value iteration finds the hero's chance of winning from each state, the action that maximises it and the
+expected number of turns.
+
+Values are kept on a grid. Health points split each side's starting health into resolution even steps, closer
+together below the first step so that kills and deaths stay sharp, and a growing share of the value apart above it.
+A health between two points is split between them in proportion to how close it is, so rounding doesn't favour either
+side on average. Stamina is always a whole number spent on attacks whose costs share a common divisor, so up to the
+starting stamina there is a point for every multiple of it and one for everything strictly between two multiples,
+which is exact for attacks, the last stand and the monster policy. Above that it is split like health.
+
+Resting is not capped: The grid reaches ceiling times the starting values and only a value past its top is held
+there. solve() refines the grid until the answer stops moving, first raising the ceiling and then the resolution
+until either moves the win probability by less than precision. Each grid starts from the values of the one
+before. Should the next grid hold more than max_states states, or its move tables more than max_moves outcomes,
+refining stops there and converged is left False, so large stat values cost accuracy rather than memory. Damage and
+rest distributions are kept in LRU caches.
+
+The values are an approximation. Damage multipliers, criticals and the last stand put health on quarter steps and
+resting raises it without limit, so the exact states of even a Wolf fight run to billions. Refining shrinks the
+error of the grid slowly: converged only means the last refinement moved the answer by less than precision, the
+answer itself can be further off than that. benchmark.bench_solver measures the real error by sampling. For a single
+state, sampling gets to the same accuracy far quicker. Solving pays off when the value of many states or the best
+action from all of them is wanted.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from functools import lru_cache, reduce
+from math import ceil, floor, gcd
+from operator import itemgetter, mul
+
+import ai
+import effects
+import simulation
+
+# Value iteration picks the best move from every state again once in this many sweeps.
+IMPROVE_EVERY = 4
+# Each refinement multiplies the resolution by this.
+REFINE_RESOLUTION = 1.5
+# Expected turns are worked out to within this share of their value.
+TURNS_PRECISION = 0.01
+
+
+class Solution(object):
+    """
+    The solved value of one state of the fight.
+    """
+    __slots__ = ('win_probability', 'expected_turns', 'action')
+
+    def __init__(self, win_probability, expected_turns, action):
+        """
+        :param float win_probability: Chance of the hero winning from this state, playing the best actions found.
+        :param float expected_turns: Expected number of turns until the fight ends.
+        :param action: The best action for the hero, REST or an attack index. None if the fight is over.
+        """
+        self.win_probability = win_probability
+        self.expected_turns = expected_turns
+        self.action = action
+
+    def __repr__(self):
+        return f'Solution({self.win_probability:.4f}, {self.expected_turns:.2f}, {self.action!r})'
+
+
+class TooManyStates(Exception):
+    """
+    Raised internally when a grid would hold more than max_states states, or max_moves outcomes of moves.
+    """
+
+
+class Axis(object):
+    """
+    The points one of the four values of a state is kept on.
+    """
+    __slots__ = ('points', 'step', 'exact_top', 'top')
+
+    def __init__(self, points, step=1, exact_top=0):
+        """
+        :param list points: The values of the points in ascending order, starting with 0.
+        :param int|optional step: Below exact_top, points are step / 2 apart and a value goes whole to its own point
+                                  on a multiple of step, or to the one halfway between the multiples either side.
+        :param int|optional exact_top: Where values start being split between the points either side instead.
+        """
+        self.points = points
+        self.step = step
+        self.exact_top = exact_top
+        self.top = len(points) - 1
+
+    def spread(self, value):
+        """
+        :param float value: The value to place on the axis.
+        :return: ((index, share), ...) The points the value is split between, anything still above 0 staying so.
+        :rtype: tuple
+        """
+        if value <= 0:
+            return ((0, 1.0),)
+
+        if value < self.exact_top:
+            steps = value / self.step
+            return ((2 * int(steps) if steps == int(steps) else 2 * floor(steps) + 1, 1.0),)
+
+        points = self.points
+        if value <= points[1]:
+            return ((1, 1.0),)
+        if value >= points[-1]:
+            return ((self.top, 1.0),)
+
+        lower = bisect_right(points, value) - 1
+        share = (value - points[lower]) / (points[lower + 1] - points[lower])
+        if share == 0.0:
+            return ((lower, 1.0),)
+        return ((lower, 1.0 - share), (lower + 1, share))
+
+    def nearest(self, value):
+        """
+        :param float value: The value to place on the axis.
+        :return: The index of the point the value has the largest share in.
+        :rtype: int
+        """
+        return max(self.spread(value), key=itemgetter(1))[0]
+
+
+def health_axis(start, resolution, ceiling, thresholds=()):
+    """
+    :param float start: The starting health.
+    :param float resolution: Points up to start, evenly spaced, with the spacing halved again and again below the
+                             first one down to 1.
+    :param float ceiling: The top point is the first at or above this multiple of start.
+    :param list|optional thresholds: Values the monster policy changes its mind at, which get points of their own.
+    :return: Points for health, growing by 1 / resolution of the value each above start.
+    :rtype: Axis
+    """
+    quantum = start / resolution
+    points = {0.0, float(start)}
+    points.update(float(threshold) for threshold in thresholds if 0 < threshold < start)
+    low = quantum / 2
+    while low >= 1:
+        points.add(low)
+        low /= 2
+    points.update(quantum * multiple for multiple in range(1, ceil(resolution)))
+
+    value = start
+    while value < start * ceiling:
+        value *= 1 + 1 / resolution
+        points.add(value)
+    return Axis(sorted(points))
+
+
+def stamina_axis(start, step, growth, ceiling):
+    """
+    :param int start: The starting stamina.
+    :param int step: The common divisor of everything stamina is compared against.
+    :param float growth: The share of the value each point is apart above start.
+    :param float ceiling: The top point is the first at or above this multiple of start.
+    :return: Points for stamina, exact up to start.
+    :rtype: Axis
+    """
+    exact_top = max(ceil(start / step), 1) * step
+    points = [multiple * step / 2 for multiple in range(2 * exact_top // step + 1)]
+
+    value = exact_top
+    while value < start * ceiling:
+        value *= 1 + growth
+        points.append(value)
+    return Axis(points, step, exact_top)
+
+
+def _thresholds(index):
+    # The values a policy feature's bucket changes after, from the lookup that maps rounded up values to buckets.
+    return [value - 1 for value in range(1, len(index)) if index[value] != index[value - 1]]
+
+
+class Solver(object):
+    """
+    Solves fights between copies of one hero and one monster.
+    """
+
+    def __init__(self, hero, monster, resolution=6, stamina_quantum=None, ceiling=1.5, precision=2e-3,
+                 max_states=250000, max_moves=200000, tolerance=1e-4, max_sweeps=1000, cache_size=4096):
+        """
+        :param class hero: The Character to take the hero's stats from.
+        :param class monster: The Monster to take the monster's stats and policy from.
+        :param float|optional resolution: Steps the coarsest grid splits each starting health into.
+        :param int|optional stamina_quantum: The divisor stamina is kept exact around. By default the greatest
+                                             common divisor of the attack costs and the monster policy's thresholds.
+        :param float|optional ceiling: Multiple of the starting values the coarsest grid reaches.
+        :param float|optional precision: Refining stops once it moves the win probability by less than this. It is
+                                         not a bound on the error of the answer.
+        :param int|optional max_states: The most states a grid may hold.
+        :param int|optional max_moves: The most outcomes the move tables of a grid may hold, over every move. Moves
+                                       are shared between the states they're made from alike.
+        :param float|optional tolerance: Value iteration stops once the win probability, or the expected turns
+                                         relative to their value, is estimated to be within this of its limit.
+        :param int|optional max_sweeps: Value iteration gives up after this many passes.
+        :param int|optional cache_size: The most damage and rest distributions to remember.
+        """
+        self.hero = simulation.Fighter(hero)
+        self.monster = simulation.Fighter(monster)
+        self.policy = self.monster.policy or ai.WOLF_POLICY
+
+        self.resolution = resolution
+        self.ceiling = ceiling
+        self.precision = precision
+        self.max_states = max_states
+        self.max_moves = max_moves
+        self.tolerance = tolerance
+        self.max_sweeps = max_sweeps
+        self.sweeps = 0
+        self.converged = False
+
+        # (resolution, ceiling, states, win probability) of every grid solved, in order.
+        self.refinements = []
+
+        costs = [stamina_cost for stamina_cost, _ in self.hero.attacks.values()]
+        monster_costs = [stamina_cost for stamina_cost, _ in self.monster.attacks.values()]
+        self.steps = {self.hero: stamina_quantum or reduce(gcd, costs),
+                      self.monster: stamina_quantum or reduce(gcd, monster_costs +
+                                                              _thresholds(self.policy.stamina_index))}
+        self.actions = tuple(self.hero.attacks) + (ai.REST,)
+        self._health_thresholds = {self.hero: _thresholds(self.policy.opponent_index),
+                                   self.monster: _thresholds(self.policy.health_index)}
+
+        self._start = (self.hero.health, self.hero.stamina, self.monster.health, self.monster.stamina)
+
+        self._damage = lru_cache(maxsize=cache_size)(self._damage_distribution)
+        self._rest = lru_cache(maxsize=cache_size)(self._rest_distribution)
+        self._axes = None
+
+    def _damage_distribution(self, attacker, multiplier):
+        """
+        :return: ((total damage, probability), ...) in ascending order, one roll per equipped item, any of which can
+                 be a critical hit. As health only goes down, the target dies exactly when the total reaches it.
+        """
+        lower_damage_limit = int(attacker.strength * 0.1)
+        critical = effects.critical_chance(attacker.luck)
+        hits = [(1, 1.0 - critical), (effects.CRIT_MULTIPLIER, critical)] if critical else [(1, 1.0)]
+        totals = {0: 1.0}
+
+        for bonus in attacker.bonuses:
+            damages = range(lower_damage_limit, int(bonus + attacker.strength) + 1)
+            share = 1.0 / len(damages)
+
+            rolled = defaultdict(float)
+            for total, probability in totals.items():
+                for damage in damages:
+                    for critical_multiplier, chance in hits:
+                        rolled[total + damage * multiplier * critical_multiplier] += probability * share * chance
+            totals = rolled
+        return tuple(sorted(totals.items()))
+
+    def _rest_distribution(self, fighter, axis, index):
+        """
+        :return: {index: probability} of the value at index on the axis after a rest.
+        """
+        value = axis.points[index]
+        gains = range(10, round(value * 0.10 + fighter.strength) + 1)
+        outcomes = defaultdict(float)
+        for gain in gains:
+            for new_index, share in axis.spread(value + gain):
+                outcomes[new_index] += share / len(gains)
+        return outcomes
+
+    def _hit(self, attacker, action, stamina_axis, stamina, health_axis, health):
+        """
+        :return: ({stamina index: probability}, {health index: probability}, chance of the target dying) for an
+                 attack, or None when the attacker has no stamina to attack with.
+        """
+        stamina_cost, damage_multiplier = attacker.attacks[action]
+        value = stamina_axis.points[stamina]
+        if value >= stamina_cost:
+            multiplier, staminas = damage_multiplier, stamina_axis.spread(value - stamina_cost)
+        elif value > 0:
+            multiplier, staminas = damage_multiplier / 2, ((0, 1.0),)
+        else:
+            return None
+
+        target_health = health_axis.points[health]
+        healths = defaultdict(float)
+        kill = 0.0
+        for total, probability in self._damage(attacker, multiplier):
+            if total >= target_health:
+                kill += probability
+                continue
+            for new_index, share in health_axis.spread(target_health - total):
+                healths[new_index] += probability * share
+        return dict(staminas), healths, kill
+
+    def _build(self, resolution, ceiling):
+        """
+        Lay out the grid and work out the outcomes of every action from every state on it.
+        """
+        hero, monster = self.hero, self.monster
+        axes = (health_axis(hero.health, resolution, ceiling, self._health_thresholds[hero]),
+                stamina_axis(hero.stamina, self.steps[hero], 1 / resolution, ceiling),
+                health_axis(monster.health, resolution, ceiling, self._health_thresholds[monster]),
+                stamina_axis(monster.stamina, self.steps[monster], 1 / resolution, ceiling))
+        hero_healths, hero_staminas, monster_healths, monster_staminas = axes
+        sizes = [len(axis.points) for axis in axes]
+        if (sizes[0] - 1) * sizes[1] * (sizes[2] - 1) * sizes[3] > self.max_states:
+            raise TooManyStates()
+
+        # States are numbered with the monster's stamina changing fastest. Index 0 on either health is never
+        # solved and stays 0, so a move can always be written as an offset from the state it's taken in.
+        strides = (sizes[1] * sizes[2] * sizes[3], sizes[2] * sizes[3], sizes[3], 1)
+        self._damage.cache_clear()
+        self._rest.cache_clear()
+
+        def offsets(first, first_axis, first_index, second, second_axis, second_index):
+            # Every combination of two independent outcomes, as offsets and probabilities.
+            moves = [((new_first - first_index) * strides[first_axis] +
+                      (new_second - second_index) * strides[second_axis], probability * other_probability)
+                     for new_first, probability in first.items()
+                     for new_second, other_probability in second.items()]
+            return tuple(offset for offset, _ in moves), tuple(probability for _, probability in moves)
+
+        hero_moves = {}
+        monster_moves = {}
+        outcome_count = 0
+
+        def counted(moves):
+            nonlocal outcome_count
+            outcome_count += len(moves[0])
+            if outcome_count > self.max_moves:
+                raise TooManyStates()
+            return moves
+
+        def hero_move(action, health, stamina, monster_health):
+            if action == ai.REST:
+                key = (action, health, stamina)
+                if key not in hero_moves:
+                    hero_moves[key] = counted(offsets(self._rest(hero, hero_healths, health), 0, health,
+                                                      self._rest(hero, hero_staminas, stamina), 1, stamina) + (0.0,))
+                return hero_moves[key]
+
+            key = (action, stamina, monster_health)
+            if key not in hero_moves:
+                hit = self._hit(hero, action, hero_staminas, stamina, monster_healths, monster_health)
+                if hit is None:
+                    hero_moves[key] = ((0,), (1.0,), 0.0)
+                else:
+                    staminas, healths, kill = hit
+                    hero_moves[key] = counted(offsets(staminas, 1, stamina, healths, 2, monster_health) + (kill,))
+            return hero_moves[key]
+
+        def monster_move(health, monster_health, monster_stamina):
+            choice = self.policy.lookup(monster_healths.points[monster_health],
+                                        monster_staminas.points[monster_stamina], hero_healths.points[health])
+            choices = choice if type(choice) is tuple else (choice,)
+            # Attacks don't depend on the monster's health, nor rests on the hero's.
+            key = (choice, health if choices != (ai.REST,) else None,
+                   monster_health if ai.REST in choices else None, monster_stamina)
+            if key in monster_moves:
+                return monster_moves[key]
+
+            outcomes = defaultdict(float)
+            for monster_action in choices:
+                if monster_action == ai.REST:
+                    moves = offsets(self._rest(monster, monster_healths, monster_health), 2, monster_health,
+                                    self._rest(monster, monster_staminas, monster_stamina), 3, monster_stamina)
+                else:
+                    hit = self._hit(monster, monster_action, monster_staminas, monster_stamina, hero_healths,
+                                    health)
+                    # The hero dying leaves nothing to add, as index 0 is worth 0.
+                    moves = ((0,), (1.0,)) if hit is None else offsets(hit[0], 3, monster_stamina, hit[1], 0,
+                                                                       health)
+                for offset, probability in zip(*moves):
+                    outcomes[offset] += probability / len(choices)
+            monster_moves[key] = counted((tuple(outcomes), tuple(outcomes.values())))
+            return monster_moves[key]
+
+        # Gauss-Seidel runs through the states by total health, so the states an attack leads to have mostly been
+        # updated already in the same pass, leaving rests to converge over several passes.
+        plan = []
+        for health in range(1, sizes[0]):
+            for stamina in range(sizes[1]):
+                for monster_health in range(1, sizes[2]):
+                    for monster_stamina in range(sizes[3]):
+                        state = (health * strides[0] + stamina * strides[1] + monster_health * strides[2] +
+                                 monster_stamina)
+                        plan.append((hero_healths.points[health] + monster_healths.points[monster_health], state,
+                                     monster_move(health, monster_health, monster_stamina),
+                                     tuple(hero_move(action, health, stamina, monster_health)
+                                           for action in self.actions)))
+        plan.sort(key=itemgetter(0))
+        return axes, strides, [step[1:] for step in plan]
+
+    def _lookup(self, table, values):
+        """
+        :return: The value in the table at any state, split between the grid points around it.
+        """
+        result = 0.0
+        hero_health, stamina, monster_health, monster_stamina = [axis.spread(value)
+                                                                 for axis, value in zip(self._axes, values)]
+        for health, health_share in hero_health:
+            for stamina_index, stamina_share in stamina:
+                for target, target_share in monster_health:
+                    for target_stamina, target_stamina_share in monster_stamina:
+                        state = (health * self._strides[0] + stamina_index * self._strides[1] +
+                                 target * self._strides[2] + target_stamina)
+                        result += (health_share * stamina_share * target_share * target_stamina_share *
+                                   (1.0 if target == 0 else table[state]))
+        return result
+
+    def _settled(self, history, changes, tolerance):
+        """
+        Whether iterating can stop. The slowest part of the error shrinks by about the same rate every sweep, so
+        the distance left to go is estimated from the last step of the starting state's value and the slowest
+        rate the largest change of any state has recently shrunk at.
+
+        :param list history: The starting state's value after every sweep so far.
+        :param list changes: The largest change to any state in every sweep so far.
+        :param float tolerance: How far from its limit the starting state's value may be.
+        """
+        if changes[-1] < tolerance:
+            return True
+        if len(changes) < 5:
+            return False
+
+        rate = max(later / earlier if earlier else 0.0 for earlier, later in zip(changes[-5:], changes[-4:]))
+        if rate >= 1.0:
+            return False
+        return abs(history[-1] - history[-2]) * rate / (1.0 - rate) < tolerance
+
+    def _iterate(self, plan, start):
+        """
+        Modified policy iteration until the starting state's win probability settles: Every few sweeps the best move
+        from each state is picked again, and the sweeps in between only update the moves picked.
+        """
+        values, mid_values = self._values, self._mid_values
+        value_at, mid_value_at = values.__getitem__, mid_values.__getitem__
+        history, changes = [], []
+        for self.sweeps in range(1, self.max_sweeps + 1):
+            change = 0.0
+            improve = self.sweeps % IMPROVE_EVERY == 1
+            if improve:
+                chosen = []
+                for state, monster_move, moves in plan:
+                    offsets, probabilities = monster_move
+                    mid_values[state] = sum(map(mul, probabilities, map(value_at, map(state.__add__, offsets))))
+                    move_values = [kill + sum(map(mul, move_probabilities,
+                                                  map(mid_value_at, map(state.__add__, move_offsets))))
+                                   for move_offsets, move_probabilities, kill in moves]
+                    best = max(move_values)
+                    chosen.append((state, monster_move, moves[move_values.index(best)]))
+
+                    difference = best - values[state]
+                    if difference > change or -difference > change:
+                        change = abs(difference)
+                    values[state] = best
+            else:
+                for state, (offsets, probabilities), (move_offsets, move_probabilities, kill) in chosen:
+                    mid_values[state] = sum(map(mul, probabilities, map(value_at, map(state.__add__, offsets))))
+                    value = kill + sum(map(mul, move_probabilities,
+                                           map(mid_value_at, map(state.__add__, move_offsets))))
+
+                    difference = value - values[state]
+                    if difference > change or -difference > change:
+                        change = abs(difference)
+                    values[state] = value
+
+            history.append(self._lookup(values, start))
+            changes.append(change)
+            if improve and self._settled(history, changes, self.tolerance):
+                break
+        return history[-1]
+
+    def _count_turns(self, plan, start):
+        """
+        Pick the best action for every state, then work out the expected turns of playing them to within
+        TURNS_PRECISION of their value.
+        """
+        values, mid_values = self._values, self._mid_values
+        mid_value_at = mid_values.__getitem__
+        best = [None] * len(values)
+        chosen = []
+        for state, monster_move, moves in plan:
+            move_values = [kill + sum(map(mul, probabilities, map(mid_value_at, map(state.__add__, offsets))))
+                           for offsets, probabilities, kill in moves]
+            choice = move_values.index(max(move_values))
+            best[state] = self.actions[choice]
+            chosen.append((state, monster_move, moves[choice]))
+
+        turns, mid_turns = [0.0] * len(values), [0.0] * len(values)
+        turns_at, mid_turns_at = turns.__getitem__, mid_turns.__getitem__
+        history, changes = [], []
+        for _ in range(self.max_sweeps):
+            change = 0.0
+            for state, (offsets, probabilities), (move_offsets, move_probabilities, _) in chosen:
+                mid_turns[state] = sum(map(mul, probabilities, map(turns_at, map(state.__add__, offsets))))
+                expected = 1.0 + sum(map(mul, move_probabilities, map(mid_turns_at, map(state.__add__, move_offsets))))
+                if abs(expected - turns[state]) > change:
+                    change = abs(expected - turns[state])
+                turns[state] = expected
+
+            history.append(self._lookup(turns, start))
+            changes.append(change)
+            if self._settled(history, changes, TURNS_PRECISION * history[-1]):
+                break
+        self._best, self._turns = best, turns
+
+    def _solve_grid(self, resolution, ceiling):
+        """
+        Solve the fight on one grid, starting from the values of the previous one.
+
+        :return: The win probability of the starting state.
+        :rtype: float
+        """
+        axes, strides, plan = self._build(resolution, ceiling)
+        size = len(axes[0].points) * strides[0]
+        values = [0.0] * size
+        if self._axes is not None:
+            for state, _, _ in plan:
+                health, remainder = divmod(state, strides[0])
+                stamina, remainder = divmod(remainder, strides[1])
+                monster_health, monster_stamina = divmod(remainder, strides[2])
+                values[state] = self._lookup(self._values, (axes[0].points[health], axes[1].points[stamina],
+                                                            axes[2].points[monster_health],
+                                                            axes[3].points[monster_stamina]))
+
+        self._axes, self._strides, self._plan = axes, strides, plan
+        self._values, self._mid_values = values, [0.0] * size
+        for state, (offsets, probabilities), _ in plan:
+            self._mid_values[state] = sum(map(mul, probabilities, map(values.__getitem__, map(state.__add__, offsets))))
+
+        win_probability = self._iterate(plan, self._start)
+        self.resolution, self.ceiling = resolution, ceiling
+        self.refinements.append((resolution, ceiling, len(plan), win_probability))
+        return win_probability
+
+    def _refine(self):
+        """
+        Solve on finer and finer grids until the starting state's win probability stops moving: First raise the
+        ceiling, then the resolution.
+        """
+        win_probability = self._solve_grid(self.resolution, self.ceiling)
+        try:
+            for raise_ceiling in (True, False):
+                moved = None
+                while moved is None or moved >= self.precision:
+                    if raise_ceiling:
+                        refined = self._solve_grid(self.resolution, self.ceiling + 0.5)
+                    else:
+                        refined = self._solve_grid(self.resolution * REFINE_RESOLUTION, self.ceiling)
+                    moved = abs(refined - win_probability)
+                    win_probability = refined
+            self.converged = True
+        except TooManyStates:
+            # Keep the finest grid that fitted.
+            pass
+        self._count_turns(self._plan, self._start)
+
+    def quantize_state(self, hero_health, hero_stamina, monster_health, monster_stamina):
+        """
+        :return: The grid point closest to the state, with anything past the top of the grid held there.
+        :rtype: tuple
+        """
+        self._ensure_solved()
+        return tuple(axis.points[axis.nearest(value)]
+                     for axis, value in zip(self._axes, (hero_health, hero_stamina, monster_health, monster_stamina)))
+
+    def _ensure_solved(self):
+        if self._axes is None:
+            self._refine()
+
+    def solve(self, hero_health=None, hero_stamina=None, monster_health=None, monster_stamina=None):
+        """
+        Solve the fight from the given state, the starting state of both sides by default. The first call refines
+        the grid for the starting state, after which any state is answered straight from the value table.
+
+        :return: The win probability, expected turns and best action for the hero.
+        :rtype: Solution
+        """
+        values = (self.hero.health if hero_health is None else hero_health,
+                  self.hero.stamina if hero_stamina is None else hero_stamina,
+                  self.monster.health if monster_health is None else monster_health,
+                  self.monster.stamina if monster_stamina is None else monster_stamina)
+        if values[2] <= 0:
+            return Solution(1.0, 0.0, None)
+        if values[0] <= 0:
+            return Solution(0.0, 0.0, None)
+
+        self._ensure_solved()
+        return Solution(self._lookup(self._values, values), self._lookup(self._turns, values),
+                        self._best[self._nearest(values)])
+
+    def _nearest(self, values):
+        # The table index of the grid point closest to the state.
+        return sum(axis.nearest(value) * stride for axis, value, stride in zip(self._axes, values, self._strides))
+
+    def policy_for_simulation(self):
+        """
+        :return: A simulation hero policy that plays the solver's best action, for checking it by sampling.
+        """
+        self._ensure_solved()
+        best = self._best
+        hero_healths, hero_staminas, monster_healths, monster_staminas = self._axes
+        health_stride, stamina_stride, monster_health_stride, _ = self._strides
+
+        def optimal_policy(fighter, opponent, rng):
+            return best[hero_healths.nearest(fighter.health) * health_stride +
+                        hero_staminas.nearest(fighter.stamina) * stamina_stride +
+                        monster_healths.nearest(opponent.health) * monster_health_stride +
+                        monster_staminas.nearest(opponent.stamina)]
+
+        return optimal_policy
+
+    @property
+    def state_count(self):
+        """
+        :return: The number of states held in the value table.
+        :rtype: int
+        """
+        return len(self._plan) if self._axes is not None else 0
+
+
+if __name__ == '__main__':
+    import time
+    import character
+    import console
+
+    start = time.perf_counter()
+    solver = Solver(character.Character('Sheep'), character.Monster('Wolf'))
+    solution = solver.solve()
+    console.write(f'{solution} in {time.perf_counter() - start:.2f}s, {solver.state_count} states, '
+                  f'{solver.sweeps} sweeps, resolution {solver.resolution}, ceiling {solver.ceiling}, '
+                  f'{"converged" if solver.converged else "not converged"}')
+    console.flush()
@@ -0,0 +1,177 @@
+"""
+Round-robin balance tournaments between hero builds and monster variants.
+
+Every hero build fights every monster variant a number of times using the headless rules in simulation.py.
+The fights of each pairing are split into chunks that are shared out over a process pool, each chunk with its
+own seed derived from the tournament seed, so a tournament gives the same results however many processes
+run it. Results are aggregated as chunks finish and written out as a win-matrix.
+
+Run with: python tournament.py [--fights 10000] [--workers 4] [--output win_matrix.csv]
+"""
+import argparse
+import csv
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import catalog
+import character
+import console
+import rng as rngs
+import simulation
+
+# A character to enter into the tournament. The class must be importable (defined at module level) so it can
+# be sent to the worker processes, the attributes are set on each instance after it has been created. Equipped
+# items are given as catalog ids.
+Build = namedtuple('Build', ['name', 'character_class', 'attributes'])
+
+HERO_BUILDS = [Build('Balanced', character.Character, {}),
+               Build('Brute', character.Character, {'health': 160, 'strength': 70.0, 'stamina': 80}),
+               Build('Tank', character.Character, {'health': 300, 'strength': 35.0, 'stamina': 120}),
+               Build('Duelist', character.Character,
+                     {'strength': 45.0, 'equipped': ['short_sword']})]
+
+MONSTER_VARIANTS = [Build('Wolf', character.Monster, {}),
+                    Build('Wolf Pup', character.Monster, {'health': 60.0, 'strength': 25.0}),
+                    Build('Dire Wolf', character.Monster, {'health': 220.0, 'strength': 55.0, 'stamina': 60}),
+                    Build('Twin Fangs', character.Monster,
+                          {'equipped': ['blunt_claws', 'fangs']})]
+
+
+class PairingResult(object):
+    """
+    Running totals for one hero build against one monster variant.
+    """
+    __slots__ = ('fights', 'wins', 'losses', 'draws', 'turns')
+
+    def __init__(self):
+        self.fights = self.wins = self.losses = self.draws = self.turns = 0
+
+    def add(self, wins, losses, draws, turns):
+        self.fights += wins + losses + draws
+        self.wins += wins
+        self.losses += losses
+        self.draws += draws
+        self.turns += turns
+
+    @property
+    def win_rate(self):
+        return self.wins / self.fights if self.fights else 0.0
+
+
+def create(build):
+    """
+    :param Build build: The build to create.
+    :return: An instance of the build's class with its attributes applied.
+    """
+    instance = build.character_class(build.name)
+    for attribute, value in build.attributes.items():
+        if attribute == 'equipped':
+            value = [catalog.item(item_id) for item_id in value]
+        setattr(instance, attribute, value)
+    return instance
+
+
+def shard_seed(seed, hero_index, monster_index, chunk_index):
+    """
+    :return: The seed for one chunk of fights, the same for a given tournament seed no matter how it's run.
+    :rtype: int
+    """
+    return random.Random(f'{seed}:{hero_index}:{monster_index}:{chunk_index}').getrandbits(64)
+
+
+def run_chunk(hero_build, monster_build, fights, seed):
+    """
+    Worker entry point, plays one chunk of fights between a hero build and a monster variant.
+
+    :return: Wins, losses, draws and the total number of turns played.
+    :rtype: tuple
+    """
+    hero = create(hero_build)
+    monster = create(monster_build)
+    stream = rngs.RandomStream(seed)
+
+    outcomes = {simulation.HERO_WIN: 0, simulation.MONSTER_WIN: 0, simulation.DRAW: 0}
+    turns = 0
+    for _ in range(fights):
+        outcome, turns_taken = simulation.simulate_fight(hero, monster, stream)
+        outcomes[outcome] += 1
+        turns += turns_taken
+
+    return outcomes[simulation.HERO_WIN], outcomes[simulation.MONSTER_WIN], outcomes[simulation.DRAW], turns
+
+
+def work_units(heroes, monsters, fights, chunk_size, seed):
+    """
+    :return: (hero index, monster index, fights, seed) for every chunk of the tournament.
+    """
+    for hero_index in range(len(heroes)):
+        for monster_index in range(len(monsters)):
+            for chunk_index, start in enumerate(range(0, fights, chunk_size)):
+                yield (hero_index, monster_index, min(chunk_size, fights - start),
+                       shard_seed(seed, hero_index, monster_index, chunk_index))
+
+
+def run_tournament(heroes=HERO_BUILDS, monsters=MONSTER_VARIANTS, fights=10000, chunk_size=2000, seed=0,
+                   workers=None, progress=None):
+    """
+    :param list|optional heroes: The hero Builds to enter.
+    :param list|optional monsters: The monster Builds to enter.
+    :param int|optional fights: Number of fights per pairing.
+    :param int|optional chunk_size: Number of fights handed to a worker at a time.
+    :param int|optional seed: Seed for the whole tournament.
+    :param int|optional workers: Number of processes, one per core by default.
+    :param function|optional progress: Called as progress(done, total) each time a chunk finishes.
+    :return: {(hero index, monster index): PairingResult}
+    :rtype: dict
+    """
+    results = {(h, m): PairingResult() for h in range(len(heroes)) for m in range(len(monsters))}
+    units = list(work_units(heroes, monsters, fights, chunk_size, seed))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_chunk, heroes[h], monsters[m], count, chunk_seed): (h, m)
+                   for h, m, count, chunk_seed in units}
+
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]].add(*future.result())
+            if progress:
+                progress(done, len(units))
+
+    return results
+
+
+def write_win_matrix(path, heroes, monsters, results):
+    """
+    Write the hero win rate of every pairing as a CSV, one row per hero build and one column per monster.
+
+    :param str path: The file to write.
+    """
+    with open(path, 'w', newline='') as matrix_file:
+        writer = csv.writer(matrix_file)
+        writer.writerow(['hero'] + [monster.name for monster in monsters])
+        for h, hero in enumerate(heroes):
+            writer.writerow([hero.name] + ['{:.4f}'.format(results[(h, m)].win_rate) for m in range(len(monsters))])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fights', type=int, default=10000)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='win_matrix.csv')
+    arguments = parser.parse_args()
+
+    def report(done, total):
+        console.write(f'{done}/{total} chunks')
+        console.flush()
+
+    tournament = run_tournament(fights=arguments.fights, chunk_size=arguments.chunk_size, seed=arguments.seed,
+                                workers=arguments.workers, progress=report)
+    write_win_matrix(arguments.output, HERO_BUILDS, MONSTER_VARIANTS, tournament)
+
+    console.write('{:12s}'.format('') + ''.join('{:>12s}'.format(monster.name) for monster in MONSTER_VARIANTS))
+    for hero_index, hero_build in enumerate(HERO_BUILDS):
+        console.write('{:12s}'.format(hero_build.name) + ''.join(
+            '{:>12.2%}'.format(tournament[(hero_index, m)].win_rate) for m in range(len(MONSTER_VARIANTS))))
+    console.flush()
@@ -0,0 +1,489 @@
+"""
+An explorable tile world, generated as it's explored.
+
+The world is a grid of chunks, CHUNK_SIZE tiles a side, each tile a single byte. Chunks are generated from the
+world's seed the first time anything looks at them and stored in a memory mapped file, so only the chunks in
+use are ever in memory, however big the world is, and a world reopened later comes back as it was left. The
+chunks in use are kept in an LRU cache in front of the file, evicted ones are written back if they were changed.
+
+Monsters are spawned when a chunk is first visited and kept in a SpatialHash, a dict of grid cells, so finding
+the monsters near a position only looks at the few cells around it. A spawned monster is only a name and a seed
+until the player runs into it, at which point it's made into a character.Monster to fight.
+
+File layout, little endian:
+    header  MAGIC, version (H), width and height in chunks (II), chunk size (H), seed (Q)
+    flags   One byte per chunk, 1 once it's been generated
+    chunks  CHUNK_SIZE * CHUNK_SIZE tiles per chunk, row by row
+"""
+import argparse
+import mmap
+import os
+import struct
+from collections import OrderedDict, namedtuple
+
+import catalog
+import character
+import console
+import main
+import rng as rngs
+
+MAGIC = b'UMAP'
+VERSION = 1
+HEADER = struct.Struct('<4sHIIHQ')
+
+CHUNK_SIZE = 32
+CHUNK_BYTES = CHUNK_SIZE * CHUNK_SIZE
+
+# Tiles, and how each one is drawn.
+WATER = 0
+GRASS = 1
+FOREST = 2
+MOUNTAIN = 3
+TILE_SYMBOLS = {WATER: '~', GRASS: '.', FOREST: '^', MOUNTAIN: 'A'}
+WALKABLE = (False, True, True, False)
+
+# Terrain height, 0 - 255, mapped to the tile found at it.
+HEIGHT_TILES = bytes(WATER if height < 80 else GRASS if height < 160 else FOREST if height < 210 else MOUNTAIN
+                     for height in range(256))
+
+# Distance between the random heights terrain is smoothed between, for the broad shape and the detail.
+TERRAIN_SCALES = ((16, 0.75), (4, 0.25))
+
+# The most monsters spawned in a chunk, and how close the player has to get to one to be attacked.
+MAX_SPAWNS = 3
+ENCOUNTER_RADIUS = 2
+
+# Where spawned monsters are in the world. Keeps the cost of a query down to the few cells around it.
+SPATIAL_CELL_SIZE = 16
+
+# A monster waiting somewhere in the world, made into a character.Monster once the player meets it.
+Spawn = namedtuple('Spawn', ['name', 'seed'])
+
+MASK = 2 ** 64 - 1
+
+
+def hash_position(seed, x, y):
+    """
+    :return: A well mixed 64 bit number for a position, the same every time for the same seed.
+    :rtype: int
+    """
+    value = (seed * 0x9E3779B97F4A7C15 + x * 0xBF58476D1CE4E5B9 + y * 0x94D049BB133111EB) & MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK
+    return value ^ (value >> 31)
+
+
+def generate_chunk(seed, chunk_x, chunk_y):
+    """
+    Generate the tiles of a chunk. Heights are random at every point of a coarse lattice and smoothly
+    interpolated in between, the lattice being shared by neighbouring chunks so terrain carries on across them.
+
+    :return: The chunk's tiles, row by row.
+    :rtype: bytes
+    """
+    origin_x = chunk_x * CHUNK_SIZE
+    origin_y = chunk_y * CHUNK_SIZE
+    heights = [0.0] * CHUNK_BYTES
+
+    for octave, (scale, weight) in enumerate(TERRAIN_SCALES):
+        left = origin_x // scale
+        top = origin_y // scale
+        span = CHUNK_SIZE // scale + 2
+        lattice = [[hash_position(seed + octave, left + column, top + row) / MASK * weight for column in range(span)]
+                   for row in range(span)]
+
+        # Smoothstep weights of each offset between two lattice points.
+        steps = [(offset / scale) ** 2 * (3 - 2 * offset / scale) for offset in range(scale)]
+
+        index = 0
+        for y in range(CHUNK_SIZE):
+            row, offset_y = divmod(origin_y + y, scale)
+            above, below = lattice[row - top], lattice[row - top + 1]
+            step_y = steps[offset_y]
+            for x in range(CHUNK_SIZE):
+                column, offset_x = divmod(origin_x + x, scale)
+                column -= left
+                step_x = steps[offset_x]
+                upper = above[column] + (above[column + 1] - above[column]) * step_x
+                lower = below[column] + (below[column + 1] - below[column]) * step_x
+                heights[index] += upper + (lower - upper) * step_y
+                index += 1
+
+    return bytes(min(int(height * 256), 255) for height in heights).translate(HEIGHT_TILES)
+
+
+class SpatialHash(object):
+    """
+    Positions of things in the world, bucketed into square cells so the things near a point can be found by only
+    looking in the cells around it.
+    """
+
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        """
+        :param int|optional cell_size: Width of a cell in tiles, around the radius usually searched works best.
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def insert(self, key, x, y):
+        """
+        :param key: Anything hashable identifying the thing, eg: a spawn number.
+        :param int x: Position of the thing.
+        :param int y: Position of the thing.
+        """
+        self.positions[key] = (x, y)
+        self.cells.setdefault((x // self.cell_size, y // self.cell_size), set()).add(key)
+
+    def remove(self, key):
+        """
+        :param key: A previously inserted key.
+        """
+        x, y = self.positions.pop(key)
+        cell_key = (x // self.cell_size, y // self.cell_size)
+        cell = self.cells[cell_key]
+        cell.discard(key)
+        if not cell:
+            del self.cells[cell_key]
+
+    def move(self, key, x, y):
+        """
+        :param key: A previously inserted key.
+        :param int x: New position of the thing.
+        :param int y: New position of the thing.
+        """
+        old_x, old_y = self.positions[key]
+        if (old_x // self.cell_size, old_y // self.cell_size) == (x // self.cell_size, y // self.cell_size):
+            self.positions[key] = (x, y)
+        else:
+            self.remove(key)
+            self.insert(key, x, y)
+
+    def near(self, x, y, radius):
+        """
+        :param int x: Position to search around.
+        :param int y: Position to search around.
+        :param int radius: The furthest distance to include.
+        :return: [(distance squared, key)] of everything within radius, closest first.
+        :rtype: list
+        """
+        size = self.cell_size
+        found = []
+        for cell_y in range((y - radius) // size, (y + radius) // size + 1):
+            for cell_x in range((x - radius) // size, (x + radius) // size + 1):
+                for key in self.cells.get((cell_x, cell_y), ()):
+                    key_x, key_y = self.positions[key]
+                    distance = (key_x - x) ** 2 + (key_y - y) ** 2
+                    if distance <= radius * radius:
+                        found.append((distance, key))
+        found.sort()
+        return found
+
+
+class World(object):
+    """
+    A tile world stored in a memory mapped file, with the chunks in use cached in memory.
+    """
+
+    def __init__(self, path, width=256, height=256, seed=0, cache_size=256):
+        """
+        :param str path: The map file. An existing one is opened as is, its size and seed taking precedence over
+                         the ones given here.
+        :param int|optional width: Width of a new world in chunks.
+        :param int|optional height: Height of a new world in chunks.
+        :param int|optional seed: Seed a new world is generated from, any int. Worlds only depend on its lowest 64
+                                  bits, which are what's stored.
+        :param int|optional cache_size: The most chunks to keep in memory.
+        """
+        self.path = path
+        self.cache_size = cache_size
+
+        if not os.path.exists(path) or not os.path.getsize(path):
+            # Packed before the file is created, so a size that doesn't fit leaves no empty map behind.
+            header = HEADER.pack(MAGIC, VERSION, width, height, CHUNK_SIZE, seed & MASK)
+            with open(path, 'wb') as map_file:
+                map_file.write(header)
+                # Everything after the header is left as a hole in the file until it's generated.
+                map_file.truncate(HEADER.size + width * height * (1 + CHUNK_BYTES))
+
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+        magic, version, self.width, self.height, chunk_size, self.seed = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or chunk_size != CHUNK_SIZE:
+            self.close()
+            raise ValueError(f'{path} is not a version {VERSION} map with chunks of {CHUNK_SIZE}')
+
+        self._chunks_offset = HEADER.size + self.width * self.height
+        self._cache = OrderedDict()
+        self._dirty = set()
+
+        # Monsters spawned in the chunks visited so far, and where they are.
+        self.spawns = {}
+        self.monsters = SpatialHash()
+        self._populated = set()
+        self._next_spawn = 0
+
+        self.hits = self.misses = self.generated = self.evictions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def size(self):
+        """
+        :return: (width, height) of the world in tiles.
+        :rtype: tuple
+        """
+        return self.width * CHUNK_SIZE, self.height * CHUNK_SIZE
+
+    def _load(self, chunk_key):
+        chunk_x, chunk_y = chunk_key
+        flag = HEADER.size + chunk_y * self.width + chunk_x
+        offset = self._chunks_offset + (chunk_y * self.width + chunk_x) * CHUNK_BYTES
+
+        if not self._map[flag]:
+            self._map[offset:offset + CHUNK_BYTES] = generate_chunk(self.seed, chunk_x, chunk_y)
+            self._map[flag] = 1
+            self.generated += 1
+        return bytearray(self._map[offset:offset + CHUNK_BYTES])
+
+    def _store(self, chunk_key, tiles):
+        chunk_x, chunk_y = chunk_key
+        offset = self._chunks_offset + (chunk_y * self.width + chunk_x) * CHUNK_BYTES
+        self._map[offset:offset + CHUNK_BYTES] = tiles
+
+    def chunk(self, chunk_x, chunk_y):
+        """
+        :return: The tiles of a chunk row by row, generated if it's the first time it's been looked at.
+        :rtype: bytearray
+        """
+        chunk_key = (chunk_x, chunk_y)
+        tiles = self._cache.get(chunk_key)
+        if tiles is not None:
+            self.hits += 1
+            self._cache.move_to_end(chunk_key)
+            return tiles
+
+        if not (0 <= chunk_x < self.width and 0 <= chunk_y < self.height):
+            raise IndexError(f'Chunk {chunk_key} is outside of the world')
+
+        self.misses += 1
+        tiles = self._cache[chunk_key] = self._load(chunk_key)
+        if len(self._cache) > self.cache_size:
+            evicted_key, evicted = self._cache.popitem(last=False)
+            self.evictions += 1
+            if evicted_key in self._dirty:
+                self._dirty.discard(evicted_key)
+                self._store(evicted_key, evicted)
+        return tiles
+
+    def tile(self, x, y):
+        """
+        :return: The tile at a position, eg: GRASS.
+        :rtype: int
+        """
+        chunk_x, tile_x = divmod(x, CHUNK_SIZE)
+        chunk_y, tile_y = divmod(y, CHUNK_SIZE)
+        return self.chunk(chunk_x, chunk_y)[tile_y * CHUNK_SIZE + tile_x]
+
+    def set_tile(self, x, y, tile):
+        """
+        :param int tile: The tile to put at the position, eg: FOREST.
+        """
+        chunk_x, tile_x = divmod(x, CHUNK_SIZE)
+        chunk_y, tile_y = divmod(y, CHUNK_SIZE)
+        self.chunk(chunk_x, chunk_y)[tile_y * CHUNK_SIZE + tile_x] = tile
+        self._dirty.add((chunk_x, chunk_y))
+
+    def walkable(self, x, y):
+        """
+        :return: True if the position is in the world and can be walked on.
+        :rtype: bool
+        """
+        width, height = self.size
+        return 0 <= x < width and 0 <= y < height and WALKABLE[self.tile(x, y)]
+
+    def _populate(self, chunk_x, chunk_y):
+        # Spawns come from the chunk's own seed, so a chunk is populated the same way whenever it's first visited.
+        self._populated.add((chunk_x, chunk_y))
+        tiles = self.chunk(chunk_x, chunk_y)
+        spawn_rng = rngs.RandomStream(hash_position(self.seed, chunk_x, chunk_y))
+
+        for _ in range(spawn_rng.randint(0, MAX_SPAWNS)):
+            tile_index = spawn_rng.randrange(CHUNK_BYTES)
+            seed = int(spawn_rng.random() * 2 ** 53)
+            if WALKABLE[tiles[tile_index]]:
+                tile_y, tile_x = divmod(tile_index, CHUNK_SIZE)
+                self.add_monster(Spawn('Wolf', seed), chunk_x * CHUNK_SIZE + tile_x, chunk_y * CHUNK_SIZE + tile_y)
+
+    def add_monster(self, spawn, x, y):
+        """
+        :param Spawn spawn: The monster to put in the world.
+        :return: The key the monster is known by.
+        :rtype: int
+        """
+        key = self._next_spawn
+        self._next_spawn += 1
+        self.spawns[key] = spawn
+        self.monsters.insert(key, x, y)
+        return key
+
+    def remove_monster(self, key):
+        """
+        :param int key: Key of a monster in the world, eg: once it's been killed.
+        """
+        del self.spawns[key]
+        self.monsters.remove(key)
+
+    def monsters_near(self, x, y, radius):
+        """
+        :return: [(distance squared, key)] of the monsters within radius of the position, closest first. Chunks
+                 in range that haven't been visited yet are populated first.
+        :rtype: list
+        """
+        for chunk_y in range(max((y - radius) // CHUNK_SIZE, 0), min((y + radius) // CHUNK_SIZE + 1, self.height)):
+            for chunk_x in range(max((x - radius) // CHUNK_SIZE, 0), min((x + radius) // CHUNK_SIZE + 1, self.width)):
+                if (chunk_x, chunk_y) not in self._populated:
+                    self._populate(chunk_x, chunk_y)
+        return self.monsters.near(x, y, radius)
+
+    def encounter(self, x, y, radius=ENCOUNTER_RADIUS):
+        """
+        :return: (key, character.Monster) of the closest monster within radius of the position, None if there
+                 isn't one.
+        :rtype: tuple
+        """
+        found = self.monsters_near(x, y, radius)
+        if not found:
+            return None
+
+        key = found[0][1]
+        spawn = self.spawns[key]
+        return key, character.Monster(spawn.name, rngs.RandomStream(spawn.seed))
+
+    def view(self, x, y, radius=5):
+        """
+        :return: Lines of the map around a position, the position itself shown as @ and monsters as W.
+        :rtype: list
+        """
+        width, height = self.size
+        # The view is square, the query round, so it reaches out to the corners.
+        monsters = {self.monsters.positions[key] for _, key in self.monsters_near(x, y, radius * 3 // 2 + 1)}
+        lines = []
+        for view_y in range(y - radius, y + radius + 1):
+            line = []
+            for view_x in range(x - radius, x + radius + 1):
+                if (view_x, view_y) == (x, y):
+                    line.append('@')
+                elif (view_x, view_y) in monsters:
+                    line.append('W')
+                elif 0 <= view_x < width and 0 <= view_y < height:
+                    line.append(TILE_SYMBOLS[self.tile(view_x, view_y)])
+                else:
+                    line.append(' ')
+            lines.append(' '.join(line))
+        return lines
+
+    def flush(self):
+        """
+        Write every changed chunk back to the file.
+        """
+        for chunk_key in self._dirty:
+            self._store(chunk_key, self._cache[chunk_key])
+        self._dirty.clear()
+        self._map.flush()
+
+    def close(self):
+        """
+        Flush and close the map file.
+        """
+        if self._map.closed:
+            return
+        if hasattr(self, '_dirty'):
+            self.flush()
+        self._map.close()
+        self._file.close()
+
+
+def find_start(world, x, y):
+    """
+    :return: The closest walkable position to the one given, searching outwards in rings.
+    :rtype: tuple
+    """
+    width, height = world.size
+    for distance in range(max(width, height)):
+        for ring_y in range(y - distance, y + distance + 1):
+            for ring_x in range(x - distance, x + distance + 1):
+                if max(abs(ring_x - x), abs(ring_y - y)) == distance and world.walkable(ring_x, ring_y):
+                    return ring_x, ring_y
+    raise ValueError('There is nowhere to stand in this world')
+
+
+def explore_steps(world, player, x, y):
+    """
+    Walk the world, fighting every monster that comes within ENCOUNTER_RADIUS, until the player dies or goes back.
+
+    :param World world: The world to walk.
+    :param class player: The character walking it.
+    :param int x: Starting position, must be walkable.
+    :param int y: Starting position, must be walkable.
+    :return: The player's last position.
+    :rtype: tuple
+    """
+    moves = catalog.actions('movement')
+
+    while player.alive:
+        found = world.encounter(x, y)
+        if found:
+            key, monster = found
+            console.write(f'A {monster.name} appears!')
+            yield from main.combat_steps(player, monster)
+            if not monster.alive:
+                world.remove_monster(key)
+            continue
+
+        for line in world.view(x, y):
+            console.write(line)
+
+        move = yield console.Prompt('Choose a Direction', moves, back=True)
+        if move == 0:
+            break
+
+        step_x, step_y = x + moves[move]['dx'], y + moves[move]['dy']
+        if world.walkable(step_x, step_y):
+            x, y = step_x, step_y
+        else:
+            console.write(f'You can\'t go {moves[move]["type"].lower()}, the way is blocked.')
+
+    return x, y
+
+
+def explore(world, player, x, y, provider=None):
+    """
+    :param class|optional provider: Where the player's decisions come from, console.input_provider by default.
+    :return: The player's last position.
+    :rtype: tuple
+    """
+    return main.run(explore_steps(world, player, x, y), provider)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--map', default='world.map', help='The map file, created if it does not exist.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of a new map.')
+    parser.add_argument('--size', type=int, default=256, help='Width and height of a new map in chunks.')
+    arguments = parser.parse_args()
+
+    with World(arguments.map, arguments.size, arguments.size, arguments.seed) as game_world:
+        centre = game_world.size[0] // 2, game_world.size[1] // 2
+        explore(game_world, character.Character('Sheep'), *find_start(game_world, *centre))